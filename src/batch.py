@@ -0,0 +1,125 @@
+#!/usr/bin/python
+
+import os
+import sys
+import argparse
+import traceback
+import multiprocessing
+from StringIO import StringIO
+
+import showboxes
+from console import ConsoleRenderer
+
+# Runs in the worker processes; returns (path, output, error) so that a
+# failing file is reported without stopping the others.
+def process_file(task):
+    path, args = task
+    try:
+        if args.mode == 'tree':
+            root = showboxes.get_tree_from_file(path, args, strict=True)
+            out = StringIO()
+            renderer = ConsoleRenderer('  ', out=out)
+            renderer.disable_colors()
+            renderer.render(root)
+            output = out.getvalue()
+        else:
+            output = get_summary(path)
+        return path, output, None
+    except Exception:
+        return path, None, traceback.format_exc()
+
+# One line per file: the top level box types in order of appearance, with
+# the size of unique boxes and the count of repeated ones (moof, mdat...)
+def get_summary(path):
+    order = []
+    sizes = {}
+    counts = {}
+    with open(path, 'rb') as fd:
+        buf = showboxes.get_buffer(fd)
+        try:
+            for box in showboxes.iterboxes(buf, lazy=True):
+                if box.boxtype not in counts:
+                    order.append(box.boxtype)
+                    counts[box.boxtype] = 0
+                counts[box.boxtype] += 1
+                sizes[box.boxtype] = box.size
+        finally:
+            buf.close()
+    boxes = ["%s(%d)" %(boxtype, sizes[boxtype]) if counts[boxtype] == 1
+        else "%s x%d" %(boxtype, counts[boxtype]) for boxtype in order]
+    return "%s: %d bytes, %s\n" %(path, os.path.getsize(path), ' '.join(boxes))
+
+def read_list(fd):
+    return [line.strip() for line in fd if line.strip()]
+
+def get_paths(args):
+    names = list(args.paths)
+    if args.file_list == '-':
+        names.extend(read_list(sys.stdin))
+    elif args.file_list:
+        with open(args.file_list) as fd:
+            names.extend(read_list(fd))
+    for name in names:
+        if os.path.isdir(name):
+            for dirpath, dirnames, filenames in os.walk(name):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    yield os.path.join(dirpath, filename)
+        else:
+            yield name
+
+def run(args, out=sys.stdout):
+    tasks = ((path, args) for path in get_paths(args))
+    pool = multiprocessing.Pool(args.jobs)
+    failures = 0
+    try:
+        if args.ordered:
+            results = pool.imap(process_file, tasks, args.chunk_size)
+        else:
+            results = pool.imap_unordered(process_file, tasks, args.chunk_size)
+        for path, output, error in results:
+            if error is not None:
+                failures += 1
+                out.write("%s: ERROR\n%s" %(path, error))
+            else:
+                out.write(output)
+            out.flush()
+        pool.close()
+    except:
+        # join() needs the pool closed or terminated, or it would hide the
+        # error with its own
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='List the boxes of many iso-bmff files in parallel')
+    parser.add_argument('-m', '--mode', choices=['summary', 'tree'], default='summary',
+        help='print the top level boxes of each file or the full box tree')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(),
+        help='number of worker processes; defaults to the number of cpus')
+    parser.add_argument('-l', '--file-list', dest='file_list',
+        help='file with one path per line, - for stdin')
+    parser.add_argument('-u', '--unordered', action='store_false', dest='ordered',
+        help='print results as they complete instead of in input order')
+    parser.add_argument('--chunk-size', type=int, default=4, dest='chunk_size',
+        help='number of files handed to a worker at a time')
+    parser.add_argument('-e', '--expand-arrays', action='store_false',
+        help='do not truncate long arrays in tree mode', dest='truncate')
+    parser.add_argument('-s', '--structure-only', action='store_true', dest='structure_only',
+        help='list only box offsets and sizes in tree mode')
+    showboxes.add_cache_arguments(parser)
+    parser.add_argument('paths', nargs='*', metavar='path',
+        help='iso media file or a directory to scan recursively')
+    args = parser.parse_args()
+
+    failures = run(args)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+
+import os
+import sys
+import json
+import shutil
+import resource
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks import mp4gen
+
+# Peak resident memory of parsing a large fragmented file, where the parsed
+# boxes and the tree nodes dominate. Every measurement runs in a fresh
+# interpreter so that the peaks do not mask each other:
+#   boxes  the list of parsed boxes
+#   tree   the Tree built by showboxes, with the boxes it was built from
+
+def measure(path, stage):
+    import showboxes
+    from isobmff.box import Box
+    args = argparse.Namespace(structure_only=False, truncate=True)
+    if stage == 'boxes':
+        with open(path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            boxes = []
+            try:
+                while buf.hasmore():
+                    boxes.append(Box.getnextbox(buf))
+            finally:
+                buf.close()
+    else:
+        root = showboxes.get_tree_from_file(path, args, True)
+    # kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def peak_rss(path, stage):
+    output = subprocess.check_output([sys.executable, '-m', 'benchmarks.memory',
+        '--measure', stage, path])
+    return int(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Peak memory of parsing a large generated fragmented file')
+    parser.add_argument('--fragments', type=int, default=10000,
+        help='moof/mdat pairs in the file; 10000 by default')
+    parser.add_argument('--samples', type=int, default=30,
+        help='samples per fragment; 30 by default')
+    parser.add_argument('--save', metavar='FILE',
+        help='write the results as JSON')
+    parser.add_argument('--measure', choices=['boxes', 'tree'], help=argparse.SUPPRESS)
+    parser.add_argument('path', nargs='?', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print measure(args.path, args.measure)
+        return
+
+    directory = tempfile.mkdtemp(prefix='mp4bench')
+    results = {}
+    try:
+        path = os.path.join(directory, 'fragmented.mp4')
+        mp4gen.write_fragmented(path, args.fragments, args.samples)
+        for stage in ('boxes', 'tree'):
+            results[stage] = peak_rss(path, stage)
+            print "%-8s peak rss %8.1f MB" %(stage, results[stage] / 1024.0)
+    finally:
+        shutil.rmtree(directory)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'fragments': args.fragments, 'samples': args.samples,
+                'peak_rss_kb': results}, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
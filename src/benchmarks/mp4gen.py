@@ -0,0 +1,207 @@
+#!/usr/bin/python
+
+import sys
+import struct
+import argparse
+from array import array
+
+from datasource import ARRAY_TYPECODES
+
+# Synthetic ISO base media files of a chosen shape for the benchmarks: any
+# number of tracks with large sample tables (stsz, stco or co64, stts, stsc,
+# stss), an optional padded mdat, or a fragmented file with many moof/mdat
+# pairs. Sample data is all zeros and the mdat payload is written as a
+# sparse region, so multi gigabyte files are cheap to create.
+
+def box(boxtype, payload=''):
+    return struct.pack('>I', 8 + len(payload)) + boxtype + payload
+
+def fullbox(boxtype, version, flags, payload=''):
+    return box(boxtype, struct.pack('>I', (version << 24) | flags) + payload)
+
+# Big endian packing of many integers, much faster than struct for millions
+def pack_array(itemsize, values):
+    typecode = ARRAY_TYPECODES.get(itemsize)
+    if typecode is None:
+        return struct.pack('>%dQ' %(len(values)), *values)
+    data = array(typecode, values)
+    if sys.byteorder == 'little':
+        data.byteswap()
+    return data.tostring()
+
+def matrix():
+    return struct.pack('>9I', 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000)
+
+def sample_size(track_index, sample):
+    return 100 + 50 * track_index + sample % 7
+
+# With a scheme, the entry is protected: its type becomes encv or enca and a
+# sinf box holds the original type, the scheme and the default key id
+def sample_entry(handler, scheme=None):
+    if handler == 'vide':
+        entry = box('avc1', '\0' * 6 + struct.pack('>H', 1) + '\0' * 16 +
+            struct.pack('>HHIII', 640, 480, 0x480000, 0x480000, 0) + struct.pack('>H', 1) +
+            '\x04test' + '\0' * 27 + struct.pack('>Hh', 24, -1) +
+            box('avcC', '\x01\x64\x00\x1f\xff\xe0'))
+    else:
+        entry = box('mp4a', '\0' * 6 + struct.pack('>H', 1) + '\0' * 8 +
+            struct.pack('>HHHHI', 2, 16, 0, 0, 48000 << 16) + fullbox('esds', 0, 0, '\x03\x00'))
+    if not scheme:
+        return entry
+    tenc = fullbox('tenc', 0, 0, struct.pack('>BBBB', 0, 0, 1, 8) +
+        '1077efecc0b24d02ace33c1e52e2fb4b'.decode('hex'))
+    sinf = box('sinf', box('frma', entry[4:8]) +
+        fullbox('schm', 0, 0, scheme + struct.pack('>I', 0x10000)) + box('schi', tenc))
+    return box('encv' if handler == 'vide' else 'enca', entry[8:] + sinf)
+
+# stz2 table of 4, 8 or 16 bit sample sizes
+def compact_sizes(field_size, sizes):
+    sizes = [size % (1 << field_size) for size in sizes]
+    if field_size == 4:
+        padded = sizes + [0] * (len(sizes) % 2)
+        table = ''.join([chr(padded[i] << 4 | padded[i + 1]) for i in xrange(0, len(padded), 2)])
+    else:
+        table = pack_array(field_size // 8, sizes)
+    return fullbox('stz2', 0, 0, struct.pack('>II', field_size, len(sizes)) + table), sizes
+
+# A trak box whose chunks start at data_offset, and the size of its samples.
+# With stz2 set to a field size, sample sizes are written to a compact table
+# and wrapped to fit in it.
+def track(track_id, track_index, samples, per_chunk, data_offset, co64, stz2=0, scheme=None):
+    handler = 'vide' if track_index % 2 == 0 else 'soun'
+    sizes = [sample_size(track_index, i) for i in xrange(samples)]
+    if stz2:
+        stsz, sizes = compact_sizes(stz2, sizes)
+    else:
+        stsz = fullbox('stsz', 0, 0, struct.pack('>II', 0, samples) + pack_array(4, sizes))
+    chunk_count = (samples + per_chunk - 1) // per_chunk
+    offsets = []
+    offset = data_offset
+    for chunk in xrange(chunk_count):
+        offsets.append(offset)
+        offset += sum(sizes[chunk * per_chunk:(chunk + 1) * per_chunk])
+    sync = range(1, samples + 1, 50)
+
+    tkhd = fullbox('tkhd', 0, 7, struct.pack('>IIIII', 0, 0, track_id, 0, samples * 40) +
+        '\0' * 8 + struct.pack('>hhhh', 0, 0, 0, 0) + matrix() +
+        struct.pack('>II', 640 << 16, 480 << 16))
+    mdhd = fullbox('mdhd', 0, 0, struct.pack('>IIII', 0, 0, 25000, samples * 1000) +
+        struct.pack('>HH', 0x15c7, 0))
+    hdlr = fullbox('hdlr', 0, 0, '\0' * 4 + handler + '\0' * 12 + 'benchmark\0')
+    stsd = fullbox('stsd', 0, 0, struct.pack('>I', 1) + sample_entry(handler, scheme))
+    stts = fullbox('stts', 0, 0, struct.pack('>III', 1, samples, 1000))
+    stsc = fullbox('stsc', 0, 0, struct.pack('>IIII', 1, 1, per_chunk, 1))
+    if co64:
+        stco = fullbox('co64', 0, 0, struct.pack('>I', chunk_count) + pack_array(8, offsets))
+    else:
+        stco = fullbox('stco', 0, 0, struct.pack('>I', chunk_count) + pack_array(4, offsets))
+    stss = fullbox('stss', 0, 0, struct.pack('>I', len(sync)) + pack_array(4, sync))
+    dinf = box('dinf', fullbox('dref', 0, 0, struct.pack('>I', 1) + fullbox('url ', 0, 1)))
+    stbl = box('stbl', stsd + stts + stsc + stsz + stco + stss)
+    minf = box('minf', dinf + stbl)
+    trak = box('trak', tkhd + box('mdia', mdhd + hdlr + minf))
+    return trak, offset - data_offset
+
+def write_mdat(f, size):
+    if size + 8 > 0xFFFFFFFF:
+        f.write(struct.pack('>I4sQ', 1, 'mdat', size + 16))
+    else:
+        f.write(struct.pack('>I4s', size + 8, 'mdat'))
+    if size:
+        f.seek(size - 1, 1)
+        f.write('\0')
+
+# A progressive file: ftyp, moov with the tracks, then one mdat holding the
+# samples of all tracks followed by padding bytes
+def write_movie(path, tracks=2, samples=1000, per_chunk=10, co64=False, padding=0, stz2=0,
+        scheme=None):
+    ftyp = box('ftyp', 'isom' + struct.pack('>I', 512) + 'isomiso2avc1mp41')
+    mvhd = fullbox('mvhd', 0, 0, struct.pack('>IIII', 0, 0, 1000, samples * 40) +
+        struct.pack('>IH', 0x10000, 0x100) + '\0' * 10 + matrix() + '\0' * 24 +
+        struct.pack('>I', tracks + 1))
+    pssh = box('pssh', struct.pack('>I', 0) + '1077efecc0b24d02ace33c1e52e2fb4b'.decode('hex') +
+        struct.pack('>I', 4) + 'abcd')
+    # The moov size does not depend on the offsets, so lay it out once to
+    # find where the samples start
+    data_size = 0
+    moov_size = 8 + len(mvhd) + len(pssh)
+    for i in range(tracks):
+        trak, size = track(i + 1, i, samples, per_chunk, 0, co64, stz2, scheme)
+        moov_size += len(trak)
+        data_size += size
+    mdat_header = 16 if data_size + padding + 8 > 0xFFFFFFFF else 8
+    data_offset = len(ftyp) + moov_size + mdat_header
+    traks = []
+    for i in range(tracks):
+        trak, size = track(i + 1, i, samples, per_chunk, data_offset, co64, stz2, scheme)
+        traks.append(trak)
+        data_offset += size
+    with open(path, 'wb') as f:
+        f.write(ftyp)
+        f.write(box('moov', mvhd + ''.join(traks) + pssh))
+        write_mdat(f, data_size + padding)
+
+def fragment(sequence, track_id, samples, base_time):
+    mfhd = fullbox('mfhd', 0, 0, struct.pack('>I', sequence))
+    # default-base-is-moof, default sample flags
+    tfhd = fullbox('tfhd', 0, 0x020000 | 0x20, struct.pack('>II', track_id, 0x01010000))
+    tfdt = fullbox('tfdt', 1, 0, struct.pack('>Q', base_time))
+    records = ''.join([struct.pack('>IIIi', 1000, sample_size(0, i), 0, -i)
+        for i in xrange(samples)])
+    trun_size = 8 + 4 + 12 + len(records)
+    moof_size = 8 + len(mfhd) + 8 + len(tfhd) + len(tfdt) + trun_size
+    # duration, size, flags and composition offset per sample, data offset
+    # and first sample flags
+    trun = fullbox('trun', 1, 0x1 | 0x4 | 0x100 | 0x200 | 0x400 | 0x800,
+        struct.pack('>IiI', samples, moof_size + 8, 0x02000000) + records)
+    moof = box('moof', mfhd + box('traf', tfhd + tfdt + trun))
+    data_size = sum([sample_size(0, i) for i in xrange(samples)])
+    return moof, data_size
+
+# A fragmented file: ftyp, moov with an empty track and mvex, then fragments
+# moof/mdat pairs
+def write_fragmented(path, fragments=1000, samples=30):
+    ftyp = box('ftyp', 'iso6' + struct.pack('>I', 0) + 'iso6cmfc')
+    mvhd = fullbox('mvhd', 0, 0, struct.pack('>IIII', 0, 0, 1000, 0) +
+        struct.pack('>IH', 0x10000, 0x100) + '\0' * 10 + matrix() + '\0' * 24 +
+        struct.pack('>I', 2))
+    trak, _ = track(1, 0, 0, 1, 0, False)
+    mvex = box('mvex', fullbox('trex', 0, 0, struct.pack('>IIIII', 1, 1, 0, 0, 0)))
+    with open(path, 'wb') as f:
+        f.write(ftyp + box('moov', mvhd + trak + mvex))
+        for i in range(fragments):
+            moof, data_size = fragment(i + 1, 1, samples, i * samples * 1000)
+            f.write(moof)
+            write_mdat(f, data_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic iso-bmff file for benchmarking')
+    parser.add_argument('-t', '--tracks', type=int, default=2,
+        help='number of tracks; 2 by default')
+    parser.add_argument('-n', '--samples', type=int, default=1000,
+        help='samples per track, or per fragment with --fragments; 1000 by default')
+    parser.add_argument('--per-chunk', type=int, default=10, dest='per_chunk',
+        help='samples per chunk; 10 by default')
+    parser.add_argument('--co64', action='store_true',
+        help='write 64-bit chunk offsets')
+    parser.add_argument('--stz2', type=int, choices=[4, 8, 16], default=0,
+        help='write compact sample sizes with this many bits per entry')
+    parser.add_argument('--padding', type=int, default=0,
+        help='extra mdat bytes after the samples, to make a large file')
+    parser.add_argument('--scheme', choices=['cenc', 'cbcs'],
+        help='write protected sample entries with this scheme')
+    parser.add_argument('--fragments', type=int, default=0,
+        help='write a fragmented file with this many moof/mdat pairs')
+    parser.add_argument('output_file', help='path of the file to write')
+    args = parser.parse_args()
+    if args.fragments:
+        write_fragmented(args.output_file, args.fragments, args.samples)
+    else:
+        write_movie(args.output_file, args.tracks, args.samples, args.per_chunk,
+            args.co64, args.padding, args.stz2, args.scheme)
+
+
+if __name__ == "__main__":
+    main()
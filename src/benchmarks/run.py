@@ -0,0 +1,202 @@
+#!/usr/bin/python
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+
+from datasource import DataBuffer, MappedDataBuffer
+from isobmff.box import Box
+from console import ConsoleRenderer
+import showboxes
+from benchmarks import mp4gen
+
+# Times the hot paths on generated files, each on its own so that a change in
+# one layer shows up by itself:
+#   datasource.*  DataBuffer and MappedDataBuffer primitives
+#   getnextbox    parsing the whole box tree with Box.getnextbox
+#   tree          building the Tree in showboxes, parsing included
+#   render        console rendering of an already built Tree
+# Every benchmark runs a few times and the fastest run is kept. Results can be
+# saved as a JSON baseline and later runs compared against it.
+
+# File shapes; counts are multiplied by --scale
+PROFILES = [
+    ('movie', dict(tracks=2, samples=200000)),
+    ('tracks', dict(tracks=16, samples=20000)),
+    ('stz2', dict(tracks=2, samples=200000, stz2=4)),
+    ('co64', dict(tracks=2, samples=200000, co64=True, padding=5 * 1024 ** 3)),
+    ('fragmented', dict(fragments=2000, samples=30)),
+]
+
+# Reads per primitive benchmark, fewer on files too small for them
+PRIMITIVE_COUNT = 100000
+
+class NullOutput(object):
+    def write(self, data):
+        pass
+
+    def flush(self):
+        pass
+
+def make_file(directory, name, shape, scale):
+    path = os.path.join(directory, name + '.mp4')
+    shape = dict(shape)
+    if 'fragments' in shape:
+        mp4gen.write_fragmented(path, int(shape['fragments'] * scale), shape['samples'])
+    else:
+        shape['samples'] = int(shape['samples'] * scale)
+        mp4gen.write_movie(path, **shape)
+    return path
+
+def best_time(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+def primitive_benchmarks(path):
+    # Each read takes at most 16 bytes, and readarray 4096
+    size = os.path.getsize(path)
+    count = min(PRIMITIVE_COUNT, size // 16)
+    array_count = min(PRIMITIVE_COUNT // 100, size // 4096)
+
+    def read_all(buffer_class, read, count=count):
+        def run():
+            with open(path, 'rb') as fd:
+                buf = buffer_class(fd)
+                try:
+                    for i in xrange(count):
+                        read(buf)
+                finally:
+                    buf.close()
+        return run
+
+    benchmarks = []
+    for buffer_class in (DataBuffer, MappedDataBuffer):
+        name = 'datasource.%s.' %(buffer_class.__name__)
+        benchmarks += [
+            (name + 'readbyte', read_all(buffer_class, lambda buf: buf.readbyte())),
+            (name + 'readint16', read_all(buffer_class, lambda buf: buf.readint16())),
+            (name + 'readint32', read_all(buffer_class, lambda buf: buf.readint32())),
+            (name + 'readint64', read_all(buffer_class, lambda buf: buf.readint64())),
+            (name + 'peekint', read_all(buffer_class, lambda buf: buf.peekint(4))),
+            (name + 'readstr', read_all(buffer_class, lambda buf: buf.readstr(4))),
+            (name + 'readbits', read_all(buffer_class, lambda buf: buf.readbits(3))),
+            (name + 'skipbytes', read_all(buffer_class, lambda buf: buf.skipbytes(16))),
+            (name + 'readarray', read_all(buffer_class, lambda buf: buf.readarray(4, 1024),
+                array_count)),
+        ]
+    return benchmarks
+
+def parse_boxes(path, lazy=False):
+    with open(path, 'rb') as fd:
+        buf = showboxes.get_buffer(fd)
+        boxes = []
+        try:
+            while buf.hasmore():
+                boxes.append(Box.getnextbox(buf, None, lazy))
+        finally:
+            buf.close()
+        return boxes
+
+def file_benchmarks(path):
+    args = argparse.Namespace(structure_only=False, truncate=True)
+    tree = showboxes.get_tree_from_file(path, args, True)
+    renderer = ConsoleRenderer('  ', out=NullOutput())
+    renderer.disable_colors()
+    return [
+        ('getnextbox', lambda: parse_boxes(path)),
+        ('getnextbox.lazy', lambda: parse_boxes(path, True)),
+        ('tree', lambda: showboxes.get_tree_from_file(path, args, True)),
+        ('render', lambda: renderer.render(tree)),
+    ]
+
+def run(args):
+    directory = args.directory or tempfile.mkdtemp(prefix='mp4bench')
+    results = {}
+    try:
+        for name, shape in PROFILES:
+            if args.profile and name not in args.profile:
+                continue
+            path = make_file(directory, name, shape, args.scale)
+            benchmarks = file_benchmarks(path)
+            if name == 'movie':
+                benchmarks = primitive_benchmarks(path) + benchmarks
+            for benchmark, function in benchmarks:
+                key = '%s/%s' %(name, benchmark)
+                results[key] = best_time(function, args.repeat)
+                print "%-45s %10.4fs" %(key, results[key])
+                sys.stdout.flush()
+    finally:
+        if not args.directory:
+            shutil.rmtree(directory)
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'results': results,
+    }
+
+# Print the change of every result that is in both runs and return the
+# names that got slower by more than threshold (a fraction)
+def compare(baseline, current, threshold):
+    if baseline['scale'] != current['scale']:
+        raise Exception("Baseline was run with --scale %s, not %s" %(
+            baseline['scale'], current['scale']))
+    regressions = []
+    print
+    print "%-45s %10s %10s %8s" %('benchmark', 'baseline', 'current', 'change')
+    for key in sorted(current['results']):
+        if key not in baseline['results']:
+            continue
+        before = baseline['results'][key]
+        after = current['results'][key]
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = ' REGRESSION'
+            regressions.append(key)
+        print "%-45s %9.4fs %9.4fs %+7.1f%%%s" %(key, before, after, change * 100, flag)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Time parsing and rendering on generated iso-bmff files')
+    parser.add_argument('-p', '--profile', action='append',
+        choices=[name for name, shape in PROFILES],
+        help='run only this file shape; may be repeated')
+    parser.add_argument('--scale', type=float, default=1.0,
+        help='multiply sample and fragment counts; 1 by default')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+        help='runs per benchmark, the fastest is kept; 3 by default')
+    parser.add_argument('-d', '--directory',
+        help='keep the generated files in this directory')
+    parser.add_argument('--save', metavar='FILE',
+        help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE',
+        help='compare with a saved baseline; exit with status 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=25,
+        help='slowdown in percent reported as a regression; 25 by default')
+    args = parser.parse_args()
+
+    current = run(args)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if compare(baseline, current, args.threshold / 100.0):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
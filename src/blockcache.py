@@ -0,0 +1,159 @@
+
+import os
+import threading
+from collections import OrderedDict
+
+# Memory bounded LRU cache of fixed size, aligned blocks of data. Blocks
+# are keyed by a source key and block number, so one cache can be shared by
+# all the sources (and parses) of a process.
+class BlockCache(object):
+    BLOCK_SIZE = 64 * 1024
+    MAX_SIZE = 64 * 1024 * 1024
+
+    def __init__(self, block_size=BLOCK_SIZE, max_size=MAX_SIZE):
+        self.block_size = block_size
+        self.max_size = max_size
+        self.blocks = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, number):
+        with self.lock:
+            data = self.blocks.pop((key, number), None)
+            if data is None:
+                self.misses += 1
+                return None
+            self.blocks[(key, number)] = data
+            self.hits += 1
+            return data
+
+    def put(self, key, number, data):
+        with self.lock:
+            old = self.blocks.pop((key, number), None)
+            if old is not None:
+                self.size -= len(old)
+            self.blocks[(key, number)] = data
+            self.size += len(data)
+            while self.size > self.max_size and self.blocks:
+                evicted = self.blocks.popitem(last=False)[1]
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def __str__(self):
+        return "<block cache %d blocks, %d bytes, %d hits, %d misses, %d evictions>" %(
+            len(self.blocks), self.size, self.hits, self.misses, self.evictions)
+
+
+shared_cache = None
+
+# Process wide cache used when no cache is given to CachedFile
+def get_shared_cache():
+    global shared_cache
+    if shared_cache is None:
+        shared_cache = BlockCache()
+    return shared_cache
+
+
+# File object that reads through a BlockCache. The source can be a local
+# file, an HttpRangeFile or a pipe; a non-seekable source is read strictly
+# forward, discarding blocks that are skipped over, and only blocks that are
+# still cached can be revisited.
+class CachedFile(object):
+    def __init__(self, source, cache=None, key=None):
+        self.source = source
+        self.cache = get_shared_cache() if cache is None else cache
+        self.name = getattr(source, 'name', '<source>')
+        self.key = key if key is not None else CachedFile.source_key(source)
+        self.position = 0
+        try:
+            self.source_position = source.tell()
+            self.seekable = True
+        except (IOError, AttributeError):
+            self.source_position = 0
+            self.seekable = False
+        self.closed = False
+
+    # Local files are identified by path, size and mtime so that blocks are
+    # shared between parses of an unchanged file; anything else by identity.
+    @staticmethod
+    def source_key(source):
+        name = getattr(source, 'name', None)
+        if isinstance(name, basestring) and os.path.isfile(name):
+            st = os.stat(name)
+            return (os.path.abspath(name), st.st_size, st.st_mtime)
+        if isinstance(name, basestring) and name.startswith(('http://', 'https://')):
+            return name
+        return id(source)
+
+    def readblock(self, number):
+        data = self.cache.get(self.key, number)
+        if data is not None:
+            return data
+        block_size = self.cache.block_size
+        offset = number * block_size
+        if self.seekable:
+            if self.source_position != offset:
+                self.source.seek(offset, os.SEEK_SET)
+        elif offset < self.source_position:
+            raise IOError("Cannot seek back to %d in non-seekable %s" %(offset, self.name))
+        else:
+            while self.source_position < offset:
+                skipped = self.source.read(min(block_size, offset - self.source_position))
+                if not skipped:
+                    return ''
+                self.source_position += len(skipped)
+        # Sources such as pipes may return less than asked before their end
+        parts = []
+        remaining = block_size
+        while remaining:
+            part = self.source.read(remaining)
+            if not part:
+                break
+            parts.append(part)
+            remaining -= len(part)
+        data = ''.join(parts)
+        self.source_position = offset + len(data)
+        self.cache.put(self.key, number, data)
+        return data
+
+    def read(self, size=-1):
+        block_size = self.cache.block_size
+        result = []
+        while size != 0:
+            number, index = divmod(self.position, block_size)
+            block = self.readblock(number)
+            # Slice only what is wanted; small reads are the common case
+            data = block[index:] if size < 0 else block[index:index + size]
+            if size > 0:
+                size -= len(data)
+            if not data:
+                break
+            result.append(data)
+            self.position += len(data)
+        return ''.join(result)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            self.source.seek(offset, os.SEEK_END)
+            self.source_position = offset = self.source.tell()
+        if offset < 0:
+            raise IOError("Negative seek position %d" %(offset))
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        self.source.close()
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,9 +1,6 @@
 
 import sys
-from tree import Tree, Attr
-
-def write(s):
-    sys.stdout.write(s)
+from tree import Tree, Attr, ArrayView
 
 class ConsoleRenderer(object):
     VERT = '!'
@@ -12,12 +9,14 @@ class ConsoleRenderer(object):
     COLOR_ATTR = '\033[36m'
     ENDCOL = '\033[0m'
 
-    def __init__(self, offset=None, indent_unit='    ', have_children=False):
+    def __init__(self, offset=None, indent_unit='    ', have_children=False, out=None):
+        self.out = sys.stdout if out is None else out
         self.offset = '' if offset is None else offset
         self.indent_unit = indent_unit
         self.header_prefix = '`' + indent_unit.replace(' ', ConsoleRenderer.HORI)[1:]
 
     def show_node(self, node, prefix):
+        write = self.out.write
         write("%s%s%s%s%s\n" %(prefix, self.header_prefix, ConsoleRenderer.COLOR_HEADER,
             node.name, ConsoleRenderer.ENDCOL))
         if len(node.children):
@@ -25,17 +24,31 @@ class ConsoleRenderer(object):
         else:
             data_prefix = prefix + self.indent_unit + self.indent_unit
         for attr in node.attrs:
-            write("%s%s%s%s: %s\n" %(data_prefix, ConsoleRenderer.COLOR_ATTR, attr.name,
-                ConsoleRenderer.ENDCOL, attr.value))
+            self.write_attr(write, data_prefix, attr.name, attr.value)
         child_indent = prefix + self.indent_unit[:-1] + ConsoleRenderer.VERT
         for i in range(len(node.children)):
             if i + 1 == len(node.children):
                 child_indent = prefix + self.indent_unit
             self.show_node(node.children[i], child_indent)
 
+    # Long arrays are written piece by piece rather than as one string
+    def write_attr(self, write, prefix, name, value):
+        if isinstance(value, ArrayView):
+            write("%s%s%s%s: " %(prefix, ConsoleRenderer.COLOR_ATTR, name, ConsoleRenderer.ENDCOL))
+            for piece in value.pieces():
+                write(piece)
+            write("\n")
+        else:
+            write("%s%s%s%s: %s\n" %(prefix, ConsoleRenderer.COLOR_ATTR, name,
+                ConsoleRenderer.ENDCOL, value))
+
     def render(self, tree):
         self.show_node(tree, self.offset)
 
+    # Render a node as a child of the root, which may get more children later
+    def render_child(self, node):
+        self.show_node(node, self.offset + self.indent_unit[:-1] + ConsoleRenderer.VERT)
+
     def updatecolors():
         if not sys.stdout.isatty():
             ConsoleRenderer.disable_colors()
@@ -45,3 +58,74 @@ class ConsoleRenderer(object):
             ConsoleRenderer.COLOR_ATTR = ''
             ConsoleRenderer.ENDCOL = ''
 
+
+
+# Renders nodes as they are reported instead of walking a finished Tree:
+# begin() with the root name, then start_node(), add_attr() and end_node()
+# for every node in depth first order, and finish() at the end. Whether a
+# node is the last child of its parent has to be known when it starts; its
+# attributes are held back until its first child or its end shows whether it
+# has children. Output is collected and written in large blocks, and at the
+# end of every top level node so that output starts right away.
+class StreamingConsoleRenderer(ConsoleRenderer):
+    WRITE_SIZE = 64 * 1024
+
+    def __init__(self, offset=None, indent_unit='    ', out=None):
+        super(StreamingConsoleRenderer, self).__init__(offset, indent_unit, out=out)
+        self.lines = []
+        self.size = 0
+        # Open nodes as [prefix, name, attrs]; attrs is None once written
+        self.stack = []
+
+    def write(self, line):
+        self.lines.append(line)
+        self.size += len(line)
+        if self.size >= StreamingConsoleRenderer.WRITE_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.out.write(''.join(self.lines))
+        self.out.flush()
+        self.lines = []
+        self.size = 0
+
+    def write_node(self, node, has_children):
+        prefix, name, attrs = node
+        if attrs is None:
+            return
+        self.write("%s%s%s%s%s\n" %(prefix, self.header_prefix, ConsoleRenderer.COLOR_HEADER,
+            name, ConsoleRenderer.ENDCOL))
+        if has_children:
+            data_prefix = prefix + self.indent_unit[:-1] + ConsoleRenderer.VERT + self.indent_unit
+        else:
+            data_prefix = prefix + self.indent_unit + self.indent_unit
+        for name, value in attrs:
+            self.write_attr(self.write, data_prefix, name, value)
+        node[2] = None
+
+    def begin(self, name):
+        root = [self.offset, name, []]
+        self.write_node(root, True)
+        self.stack = [root]
+
+    def start_node(self, name, is_last):
+        parent = self.stack[-1]
+        self.write_node(parent, True)
+        if is_last:
+            prefix = parent[0] + self.indent_unit
+        else:
+            prefix = parent[0] + self.indent_unit[:-1] + ConsoleRenderer.VERT
+        self.stack.append([prefix, name, []])
+
+    def add_attr(self, name, value):
+        self.stack[-1][2].append((name, value))
+
+    def end_node(self):
+        self.write_node(self.stack.pop(), False)
+        if len(self.stack) == 1:
+            self.flush()
+
+    def finish(self):
+        while self.stack:
+            self.write_node(self.stack.pop(), False)
+        self.flush()
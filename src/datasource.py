@@ -1,8 +1,25 @@
 
 import os
+import sys
+import mmap
+import struct
+from array import array
+
+# Unsigned array typecode for each item size; sizes without a native typecode
+# (8 bytes on platforms with a 32 bit long) fall back to lists.
+ARRAY_TYPECODES = {}
+for typecode in 'LIHB':
+    ARRAY_TYPECODES[array(typecode).itemsize] = typecode
+STRUCT_FORMATS = {1: 'B', 2: 'H', 4: 'I', 8: 'Q'}
 
 class DataBuffer:
     CHUNK_SIZE = 50
+    # Skipped data of non-seekable sources is read and discarded in chunks
+    # of this size
+    SKIP_CHUNK_SIZE = 1024 * 1024
+    # ParseStats counting reads, skips and seeks, see parsestats.py
+    stats = None
+    closed = False
     def __init__(self, stream):
         self.bit_position = 0
         self.stream_offset = 0
@@ -10,6 +27,11 @@ class DataBuffer:
         self.read_ptr = 0
         self.data = ''
         self.source = stream
+        try:
+            stream.tell()
+            self.seekable = True
+        except (IOError, AttributeError):
+            self.seekable = False
         self.readmore()
 
     def __str__(self):
@@ -19,6 +41,8 @@ class DataBuffer:
     def readmore(self, minimum = 0):
         req_bytes = max(minimum, DataBuffer.CHUNK_SIZE)
         data = self.source.read(req_bytes)
+        if self.stats is not None:
+            self.stats.count_read(self.stream_offset + self.buf_size, len(data))
         remaining_bytes = self.buf_size - self.read_ptr
         if len(data):
             # print "Read %d" %(len(data))
@@ -139,19 +163,223 @@ class DataBuffer:
     def readint64(self):
         return self.readint(8)
 
+    def tell(self):
+        return self.stream_offset + self.read_ptr
+
+    # Move to an absolute offset; the source must be seekable unless the
+    # offset is within the buffered data or ahead of it.
+    def seek(self, offset):
+        if self.bit_position:
+            raise Exception("Not aligned: %d" %self.bit_position)
+        if self.stream_offset <= offset <= self.stream_offset + self.buf_size:
+            self.read_ptr = offset - self.stream_offset
+        elif not self.seekable and offset > self.tell():
+            self.skipbytes(offset - self.tell())
+        else:
+            if self.stats is not None:
+                self.stats.count_seek(offset)
+            self.source.seek(offset, os.SEEK_SET)
+            self.data = ''
+            self.stream_offset = offset
+            self.buf_size = 0
+            self.read_ptr = 0
+
+    def discard(self, count):
+        while count > 0:
+            data = self.source.read(min(count, DataBuffer.SKIP_CHUNK_SIZE))
+            if not data:
+                break
+            count -= len(data)
+
+    # Read count big endian unsigned integers of itemsize bytes in one go.
+    def readarray(self, itemsize, count):
+        data = self.readstr(itemsize * count)
+        typecode = ARRAY_TYPECODES.get(itemsize)
+        if typecode is None:
+            return list(struct.unpack('>%d%s' %(count, STRUCT_FORMATS[itemsize]), data))
+        values = array(typecode)
+        values.fromstring(data)
+        if sys.byteorder == 'little' and itemsize > 1:
+            values.byteswap()
+        return values
+
     def skipbytes(self, count):
         if self.bit_position:
             raise Exception("Not aligned: %d" %self.bit_position)
         if count < 0:
             raise Exception("Negative bytes to skip %d" %(count))
+        if self.stats is not None:
+            self.stats.count_skip(self.tell(), count)
         remaining_bytes = self.buf_size - self.read_ptr
         if count < remaining_bytes:
             self.read_ptr += count
         else:
             # TODO: would this seek beyond?
-            self.source.seek(count - remaining_bytes, os.SEEK_CUR)
+            if self.seekable:
+                if self.stats is not None:
+                    self.stats.count_seek(self.tell())
+                self.source.seek(count - remaining_bytes, os.SEEK_CUR)
+            else:
+                self.discard(count - remaining_bytes)
             self.data = ''
             self.stream_offset += self.read_ptr + count
             self.buf_size = 0
             self.read_ptr = 0
 
+    # The source is closed by whoever opened it; a closed buffer only tells
+    # lazy boxes that their payload can no longer be read.
+    def close(self):
+        self.closed = True
+
+    def isclosed(self):
+        return self.closed or getattr(self.source, 'closed', False)
+
+    def setstats(self, stats):
+        self.stats = stats
+
+
+# Reader of one big endian unsigned integer of a mapped buffer, with the
+# Struct bound once
+def mapped_reader(fmt):
+    unpack_from = struct.Struct(fmt).unpack_from
+    size = struct.calcsize(fmt)
+    def read(self):
+        ptr = self.read_ptr
+        if self.bit_position or ptr + size > self.buf_size:
+            self.checkread(size)
+        self.read_ptr = ptr + size
+        return unpack_from(self.data, ptr)[0]
+    return read
+
+# Stats wrappers of the read methods of a mapped buffer: reads are counted by
+# how far they moved the read pointer, peeks by the size asked for
+def counted_read(buf, method):
+    def read(*args):
+        position = buf.read_ptr
+        value = method(*args)
+        buf.stats.count_read(position, buf.read_ptr - position)
+        return value
+    return read
+
+def counted_peek(buf, method):
+    def peek(length, *args):
+        buf.stats.count_read(buf.read_ptr, length)
+        return method(length, *args)
+    return peek
+
+
+# DataBuffer over a memory mapped file. The whole file is addressable, so
+# read_ptr is simply the offset into the mapping and nothing is copied into an
+# intermediate buffer; skipping only moves the offset. The read methods are
+# plain bounds checks; with stats installed they are wrapped per instance to
+# count every access of the mapping as a read, as there are no reads of the
+# source.
+class MappedDataBuffer(DataBuffer):
+    COUNTED_READS = ('readbyte', 'readint16', 'readint32', 'readint64', 'readint', 'readstr')
+    COUNTED_PEEKS = ('peekint', 'peekstr', 'checkbuffer')
+    seekable = True
+
+    def __init__(self, stream):
+        self.bit_position = 0
+        self.read_ptr = 0
+        self.source = stream
+        self.data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf_size = len(self.data)
+
+    def __str__(self):
+        return "<mapped datasource size %d, readptr %d>" %(self.buf_size, self.read_ptr)
+
+    def setstats(self, stats):
+        self.stats = stats
+        for name in MappedDataBuffer.COUNTED_READS + MappedDataBuffer.COUNTED_PEEKS:
+            self.__dict__.pop(name, None)
+            if stats is None:
+                continue
+            method = getattr(self, name)
+            if name in MappedDataBuffer.COUNTED_READS:
+                setattr(self, name, counted_read(self, method))
+            else:
+                setattr(self, name, counted_peek(self, method))
+
+    def readmore(self, minimum = 0):
+        raise Exception("Read nothing: req %d, read_ptr %d", minimum, self.read_ptr)
+
+    def hasmore(self):
+        return self.read_ptr < self.buf_size
+
+    def checkbuffer(self, length):
+        if length < 0 or self.buf_size - self.read_ptr < length:
+            self.checkread(length)
+
+    # Raise the error of a read of length bytes that failed the bounds check
+    def checkread(self, length):
+        if self.bit_position:
+            raise Exception("Not aligned: %d" %self.bit_position)
+        if length < 0:
+            raise Exception("Negative bytes to check %d" %(length))
+        if self.buf_size - self.read_ptr < length:
+            self.readmore(length - self.buf_size + self.read_ptr)
+
+    def tell(self):
+        return self.read_ptr
+
+    readbyte = mapped_reader('>B')
+    readint16 = mapped_reader('>H')
+    readint32 = mapped_reader('>I')
+    readint64 = mapped_reader('>Q')
+    READERS = {1: readbyte, 2: readint16, 4: readint32, 8: readint64}
+    PEEK_FORMATS = {1: struct.Struct('>B').unpack_from, 2: struct.Struct('>H').unpack_from,
+        4: struct.Struct('>I').unpack_from, 8: struct.Struct('>Q').unpack_from}
+
+    def readint(self, bytecount):
+        reader = MappedDataBuffer.READERS.get(bytecount)
+        if reader is None:
+            return DataBuffer.readint(self, bytecount)
+        return reader(self)
+
+    def peekint(self, bytecount):
+        unpack_from = MappedDataBuffer.PEEK_FORMATS.get(bytecount)
+        if unpack_from is None:
+            return DataBuffer.peekint(self, bytecount)
+        ptr = self.read_ptr
+        if self.bit_position or ptr + bytecount > self.buf_size:
+            self.checkread(bytecount)
+        return unpack_from(self.data, ptr)[0]
+
+    def readstr(self, length):
+        ptr = self.read_ptr
+        end = ptr + length
+        if self.bit_position or length < 0 or end > self.buf_size:
+            self.checkread(length)
+        self.read_ptr = end
+        return self.data[ptr:end]
+
+    def peekstr(self, length, offset = 0):
+        start = self.read_ptr + offset
+        if self.bit_position or length < 0 or start + length > self.buf_size:
+            self.checkread(length + offset)
+        return self.data[start:start + length]
+
+    def skipbytes(self, count):
+        if self.bit_position:
+            raise Exception("Not aligned: %d" %self.bit_position)
+        if count < 0:
+            raise Exception("Negative bytes to skip %d" %(count))
+        if self.stats is not None:
+            self.stats.count_skip(self.read_ptr, count)
+        self.read_ptr = min(self.read_ptr + count, self.buf_size)
+
+    def seek(self, offset):
+        if self.bit_position:
+            raise Exception("Not aligned: %d" %self.bit_position)
+        if self.stats is not None:
+            self.stats.count_seek(offset)
+        self.read_ptr = min(offset, self.buf_size)
+
+    def close(self):
+        if not self.closed:
+            self.data.close()
+            self.closed = True
+
+    def isclosed(self):
+        return self.closed
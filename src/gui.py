@@ -4,9 +4,24 @@ import pygtk
 pygtk.require('2.0')
 import gtk
 import xml.etree.ElementTree as ET
+from tree import ArrayView
 
+# Rows are added to the store only when they are first shown: a row whose
+# node has attributes or children gets a single placeholder child and keeps
+# the node in its second column, and expanding the row replaces the
+# placeholder with the node's attributes and child rows. Rows deeper than
+# expand_depth levels start collapsed, so opening the window only costs the
+# rows that are visible.
+#
+# Long arrays are shown the same way: the attribute row holds its ArrayView
+# and expands into rows for ranges of at most ROW_ENTRIES entries (or of
+# ROW_ENTRIES ranges for very long arrays), and a range expands into a row
+# with its entries.
 class GtkRenderer(object):
-    def __init__(self):
+    ROW_ENTRIES = 100
+
+    def __init__(self, expand_depth=0):
+        self.expand_depth = expand_depth
         w = gtk.Window()
         w.resize(1024, 768)
         w.connect("delete_event", self.on_delete)
@@ -28,20 +43,79 @@ class GtkRenderer(object):
         child.text = ": %s" %(value)
         return ET.tostring(root)
 
+    # Add the row of a node, with a placeholder below it if it has content
     def populate(self, datanode, parent=None):
+        has_content = len(datanode.attrs) or len(datanode.children)
         treenode = self.treestore.append(parent, [
-            self.format_node(datanode.name, datanode.desc, True)
+            self.format_node(datanode.name, datanode.desc, True),
+            datanode if has_content else None
         ])
+        if has_content:
+            self.treestore.append(treenode, ['', None])
+        return treenode
+
+    def fill(self, treenode, datanode):
         for attr in datanode.attrs:
-            self.treestore.append(treenode, [self.format_node(
-                attr.name, attr.display_value if attr.display_value else attr.value
-            )])
+            value = attr.display_value if attr.display_value else attr.value
+            if isinstance(value, ArrayView):
+                self.add_array_row(treenode, attr.name, value)
+            else:
+                self.treestore.append(treenode, [self.format_node(attr.name, value), None])
         for child in datanode.children:
             self.populate(child, treenode)
 
+    def add_array_row(self, parent, name, view):
+        treenode = self.treestore.append(parent, [
+            self.format_node(name, "%s (%d entries)" %(view.summary(), len(view))),
+            view if len(view) else None
+        ])
+        if len(view):
+            self.treestore.append(treenode, ['', None])
+
+    def fill_array(self, treenode, view):
+        if len(view) <= GtkRenderer.ROW_ENTRIES:
+            self.treestore.append(treenode, [
+                self.format_node("%d-%d" %(view.start, view.end - 1), view.text(view.start, view.end)),
+                None
+            ])
+            return
+        size = GtkRenderer.ROW_ENTRIES
+        while len(view) > size * GtkRenderer.ROW_ENTRIES:
+            size *= GtkRenderer.ROW_ENTRIES
+        for chunk in view.chunks(size):
+            row = self.treestore.append(treenode, [
+                self.format_node("%d-%d" %(chunk.start, chunk.end - 1), chunk.summary()), chunk
+            ])
+            self.treestore.append(row, ['', None])
+
+    def on_row_expanded(self, treeview, treenode, path):
+        content = self.treestore.get_value(treenode, 1)
+        if content is None:
+            return
+        self.treestore.set_value(treenode, 1, None)
+        placeholder = self.treestore.iter_children(treenode)
+        if isinstance(content, ArrayView):
+            self.fill_array(treenode, content)
+        else:
+            self.fill(treenode, content)
+        self.treestore.remove(placeholder)
+
+    # Expand the rows below parent that are less than depth levels deep;
+    # expanding a row fills it in through on_row_expanded
+    def expand(self, parent, depth):
+        if depth <= 0:
+            return
+        treenode = self.treestore.iter_children(parent)
+        while treenode is not None:
+            if self.treestore.iter_has_child(treenode):
+                self.treeview.expand_row(self.treestore.get_path(treenode), False)
+                self.expand(treenode, depth - 1)
+            treenode = self.treestore.iter_next(treenode)
+
     def render(self, data):
-        self.treestore = gtk.TreeStore(str)
+        self.treestore = gtk.TreeStore(str, object)
         self.treeview = gtk.TreeView(self.treestore)
+        self.treeview.connect("row-expanded", self.on_row_expanded)
 
         col = gtk.TreeViewColumn(data.name)
         self.treeview.append_column(col)
@@ -51,12 +125,11 @@ class GtkRenderer(object):
 
         for child in data.children:
             self.populate(child)
+        self.expand(None, self.expand_depth)
 
         sw = gtk.ScrolledWindow()
         sw.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
         sw.add(self.treeview)
         self.window.add(sw)
-        self.treeview.expand_all()
         self.window.show_all()
         gtk.main()
-
@@ -0,0 +1,136 @@
+
+import os
+import re
+import httplib
+import urlparse
+
+# Read only file object over an HTTP(S) URL that fetches byte ranges on
+# demand. Small reads are coalesced into requests of at least block_size
+# bytes, seeking fetches nothing, and one keep-alive connection is reused for
+# all requests, so inspecting the boxes at the head and tail of a large file
+# transfers only a few blocks. Pass it to DataBuffer like a local file.
+class HttpRangeFile(object):
+    BLOCK_SIZE = 64 * 1024
+    CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+    def __init__(self, url, block_size=BLOCK_SIZE):
+        self.name = url
+        self.block_size = block_size
+        parts = urlparse.urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise Exception("Unsupported url %s" %(url))
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        self.connection = None
+        self.position = 0
+        self.window = ''
+        self.window_offset = 0
+        self.size = None
+        self.requests = 0
+        self.bytes_fetched = 0
+        self.closed = False
+        # Learn the size up front so that SEEK_END and EOF work
+        self.fetch(0, self.block_size)
+
+    def connect(self):
+        if self.scheme == 'https':
+            return httplib.HTTPSConnection(self.netloc)
+        return httplib.HTTPConnection(self.netloc)
+
+    def request(self, start, end):
+        headers = {'Range': 'bytes=%d-%d' %(start, end - 1)}
+        # A kept-alive connection may have been closed by the server since the
+        # last request; retry once on a new one.
+        for attempt in (0, 1):
+            if self.connection is None:
+                self.connection = self.connect()
+            try:
+                self.connection.request('GET', self.path, headers=headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (httplib.HTTPException, IOError):
+                self.connection.close()
+                self.connection = None
+                if attempt:
+                    raise
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        if response.status == 416:
+            return '', None
+        if response.status != 206:
+            raise Exception("Range request for %s failed: %d %s" %(
+                self.name, response.status, response.reason))
+        match = HttpRangeFile.CONTENT_RANGE.match(response.getheader('content-range', ''))
+        if match is None:
+            raise Exception("Bad Content-Range in response for %s" %(self.name))
+        if int(match.group(1)) != start:
+            raise Exception("Server returned range starting at %s for %d" %(match.group(1), start))
+        total = match.group(3)
+        return data, None if total == '*' else int(total)
+
+    def fetch(self, start, length):
+        end = start + length
+        if self.size is not None:
+            end = min(end, self.size)
+        if start >= end:
+            data = ''
+        else:
+            data, size = self.request(start, end)
+            if size is not None:
+                self.size = size
+        self.window = data
+        self.window_offset = start
+
+    def read(self, size=-1):
+        if size < 0:
+            if self.size is None:
+                raise Exception("Size of %s is unknown" %(self.name))
+            size = self.size - self.position
+        result = []
+        while size > 0:
+            index = self.position - self.window_offset
+            if not 0 <= index < len(self.window):
+                self.fetch(self.position, max(size, self.block_size))
+                index = 0
+                if not self.window:
+                    break
+            data = self.window[index:index + size]
+            result.append(data)
+            self.position += len(data)
+            size -= len(data)
+        return ''.join(result)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            if self.size is None:
+                raise IOError("Cannot seek from the end of %s: the server did not give its size" %(
+                    self.name))
+            offset += self.size
+        if offset < 0:
+            raise IOError("Negative seek position %d" %(offset))
+        self.position = offset
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def is_url(path):
+    return path.startswith('http://') or path.startswith('https://')
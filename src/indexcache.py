@@ -0,0 +1,212 @@
+
+import os
+import errno
+import struct
+import marshal
+import hashlib
+from array import array
+
+from isobmff.box import Box
+
+# On disk cache of the box tree of files, so that inspecting the same file
+# again does not walk it. Entries are keyed by path, size and modification
+# time, or optionally by a fingerprint of the size and the first and last
+# blocks of the file, and hold the offset, size and header size of every box
+# in the container hierarchy. The decoded sample tables can be stored too.
+#
+# File layout: magic, format version, size and modification time of the
+# file, record count and a SHA-1 digest of the rest, then one fixed size
+# record per box in pre-order (type, offset, size, header size, number of
+# children), followed by the marshalled sample tables keyed by record index.
+#
+# The directory may be shared, so an entry is only used once its header
+# matches the file and the digest matches its contents; anything wrong with
+# an entry makes it a miss.
+class IndexCache(object):
+    MAGIC = 'MP4I'
+    VERSION = 2
+    HEADER = struct.Struct('>4sHQdI20s')
+    RECORD = struct.Struct('>4sQQBI')
+    SUFFIX = '.idx'
+    FINGERPRINT_BLOCK = 64 * 1024
+    DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+    # Fields stored for each sample table box when tables are cached
+    TABLE_FIELDS = {
+        'stts' : ('version', 'flags', 'entry_count', 'sample_counts', 'sample_deltas'),
+        'stsc' : ('version', 'flags', 'entry_count', 'first_chunks', 'samples_per_chunk',
+                  'sample_description_indices'),
+        'stco' : ('version', 'flags', 'entry_count', 'entries'),
+        'co64' : ('version', 'flags', 'entry_count', 'entries'),
+        'stss' : ('version', 'flags', 'entry_count', 'entries'),
+        'stsz' : ('version', 'flags', 'sample_size', 'sample_count', 'entries'),
+    }
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE, fingerprint=False, tables=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.fingerprint = fingerprint
+        self.tables = tables
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, path):
+        st = os.stat(path)
+        digest = hashlib.sha1()
+        if self.fingerprint:
+            digest.update(str(st.st_size))
+            with open(path, 'rb') as fd:
+                digest.update(fd.read(IndexCache.FINGERPRINT_BLOCK))
+                if st.st_size > IndexCache.FINGERPRINT_BLOCK:
+                    fd.seek(max(IndexCache.FINGERPRINT_BLOCK,
+                        st.st_size - IndexCache.FINGERPRINT_BLOCK))
+                    digest.update(fd.read())
+        else:
+            digest.update("%s\0%d\0%r" %(os.path.abspath(path), st.st_size, st.st_mtime))
+        return digest.hexdigest()
+
+    def entry_path(self, path):
+        return os.path.join(self.directory, self.key(path) + IndexCache.SUFFIX)
+
+    # Top level boxes of path as lazy boxes reading from buf, or None if the
+    # file is not in the cache or its entry cannot be used.
+    def load(self, path, buf):
+        st = os.stat(path)
+        entry = self.entry_path(path)
+        try:
+            with open(entry, 'rb') as fd:
+                data = fd.read()
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                return None
+            raise
+        try:
+            top = self.parse_entry(data, buf, st)
+        except Exception:
+            return None
+        if top is None:
+            return None
+        # Mark the entry as recently used for eviction
+        os.utime(entry, None)
+        return top
+
+    # Files found by fingerprint may have been copied, so only their size
+    # has to match
+    def parse_entry(self, data, buf, st):
+        if len(data) < IndexCache.HEADER.size:
+            return None
+        magic, version, file_size, mtime, count, digest = IndexCache.HEADER.unpack_from(data, 0)
+        if magic != IndexCache.MAGIC or version != IndexCache.VERSION:
+            return None
+        if file_size != st.st_size or (not self.fingerprint and mtime != st.st_mtime):
+            return None
+        body = buffer(data, IndexCache.HEADER.size)
+        if hashlib.sha1(body).digest() != digest:
+            return None
+        if len(body) < count * IndexCache.RECORD.size:
+            return None
+
+        position = IndexCache.HEADER.size
+        boxes = []
+        top = []
+        # (box, remaining children) of the open containers
+        stack = []
+        for i in xrange(count):
+            boxtype, offset, size, header_size, child_count = IndexCache.RECORD.unpack_from(
+                data, position)
+            position += IndexCache.RECORD.size
+            if offset + size > file_size or header_size > size:
+                return None
+            parent = stack[-1][0] if stack else None
+            box = Box.from_header(buf, parent, boxtype, offset, size, header_size)
+            boxes.append(box)
+            if parent is None:
+                top.append(box)
+            else:
+                parent.add_child(box)
+                stack[-1][1] -= 1
+            if child_count:
+                stack.append([box, child_count])
+            while stack and stack[-1][1] == 0:
+                stack.pop()
+        if stack:
+            return None
+
+        if position < len(data):
+            tables = marshal.loads(data[position:])
+            for i, fields in tables.iteritems():
+                names = IndexCache.TABLE_FIELDS.get(boxes[i].boxtype, ())
+                if sorted(fields) != sorted(names):
+                    return None
+            for i, fields in tables.iteritems():
+                box = boxes[i]
+                for name, value in fields.iteritems():
+                    if type(value) is tuple:
+                        typecode, values = value
+                        value = array(typecode)
+                        value.fromstring(values)
+                    setattr(box, name, value)
+                box.pending_buf = None
+        return top
+
+    def store(self, path, boxes):
+        st = os.stat(path)
+        records = []
+        tables = {}
+        for box in IndexCache.walk(boxes):
+            children = box.children if box.boxtype in Box.container_boxes else []
+            records.append(IndexCache.RECORD.pack(box.boxtype, box.offset, box.size,
+                box.header_size, len(children)))
+            if self.tables and box.boxtype in IndexCache.TABLE_FIELDS:
+                fields = {}
+                for name in IndexCache.TABLE_FIELDS[box.boxtype]:
+                    value = getattr(box, name)
+                    if type(value) is array:
+                        value = (value.typecode, value.tostring())
+                    fields[name] = value
+                tables[len(records) - 1] = fields
+
+        body = ''.join(records)
+        if tables:
+            body += marshal.dumps(tables)
+        entry = self.entry_path(path)
+        temp = "%s.%d.tmp" %(entry, os.getpid())
+        with open(temp, 'wb') as fd:
+            fd.write(IndexCache.HEADER.pack(IndexCache.MAGIC, IndexCache.VERSION, st.st_size,
+                st.st_mtime, len(records), hashlib.sha1(body).digest()))
+            fd.write(body)
+        os.rename(temp, entry)
+        self.evict()
+
+    # Container boxes in pre-order
+    @staticmethod
+    def walk(boxes):
+        stack = list(reversed(boxes))
+        while stack:
+            box = stack.pop()
+            yield box
+            if box.boxtype in Box.container_boxes:
+                stack.extend(reversed(box.children))
+
+    # Remove the least recently used entries until the cache fits in max_size
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(IndexCache.SUFFIX):
+                continue
+            entry = os.path.join(self.directory, name)
+            try:
+                st = os.stat(entry)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry))
+            total += st.st_size
+        entries.sort()
+        for mtime, size, entry in entries:
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            total -= size
@@ -3,7 +3,15 @@ import sys
 
 # Set container flag for pure containers. Boxes with data and children should be
 # handled in their own subclass
+#
+# Files can have hundreds of thousands of boxes, so boxes are slotted and
+# every subclass lists the attributes it sets in __slots__. Box types are
+# interned, and boxes without children share an empty tuple until their first
+# child is added with add_child.
 class Box(object):
+    __slots__ = ('parent', 'lazy', 'offset', 'size', 'boxtype', 'islarge', 'children',
+        'consumed_bytes', 'header_size', 'pending_buf')
+
     box_names = {
         'ftyp' : 'File type',
         'moov' : 'Movie container',
@@ -24,6 +32,7 @@ class Box(object):
         'stts' : 'Time-to-sample box',
         'stsc' : 'Sample-to-chunk box',
         'stco' : 'Chunk offset box',
+        'co64' : '64-bit chunk offset box',
         'stss' : 'Sync sample box',
         'stsz' : 'Sample size box',
         'stz2' : 'Compact sample size box',
@@ -31,22 +40,87 @@ class Box(object):
         'skip' : 'Skip',
         'free' : 'Free',
         'pssh' : 'Protection System Specific Header',
+        'sinf' : 'Protection scheme information box',
+        'frma' : 'Original format box',
+        'schm' : 'Scheme type box',
+        'schi' : 'Scheme information box',
+        'mfhd' : 'Movie fragment header',
+        'tfhd' : 'Track fragment header',
+        'tfdt' : 'Track fragment decode time',
+        'trun' : 'Track fragment run',
     }
+    # ParseStats recording every box parsed, see parsestats.py
+    stats = None
+    registry = None
+
     container_boxes = [
         'moov', 'trak', 'edts', 'mdia', 'minf', 'dinf', 'stbl', 'mvex',
         'moof', 'traf', 'mfra', 'skip', 'meta', 'ipro', 'sinf'
     ]
 
-    def __init__(self, buf, parent=None, container = False):
+    # In lazy mode only the header of a box is read up front; the payload of
+    # a registered box is parsed from its recorded offset the first time one
+    # of its fields is accessed. Containers still list their children, so the
+    # box tree is available without decoding any payload.
+    def __init__(self, buf, parent=None, container = False, lazy = False):
         self.parent = parent
-        self.parse(buf)
-        if container:
-            self.parse_children(buf)
+        self.lazy = lazy
+        self.offset = buf.tell()
+        stats = Box.stats
+        if stats is not None:
+            stats.enter(buf.peekstr(4, 4), self.offset)
+        try:
+            if lazy and not container and type(self) is not Box:
+                Box.parse(self, buf)
+                buf.skipbytes(self.size - self.consumed_bytes)
+                self.pending_buf = buf
+            else:
+                self.parse(buf)
+                if container:
+                    self.parse_children(buf)
+        finally:
+            if stats is not None:
+                stats.leave(self)
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet
+        if name == 'pending_buf':
+            raise AttributeError(name)
+        buf = getattr(self, 'pending_buf', None)
+        if buf is None:
+            raise AttributeError(name)
+        self.load()
+        return getattr(self, name)
+
+    def load(self):
+        buf = self.pending_buf
+        if buf.isclosed():
+            raise Exception("Cannot parse the payload of %s at offset %d: its source is closed" %(
+                self.boxtype, self.offset))
+        self.pending_buf = None
+        position = buf.tell()
+        buf.seek(self.offset)
+        stats = Box.stats
+        if stats is not None:
+            stats.enter(self.boxtype, self.offset)
+        try:
+            self.parse(buf)
+        finally:
+            if stats is not None:
+                stats.leave(self, False)
+        buf.seek(position)
+
+    # Parsers are not required to consume the whole box (trailing child boxes
+    # of sample entries, for example); move past whatever is left.
+    def skip_remaining(self, buf):
+        end = self.offset + self.size
+        if self.size and buf.tell() < end:
+            buf.skipbytes(end - buf.tell())
 
     def parse(self, buf):
         islarge = False
         size = buf.readint32()
-        boxtype = buf.readstr(4)
+        boxtype = intern(buf.readstr(4))
         self.consumed_bytes = 8
         # 64 bit box
         if size == 1:
@@ -57,18 +131,25 @@ class Box(object):
         self.size = size
         self.boxtype = boxtype
         self.islarge = islarge
-        self.children = []
+        self.children = ()
         # usertype
         if boxtype == 'uuid':
             buf.skipbytes(16)
             self.consumed_bytes += 16
+        self.header_size = self.consumed_bytes
 
     def parse_children(self, buf):
         while self.consumed_bytes < self.size:
-            box = Box.getnextbox(buf, self)
-            self.children.append(box)
+            box = Box.getnextbox(buf, self, self.lazy)
+            self.add_child(box)
             self.consumed_bytes += box.size
 
+    def add_child(self, box):
+        if self.children:
+            self.children.append(box)
+        else:
+            self.children = [box]
+
     def get_child_count(self):
         return len(self.children)
 
@@ -90,10 +171,15 @@ class Box(object):
     def __str__(self):
         return "%s (%d bytes)" %(self.boxtype, self.size)
 
+    # Box classes by type, built on first use since the modules defining them
+    # import this one
     @staticmethod
-    def getnextbox(buf, parent=None):
+    def getboxmap():
+        if Box.registry is not None:
+            return Box.registry
         import movie
-        boxmap = {
+        import fragment
+        Box.registry = {
             'ftyp' : FileType,
             'mvhd' : movie.MovieHeader,
             'tkhd' : movie.TrackHeader,
@@ -104,22 +190,54 @@ class Box(object):
             'stts' : movie.TimeToSampleBox,
             'stsc' : movie.SampleToChunkBox,
             'stco' : movie.ChunkOffsetBox,
+            'co64' : movie.ChunkOffsetBox,
             'stss' : movie.SyncSampleBox,
             'stsz' : movie.SampleSizeBox,
             'stz2' : movie.CompactSampleSizeBox,
             'pssh' : movie.ProtectionHeader,
+            'frma' : movie.OriginalFormatBox,
+            'schm' : movie.SchemeTypeBox,
+            'mfhd' : fragment.MovieFragmentHeader,
+            'tfhd' : fragment.TrackFragmentHeader,
+            'tfdt' : fragment.TrackFragmentDecodeTime,
+            'trun' : fragment.TrackRunBox,
         }
+        return Box.registry
+
+    @staticmethod
+    def getnextbox(buf, parent=None, lazy=False):
+        boxmap = Box.registry or Box.getboxmap()
         fourcc = buf.peekstr(4, 4)
         if fourcc in boxmap:
-            box = boxmap[fourcc](buf, parent)
+            box = boxmap[fourcc](buf, parent, lazy=lazy)
+            box.skip_remaining(buf)
         else:
             container = fourcc in Box.container_boxes
-            box = Box(buf, parent, container)
+            box = Box(buf, parent, container, lazy)
             if not container:
                 #TODO: Handle size zero (box extends till EOF).
                 buf.skipbytes(box.size - box.consumed_bytes)
         return box
 
+    # Create a lazy box from a previously recorded header, without reading
+    # anything; the payload is parsed from buf on first access as usual.
+    @staticmethod
+    def from_header(buf, parent, boxtype, offset, size, header_size):
+        cls = Box.getboxmap().get(boxtype, Box)
+        box = cls.__new__(cls)
+        box.parent = parent
+        box.lazy = True
+        box.offset = offset
+        box.size = size
+        box.boxtype = intern(boxtype)
+        box.header_size = header_size
+        box.consumed_bytes = header_size
+        box.islarge = header_size - (16 if boxtype == 'uuid' else 0) == 16
+        box.children = ()
+        if cls is not Box:
+            box.pending_buf = buf
+        return box
+
     @staticmethod
     def getboxdesc(name):
         if name in Box.box_names:
@@ -129,6 +247,8 @@ class Box(object):
 
 
 class FullBox(Box):
+    __slots__ = ('version', 'flags')
+
     def parse(self, buf):
         super(FullBox, self).parse(buf)
         self.version = buf.readbyte()
@@ -143,6 +263,8 @@ class FullBox(Box):
 
 
 class FileType(Box):
+    __slots__ = ('major_brand', 'minor_version', 'brands')
+
     def parse(self, buf):
         super(FileType, self).parse(buf)
         self.major_brand = buf.readstr(4)
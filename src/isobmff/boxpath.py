@@ -0,0 +1,73 @@
+
+from box import Box
+
+# Box path patterns such as 'moov/trak/mdia/mdhd', 'moof/traf/trun' or
+# '**/pssh'. Each component is a box type, '*' for any single box or '**'
+# for any number of nested boxes. A path matches if any pattern does.
+class BoxSelector(object):
+    def __init__(self, patterns):
+        if isinstance(patterns, basestring):
+            patterns = [patterns]
+        self.patterns = [tuple(p.strip('/').split('/')) for p in patterns]
+
+    def matches(self, path):
+        return any(BoxSelector.match(p, tuple(path), False) for p in self.patterns)
+
+    # Whether a box below path could match
+    def may_match_below(self, path):
+        return any(BoxSelector.match(p, tuple(path), True) for p in self.patterns)
+
+    # With partial set, checks whether path can be extended by at least one
+    # more box type into a match of pattern.
+    @staticmethod
+    def match(pattern, path, partial):
+        if not path:
+            if partial:
+                return len(pattern) > 0
+            return all(part == '**' for part in pattern)
+        if not pattern:
+            return False
+        head = pattern[0]
+        if head == '**':
+            return (BoxSelector.match(pattern[1:], path, partial) or
+                BoxSelector.match(pattern, path[1:], partial))
+        if head == '*' or head == path[0]:
+            return BoxSelector.match(pattern[1:], path[1:], partial)
+        return False
+
+
+# Yields the boxes matching selector, fully parsed along with their
+# children. Containers are only entered if a box below them can match and
+# everything else is skipped without being parsed. Skipped boxes on the way
+# are still attached to their (header only) parents as lazy boxes, so a
+# matched box can look at its surroundings, e.g. stsd finding its handler,
+# provided the source is seekable.
+def select_boxes(buf, selector, parent=None):
+    stack = []
+    while True:
+        while stack and buf.tell() >= stack[-1].offset + stack[-1].size:
+            stack.pop()
+        if not stack and not buf.hasmore():
+            break
+        current = stack[-1] if stack else parent
+        path = get_path(current) + (buf.peekstr(4, 4),)
+        if selector.matches(path):
+            box = Box.getnextbox(buf, current)
+            yield box
+        elif path[-1] in Box.container_boxes:
+            box = Box(buf, current)
+            if selector.may_match_below(path):
+                stack.append(box)
+            else:
+                box.skip_remaining(buf)
+        else:
+            box = Box.getnextbox(buf, current, True)
+        if current is not None:
+            current.add_child(box)
+
+def get_path(box):
+    path = []
+    while box is not None:
+        path.append(box.boxtype)
+        box = box.parent
+    return tuple(reversed(path))
@@ -0,0 +1,78 @@
+
+from box import Box
+
+START = 'start'
+FIELD = 'field'
+END = 'end'
+
+# Streaming parser: yields (START, box), (FIELD, box, name, value,
+# display_value) and (END, box) events as the buffer is consumed, instead of
+# building the whole box list first. A container's START comes before its
+# children are read. A box keeps its children while it is open (sample
+# descriptions look up their handler through their parent) and lets go of
+# them once its END has been yielded. Top level boxes are not kept at all, so
+# memory is bounded by the open boxes and their earlier siblings rather than
+# by the file.
+#
+# Boxes found while parsing a payload (sample entries, data references, pssh
+# data) are reported as nested START/FIELD/END events of their box.
+def iterparse(buf, parent=None):
+    stack = []
+    while True:
+        while stack and stack[-1].consumed_bytes >= stack[-1].size:
+            box = stack.pop()
+            yield (END, box)
+            box_done(box, stack[-1] if stack else parent)
+        if not stack and not buf.hasmore():
+            break
+        current = stack[-1] if stack else parent
+        box = readbox(buf, current)
+        if current is not None:
+            current.add_child(box)
+        for event in payload_events(box):
+            yield event
+        if box.boxtype in Box.container_boxes and type(box) is Box:
+            stack.append(box)
+        else:
+            yield (END, box)
+            box_done(box, current)
+
+def readbox(buf, parent):
+    boxmap = Box.registry or Box.getboxmap()
+    fourcc = buf.peekstr(4, 4)
+    if fourcc in boxmap:
+        box = boxmap[fourcc](buf, parent)
+        box.skip_remaining(buf)
+    else:
+        box = Box(buf, parent)
+        if fourcc not in Box.container_boxes:
+            buf.skipbytes(box.size - box.consumed_bytes)
+    return box
+
+def box_done(box, parent):
+    box.children = ()
+    if parent is not None:
+        parent.consumed_bytes += box.size
+
+def field_event(box, field):
+    return (FIELD, box, field[0], field[1], field[2] if len(field) == 3 else None)
+
+# START and FIELD events of a box, followed by the events of the boxes found
+# in its payload. The END of the box itself is left to the caller.
+def payload_events(box):
+    yield (START, box)
+    for field in box.generate_fields():
+        if isinstance(field, Box):
+            for event in nested_events(field):
+                yield event
+        else:
+            yield field_event(box, field)
+    if type(box) is not Box:
+        for child in box.children:
+            for event in nested_events(child):
+                yield event
+
+def nested_events(box):
+    for event in payload_events(box):
+        yield event
+    yield (END, box)
@@ -0,0 +1,139 @@
+
+import box
+from array import array
+
+class MovieFragmentHeader(box.FullBox):
+    __slots__ = ('sequence_number',)
+
+    def parse(self, buf):
+        super(MovieFragmentHeader, self).parse(buf)
+        self.sequence_number = buf.readint32()
+
+    def generate_fields(self):
+        for x in super(MovieFragmentHeader, self).generate_fields():
+            yield x
+        yield ("sequence number", self.sequence_number)
+
+
+class TrackFragmentHeader(box.FullBox):
+    __slots__ = ('track_id', 'base_data_offset', 'sample_description_index',
+        'default_sample_duration', 'default_sample_size', 'default_sample_flags')
+
+    BASE_DATA_OFFSET = 0x000001
+    SAMPLE_DESCRIPTION_INDEX = 0x000002
+    DEFAULT_SAMPLE_DURATION = 0x000008
+    DEFAULT_SAMPLE_SIZE = 0x000010
+    DEFAULT_SAMPLE_FLAGS = 0x000020
+    DURATION_IS_EMPTY = 0x010000
+    DEFAULT_BASE_IS_MOOF = 0x020000
+
+    def parse(self, buf):
+        super(TrackFragmentHeader, self).parse(buf)
+        flags = self.flags
+        self.track_id = buf.readint32()
+        cls = TrackFragmentHeader
+        self.base_data_offset = buf.readint64() if flags & cls.BASE_DATA_OFFSET else None
+        self.sample_description_index = (
+            buf.readint32() if flags & cls.SAMPLE_DESCRIPTION_INDEX else None)
+        self.default_sample_duration = (
+            buf.readint32() if flags & cls.DEFAULT_SAMPLE_DURATION else None)
+        self.default_sample_size = buf.readint32() if flags & cls.DEFAULT_SAMPLE_SIZE else None
+        self.default_sample_flags = buf.readint32() if flags & cls.DEFAULT_SAMPLE_FLAGS else None
+
+    def generate_fields(self):
+        for x in super(TrackFragmentHeader, self).generate_fields():
+            yield x
+        yield ("track id", self.track_id)
+        if self.base_data_offset is not None:
+            yield ("base data offset", self.base_data_offset)
+        if self.sample_description_index is not None:
+            yield ("sample description index", self.sample_description_index)
+        if self.default_sample_duration is not None:
+            yield ("default sample duration", self.default_sample_duration)
+        if self.default_sample_size is not None:
+            yield ("default sample size", self.default_sample_size)
+        if self.default_sample_flags is not None:
+            yield ("default sample flags", "0x%08X" %(self.default_sample_flags))
+        if self.flags & TrackFragmentHeader.DURATION_IS_EMPTY:
+            yield ("duration is empty", True)
+        if self.flags & TrackFragmentHeader.DEFAULT_BASE_IS_MOOF:
+            yield ("default base is moof", True)
+
+
+class TrackFragmentDecodeTime(box.FullBox):
+    __slots__ = ('base_media_decode_time',)
+
+    def parse(self, buf):
+        super(TrackFragmentDecodeTime, self).parse(buf)
+        if self.version == 1:
+            self.base_media_decode_time = buf.readint64()
+        else:
+            self.base_media_decode_time = buf.readint32()
+
+    def generate_fields(self):
+        for x in super(TrackFragmentDecodeTime, self).generate_fields():
+            yield x
+        yield ("base media decode time", self.base_media_decode_time)
+
+
+# All per sample fields are 32 bit, so the sample records are read as one
+# array and split into a column per field present in the flags.
+class TrackRunBox(box.FullBox):
+    __slots__ = ('sample_count', 'data_offset', 'first_sample_flags', 'sample_durations',
+        'sample_sizes', 'sample_flags', 'sample_composition_time_offsets')
+
+    DATA_OFFSET = 0x000001
+    FIRST_SAMPLE_FLAGS = 0x000004
+    SAMPLE_DURATION = 0x000100
+    SAMPLE_SIZE = 0x000200
+    SAMPLE_FLAGS = 0x000400
+    SAMPLE_COMPOSITION_TIME_OFFSET = 0x000800
+
+    def parse(self, buf):
+        super(TrackRunBox, self).parse(buf)
+        cls = TrackRunBox
+        flags = self.flags
+        self.sample_count = buf.readint32()
+        self.data_offset = None
+        if flags & cls.DATA_OFFSET:
+            self.data_offset = buf.readint32()
+            if self.data_offset & 0x80000000:
+                self.data_offset -= 1 << 32
+        self.first_sample_flags = buf.readint32() if flags & cls.FIRST_SAMPLE_FLAGS else None
+
+        columns = [flag for flag in (cls.SAMPLE_DURATION, cls.SAMPLE_SIZE,
+            cls.SAMPLE_FLAGS, cls.SAMPLE_COMPOSITION_TIME_OFFSET) if flags & flag]
+        table = buf.readarray(4, self.sample_count * len(columns))
+        values = {}
+        for i, flag in enumerate(columns):
+            values[flag] = table[i::len(columns)]
+
+        self.sample_durations = values.get(cls.SAMPLE_DURATION)
+        self.sample_sizes = values.get(cls.SAMPLE_SIZE)
+        self.sample_flags = values.get(cls.SAMPLE_FLAGS)
+        self.sample_composition_time_offsets = values.get(cls.SAMPLE_COMPOSITION_TIME_OFFSET)
+        # Composition offsets are signed in version 1
+        if self.version == 1 and self.sample_composition_time_offsets is not None:
+            offsets = self.sample_composition_time_offsets
+            if type(offsets) is array:
+                self.sample_composition_time_offsets = array('i', offsets.tostring())
+            else:
+                self.sample_composition_time_offsets = [
+                    v - (1 << 32) if v & 0x80000000 else v for v in offsets]
+
+    def generate_fields(self):
+        for x in super(TrackRunBox, self).generate_fields():
+            yield x
+        yield ("sample count", self.sample_count)
+        if self.data_offset is not None:
+            yield ("data offset", self.data_offset)
+        if self.first_sample_flags is not None:
+            yield ("first sample flags", "0x%08X" %(self.first_sample_flags))
+        if self.sample_durations is not None:
+            yield ("sample durations", self.sample_durations)
+        if self.sample_sizes is not None:
+            yield ("sample sizes", self.sample_sizes)
+        if self.sample_flags is not None:
+            yield ("sample flags", self.sample_flags)
+        if self.sample_composition_time_offsets is not None:
+            yield ("sample composition time offsets", self.sample_composition_time_offsets)
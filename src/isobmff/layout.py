@@ -0,0 +1,41 @@
+import struct
+
+# Fixed layout of the fields of a box, declared as (name, format) pairs with
+# struct formats, optionally with a function applied to the value as a third
+# item. A format with a repeat count ('9I') gives a list; padding ('10x') has
+# no name. The layout is compiled into one big endian struct.Struct, so the
+# fields are read with a single read and unpack and then set on the box.
+#
+#   LAYOUT = Layout(('width', 'H'), ('height', 'H'), (None, '4x'))
+class Layout(object):
+    def __init__(self, *fields):
+        self.fields = []
+        formats = []
+        index = 0
+        for field in fields:
+            name, fmt = field[:2]
+            convert = field[2] if len(field) > 2 else None
+            formats.append(fmt)
+            # padding gives no value and strings a single one
+            if fmt[-1] == 'x':
+                count = 0
+            elif fmt[-1] in 'sp' or len(fmt) == 1:
+                count = 1
+            else:
+                count = int(fmt[:-1])
+            if name is not None:
+                self.fields.append((name, index, count, convert))
+            index += count
+        self.struct = struct.Struct('>' + ''.join(formats))
+        self.size = self.struct.size
+
+    def read(self, box, buf):
+        values = self.struct.unpack(buf.readstr(self.size))
+        for name, index, count, convert in self.fields:
+            value = values[index] if count == 1 else list(values[index:index + count])
+            setattr(box, name, value if convert is None else convert(value))
+        box.consumed_bytes += self.size
+
+# The 3x3 transformation matrix of movie and track headers as rows
+def matrix_rows(values):
+    return [values[0:3], values[3:6], values[6:9]]
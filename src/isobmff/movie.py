@@ -4,26 +4,24 @@ import box
 import struct
 import binascii
 import uuid
+from layout import Layout, matrix_rows
+from array import array
 
 class MovieHeader(box.FullBox):
+    __slots__ = ('creation_time', 'modification_time', 'timescale', 'duration', 'rate',
+        'volume', 'matrix', 'next_track_id')
+
+    FIELDS = (('rate', 'I'), ('volume', 'H'), (None, '10x'), ('matrix', '9I', matrix_rows),
+        (None, '24x'), ('next_track_id', 'I'))
+    LAYOUT = Layout(('creation_time', 'I'), ('modification_time', 'I'), ('timescale', 'I'),
+        ('duration', 'I'), *FIELDS)
+    LAYOUT_V1 = Layout(('creation_time', 'Q'), ('modification_time', 'Q'), ('timescale', 'I'),
+        ('duration', 'Q'), *FIELDS)
+
     def parse(self, buf):
         super(MovieHeader, self).parse(buf)
-        if self.version == 1:
-            self.creation_time = buf.readint64()
-            self.modification_time = buf.readint64()
-            self.timescale = buf.readint32()
-            self.duration = buf.readint64()
-        else:
-            self.creation_time = buf.readint32()
-            self.modification_time = buf.readint32()
-            self.timescale = buf.readint32()
-            self.duration = buf.readint32()
-        self.rate = buf.readint32()
-        self.volume = buf.readint16()
-        buf.skipbytes(2 + 8)
-        self.matrix = [[buf.readint32() for j in range(3)] for i in range(3)]
-        buf.skipbytes(24)
-        self.next_track_id = buf.readint32()
+        layout = MovieHeader.LAYOUT_V1 if self.version == 1 else MovieHeader.LAYOUT
+        layout.read(self, buf)
 
     def generate_fields(self):
         for x in super(MovieHeader, self).generate_fields():
@@ -40,28 +38,20 @@ class MovieHeader(box.FullBox):
 
 
 class TrackHeader(box.FullBox):
+    __slots__ = ('creation_time', 'modification_time', 'track_id', 'duration', 'layer',
+        'altgroup', 'volume', 'matrix', 'width', 'height')
+
+    FIELDS = ((None, '8x'), ('layer', 'H'), ('altgroup', 'H'), ('volume', 'H'), (None, '2x'),
+        ('matrix', '9I', matrix_rows), ('width', 'I'), ('height', 'I'))
+    LAYOUT = Layout(('creation_time', 'I'), ('modification_time', 'I'), ('track_id', 'I'),
+        (None, '4x'), ('duration', 'I'), *FIELDS)
+    LAYOUT_V1 = Layout(('creation_time', 'Q'), ('modification_time', 'Q'), ('track_id', 'I'),
+        (None, '4x'), ('duration', 'Q'), *FIELDS)
+
     def parse(self, buf):
         super(TrackHeader, self).parse(buf)
-        if self.version == 1:
-            self.creation_time = buf.readint64()
-            self.modification_time = buf.readint64()
-            self.track_id = buf.readint32()
-            buf.skipbytes(4)
-            self.duration = buf.readint64()
-        else:
-            self.creation_time = buf.readint32()
-            self.modification_time = buf.readint32()
-            self.track_id = buf.readint32()
-            buf.skipbytes(4)
-            self.duration = buf.readint32()
-        buf.skipbytes(8)
-        self.layer = buf.readint16()
-        self.altgroup = buf.readint16()
-        self.volume = buf.readint16()
-        buf.skipbytes(2)
-        self.matrix = [[buf.readint32() for j in range(3)] for i in range(3)]
-        self.width = buf.readint32()
-        self.height = buf.readint32()
+        layout = TrackHeader.LAYOUT_V1 if self.version == 1 else TrackHeader.LAYOUT
+        layout.read(self, buf)
 
     def generate_fields(self):
         for x in super(TrackHeader, self).generate_fields():
@@ -80,20 +70,18 @@ class TrackHeader(box.FullBox):
 
 
 class MediaHeader(box.FullBox):
+    __slots__ = ('creation_time', 'modification_time', 'timescale', 'duration', 'language')
+
+    FIELDS = (('language', 'H', lambda value: value & 0x7FFF), (None, '2x'))
+    LAYOUT = Layout(('creation_time', 'I'), ('modification_time', 'I'), ('timescale', 'I'),
+        ('duration', 'I'), *FIELDS)
+    LAYOUT_V1 = Layout(('creation_time', 'Q'), ('modification_time', 'Q'), ('timescale', 'I'),
+        ('duration', 'Q'), *FIELDS)
+
     def parse(self, buf):
         super(MediaHeader, self).parse(buf)
-        if self.version == 1:
-            self.creation_time = buf.readint64()
-            self.modification_time = buf.readint64()
-            self.timescale = buf.readint32()
-            self.duration = buf.readint64()
-        else:
-            self.creation_time = buf.readint32()
-            self.modification_time = buf.readint32()
-            self.timescale = buf.readint32()
-            self.duration = buf.readint32()
-        self.language = buf.readint16() & 0x7FFF
-        buf.skipbytes(2)
+        layout = MediaHeader.LAYOUT_V1 if self.version == 1 else MediaHeader.LAYOUT
+        layout.read(self, buf)
 
     def generate_fields(self):
         from utils import parse_iso639_2_15bit
@@ -163,10 +151,8 @@ class PlayReadyPsshBox():
         self.children = []
 
         pro_len = struct.unpack_from(str("<I"), pssh_payload[pssh_index:pssh_index+4])[0]
-        print "pro len = %d " % pro_len
         pssh_index += 4
         pro_count = struct.unpack_from(str("<H"), pssh_payload[pssh_index:pssh_index+2])[0]
-        print "pro count = %d " % pro_count
         pssh_index += 2
 
         pro_index = 1
@@ -237,6 +223,8 @@ class FairPlayPsshBox():
 
 
 class ProtectionHeader(box.Box):
+    __slots__ = ('version', 'system_id', 'data_size', 'data')
+
     def parse(self, buf):
         super(ProtectionHeader, self).parse(buf)
 
@@ -247,13 +235,13 @@ class ProtectionHeader(box.Box):
 
         if self.system_id == 'edef8ba979d64acea3c827dcd51d21ed':
             pssh_payload = buf.readstr(self.data_size)
-            self.children.append(WidevinePsshBox(pssh_payload))
+            self.add_child(WidevinePsshBox(pssh_payload))
         elif self.system_id == '29701fe43cc74a348c5bae90c7439a47':
             pssh_payload = buf.readstr(self.data_size)
-            self.children.append(FairPlayPsshBox(pssh_payload))
+            self.add_child(FairPlayPsshBox(pssh_payload))
         elif self.system_id == '9a04f07998404286ab92e65be0885f95':
             pssh_payload = buf.readstr(self.data_size)
-            self.children.append(PlayReadyPsshBox(pssh_payload))
+            self.add_child(PlayReadyPsshBox(pssh_payload))
         else:
             self.data = buf.readstr(self.data_size)
 
@@ -301,12 +289,13 @@ def unpackWidevineVarInt(value):
 
 
 class HandlerBox(box.FullBox):
+    __slots__ = ('handler', 'name')
+
+    LAYOUT = Layout((None, '4x'), ('handler', '4s'), (None, '12x'))
+
     def parse(self, buf):
         super(HandlerBox, self).parse(buf)
-        buf.skipbytes(4)
-        self.handler = buf.readstr(4)
-        buf.skipbytes(12)
-        self.consumed_bytes += 20
+        HandlerBox.LAYOUT.read(self, buf)
         self.name = buf.read_cstring(self.size - self.consumed_bytes)[0]
 
     def generate_fields(self):
@@ -316,12 +305,64 @@ class HandlerBox(box.FullBox):
         yield ("name", self.name if len(self.name) else '<empty>')
 
 
+# Original format of a protected sample entry (encv, enca...), inside sinf
+class OriginalFormatBox(box.Box):
+    __slots__ = ('data_format',)
+
+    LAYOUT = Layout(('data_format', '4s'))
+
+    def parse(self, buf):
+        super(OriginalFormatBox, self).parse(buf)
+        OriginalFormatBox.LAYOUT.read(self, buf)
+
+    def generate_fields(self):
+        for x in super(OriginalFormatBox, self).generate_fields():
+            yield x
+        yield ("data format", self.data_format)
+
+
+# Protection scheme (cenc, cbcs...) of a protected sample entry, inside sinf
+class SchemeTypeBox(box.FullBox):
+    __slots__ = ('scheme_type', 'scheme_version', 'scheme_uri')
+
+    LAYOUT = Layout(('scheme_type', '4s'), ('scheme_version', 'I'))
+
+    def parse(self, buf):
+        super(SchemeTypeBox, self).parse(buf)
+        SchemeTypeBox.LAYOUT.read(self, buf)
+        self.scheme_uri = None
+        if self.flags & 1:
+            self.scheme_uri = buf.read_cstring(self.size - self.consumed_bytes)[0]
+
+    def generate_fields(self):
+        for x in super(SchemeTypeBox, self).generate_fields():
+            yield x
+        yield ("scheme type", self.scheme_type)
+        yield ("scheme version", "0x%08x" %(self.scheme_version))
+        if self.scheme_uri is not None:
+            yield ("scheme uri", self.scheme_uri)
+
+
 class SampleEntry(box.Box):
+    __slots__ = ('data_ref_index',)
+
+    LAYOUT = Layout((None, '6x'), ('data_ref_index', 'H'))
+
     def parse(self, buf):
         super(SampleEntry, self).parse(buf)
-        buf.skipbytes(6)
-        self.data_ref_index = buf.readint16()
-        self.consumed_bytes += 8
+        SampleEntry.LAYOUT.read(self, buf)
+
+    # The codec configuration (avcC, esds, btrt, pasp...) follows the fixed
+    # fields as child boxes. Whatever does not look like a box that fits in
+    # the entry is left for skip_remaining.
+    def parse_children(self, buf):
+        while self.size - self.consumed_bytes >= 8:
+            size = buf.peekint(4)
+            if size < 8 or size > self.size - self.consumed_bytes:
+                break
+            child = box.Box.getnextbox(buf, self)
+            self.add_child(child)
+            self.consumed_bytes += child.size
 
     def generate_fields(self):
         for x in super(SampleEntry, self).generate_fields():
@@ -329,26 +370,24 @@ class SampleEntry(box.Box):
         yield ("data reference index", self.data_ref_index)
 
 
+# The hint specific fields are skipped by SampleDescription
 class HintSampleEntry(SampleEntry):
-    def parse(self, buf):
-        buf.skipbytes(self.size - self.consumed_bytes)
+    __slots__ = ()
 
 
 class VisualSampleEntry(SampleEntry):
+    __slots__ = ('width', 'height', 'hori_resolution', 'vert_resolution', 'frame_count',
+        'compressor_name', 'depth')
+
+    # The compressor name is a pascal string padded to 32 bytes
+    LAYOUT = Layout((None, '16x'), ('width', 'H'), ('height', 'H'), ('hori_resolution', 'I'),
+        ('vert_resolution', 'I'), (None, '4x'), ('frame_count', 'H'), ('compressor_name', '32p'),
+        ('depth', 'H'), (None, '2x'))
+
     def parse(self, buf):
         super(VisualSampleEntry, self).parse(buf)
-        buf.skipbytes(2 + 2 + 3 * 4)
-        self.width = buf.readint16()
-        self.height = buf.readint16()
-        self.hori_resolution = buf.readint32()
-        self.vert_resolution = buf.readint32()
-        buf.skipbytes(4)
-        self.frame_count = buf.readint16()
-        compressor_name_length = buf.readbyte()
-        self.compressor_name = buf.readstr(compressor_name_length) if compressor_name_length else ''
-        buf.skipbytes(32 - compressor_name_length - 1)
-        self.depth = buf.readint16()
-        buf.skipbytes(2)
+        VisualSampleEntry.LAYOUT.read(self, buf)
+        self.parse_children(buf)
 
     def generate_fields(self):
         for x in super(VisualSampleEntry, self).generate_fields():
@@ -362,13 +401,15 @@ class VisualSampleEntry(SampleEntry):
         yield ("depth", self.depth)
 
 class AudioSampleEntry(SampleEntry):
+    __slots__ = ('channel_count', 'sample_size', 'sample_rate')
+
+    LAYOUT = Layout((None, '8x'), ('channel_count', 'H'), ('sample_size', 'H'), (None, '4x'),
+        ('sample_rate', 'I'))
+
     def parse(self, buf):
         super(AudioSampleEntry, self).parse(buf)
-        buf.skipbytes(8)
-        self.channel_count = buf.readint16()
-        self.sample_size = buf.readint16()
-        buf.skipbytes(4)
-        self.sample_rate = buf.readint32()
+        AudioSampleEntry.LAYOUT.read(self, buf)
+        self.parse_children(buf)
 
     def generate_fields(self):
         for x in super(AudioSampleEntry, self).generate_fields():
@@ -378,6 +419,8 @@ class AudioSampleEntry(SampleEntry):
 
 
 class SampleDescription(box.FullBox):
+    __slots__ = ('entry_count', 'entries')
+
     def parse(self, buf):
         super(SampleDescription, self).parse(buf)
         media = self.find_parent('mdia')
@@ -387,14 +430,14 @@ class SampleDescription(box.FullBox):
         self.entries = []
         for i in range(self.entry_count):
             if handler == 'soun':
-                entry = AudioSampleEntry(buf)
+                entry = AudioSampleEntry(buf, self)
             elif handler == 'vide':
-                entry = VisualSampleEntry(buf)
+                entry = VisualSampleEntry(buf, self)
             elif handler == 'hint':
-                entry = HintSampleEntry(buf)
+                entry = HintSampleEntry(buf, self)
             else:
-                entry = box.Box(buf)
-                buf.skipbytes(entry.size - entry.consumed_bytes)
+                entry = box.Box(buf, self)
+            entry.skip_remaining(buf)
             self.entries.append(entry)
 
     def generate_fields(self):
@@ -406,6 +449,8 @@ class SampleDescription(box.FullBox):
 
 
 class DataEntryUrnBox(box.FullBox):
+    __slots__ = ('name', 'location')
+
     def parse(self, buf):
         super(DataEntryUrnBox, self).parse(buf)
         self.name = buf.read_cstring()[0]
@@ -419,6 +464,8 @@ class DataEntryUrnBox(box.FullBox):
 
 
 class DataEntryUrlBox(box.FullBox):
+    __slots__ = ('location',)
+
     def parse(self, buf):
         super(DataEntryUrlBox, self).parse(buf)
         self.location = buf.read_cstring(self.size - self.consumed_bytes)[0]
@@ -430,6 +477,8 @@ class DataEntryUrlBox(box.FullBox):
 
 
 class DataReferenceBox(box.FullBox):
+    __slots__ = ('entry_count', 'entries')
+
     def parse(self, buf):
         super(DataReferenceBox, self).parse(buf)
         self.entry_count = buf.readint32()
@@ -452,50 +501,52 @@ class DataReferenceBox(box.FullBox):
 
 
 class TimeToSampleBox(box.FullBox):
+    __slots__ = ('entry_count', 'sample_counts', 'sample_deltas')
+
     def parse(self, buf):
         super(TimeToSampleBox, self).parse(buf)
         self.entry_count = buf.readint32()
-        self.entries = []
-        for i in range(self.entry_count):
-            count = buf.readint32()
-            delta = buf.readint32()
-            self.entries.append((count, delta))
+        table = buf.readarray(4, self.entry_count * 2)
+        self.sample_counts = table[0::2]
+        self.sample_deltas = table[1::2]
 
     def generate_fields(self):
         for x in super(TimeToSampleBox, self).generate_fields():
             yield x
         yield ("entry count", self.entry_count)
-        for entry in self.entries:
-            yield ("sample count", entry[0])
-            yield ("sample delta", entry[1])
+        yield ("sample counts", self.sample_counts)
+        yield ("sample deltas", self.sample_deltas)
 
 
 class SampleToChunkBox(box.FullBox):
+    __slots__ = ('entry_count', 'first_chunks', 'samples_per_chunk',
+        'sample_description_indices')
+
     def parse(self, buf):
         super(SampleToChunkBox, self).parse(buf)
         self.entry_count = buf.readint32()
-        self.entries = []
-        for i in range(self.entry_count):
-            first = buf.readint32()
-            samples_per_chunk = buf.readint32()
-            sdix = buf.readint32()
-            self.entries.append((first, samples_per_chunk, sdix))
+        table = buf.readarray(4, self.entry_count * 3)
+        self.first_chunks = table[0::3]
+        self.samples_per_chunk = table[1::3]
+        self.sample_description_indices = table[2::3]
 
     def generate_fields(self):
         for x in super(SampleToChunkBox, self).generate_fields():
             yield x
         yield ("entry count", self.entry_count)
-        for entry in self.entries:
-            yield ("first chunk", entry[0])
-            yield ("samples per chunk", entry[1])
-            yield ("sample description index", entry[2])
+        yield ("first chunks", self.first_chunks)
+        yield ("samples per chunk", self.samples_per_chunk)
+        yield ("sample description indices", self.sample_description_indices)
 
 
+# Handles both stco and its 64 bit variant co64
 class ChunkOffsetBox(box.FullBox):
+    __slots__ = ('entry_count', 'entries')
+
     def parse(self, buf):
         super(ChunkOffsetBox, self).parse(buf)
         self.entry_count = buf.readint32()
-        self.entries = [buf.readint32() for i in range(self.entry_count)]
+        self.entries = buf.readarray(8 if self.boxtype == 'co64' else 4, self.entry_count)
 
     def generate_fields(self):
         for x in super(ChunkOffsetBox, self).generate_fields():
@@ -505,10 +556,12 @@ class ChunkOffsetBox(box.FullBox):
 
 
 class SyncSampleBox(box.FullBox):
+    __slots__ = ('entry_count', 'entries')
+
     def parse(self, buf):
         super(SyncSampleBox, self).parse(buf)
         self.entry_count = buf.readint32()
-        self.entries = [buf.readint32() for i in range(self.entry_count)]
+        self.entries = buf.readarray(4, self.entry_count)
 
     def generate_fields(self):
         for x in super(SyncSampleBox, self).generate_fields():
@@ -518,14 +571,16 @@ class SyncSampleBox(box.FullBox):
 
 
 class SampleSizeBox(box.FullBox):
+    __slots__ = ('sample_size', 'sample_count', 'entries')
+
     def parse(self, buf):
         super(SampleSizeBox, self).parse(buf)
         self.sample_size = buf.readint32()
         self.sample_count = buf.readint32()
         if self.sample_size == 0:
-            self.entries = [buf.readint32() for i in range(self.sample_count)]
+            self.entries = buf.readarray(4, self.sample_count)
         else:
-            self.entries = []
+            self.entries = buf.readarray(4, 0)
 
     def generate_fields(self):
         for x in super(SampleSizeBox, self).generate_fields():
@@ -536,20 +591,38 @@ class SampleSizeBox(box.FullBox):
             yield ("sample sizes", self.entries)
 
 
+# 4, 8 and 16 bit tables are decoded in bulk; 4 bit entries are split into
+# nibbles with translation tables, two per byte with the high nibble first.
+# Other field sizes are not allowed by the spec and are read bit by bit.
 class CompactSampleSizeBox(box.FullBox):
+    __slots__ = ('field_size', 'sample_count', 'entries')
+
+    HIGH_NIBBLES = ''.join([chr(i >> 4) for i in range(256)])
+    LOW_NIBBLES = ''.join([chr(i & 0xF) for i in range(256)])
+
     def parse(self, buf):
         super(CompactSampleSizeBox, self).parse(buf)
         buf.skipbytes(3)
         self.field_size = buf.readbyte()
         self.sample_count = buf.readint32()
-        self.entries = [buf.readbits(self.field_size) for i in range(self.sample_count)]
-        # skip padding bits
-        if self.field_size == 4 and self.sample_count % 2 != 0:
-            buf.readbits(4)
+        if self.field_size == 4:
+            # the last byte is padded when the count is odd
+            data = buf.readstr((self.sample_count + 1) // 2)
+            entries = array('B', [0]) * (2 * len(data))
+            entries[0::2] = array('B', data.translate(CompactSampleSizeBox.HIGH_NIBBLES))
+            entries[1::2] = array('B', data.translate(CompactSampleSizeBox.LOW_NIBBLES))
+            del entries[self.sample_count:]
+            self.entries = entries
+        elif self.field_size in (8, 16):
+            self.entries = buf.readarray(self.field_size // 8, self.sample_count)
+        else:
+            self.entries = [buf.readbits(self.field_size) for i in range(self.sample_count)]
+            if buf.bit_position:
+                buf.readbits(8 - buf.bit_position)
 
     def generate_fields(self):
-        for x in super(SampleSizeBox, self).generate_fields():
+        for x in super(CompactSampleSizeBox, self).generate_fields():
             yield x
-        yield ("field size", self.sample_size)
+        yield ("field size", self.field_size)
         yield ("sample count", self.sample_count)
-        yield ("entries", self.entries)
+        yield ("sample sizes", self.entries)
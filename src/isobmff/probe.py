@@ -0,0 +1,106 @@
+from box import Box
+from samples import find_box
+from utils import parse_iso639_2_15bit
+
+# Summary of a file from its headers alone: brands, movie duration and
+# timescale, the tracks with their handler, codec, dimensions or sample rate
+# and language (with the original codec and the scheme of protected entries), and the DRM system ids of the pssh boxes. The top level boxes
+# are walked lazily up to moov, so mdat is skipped by its header, and only
+# ftyp, mvhd, tkhd, mdhd, hdlr, stsd and pssh payloads are ever parsed; the
+# sample tables are left undecoded. Lazy boxes seek back to their payload, so
+# a pipe is parsed eagerly.
+def probe(buf):
+    info = {'brands': [], 'major_brand': None, 'minor_version': None,
+        'timescale': None, 'duration': None, 'tracks': [], 'drm': []}
+    moov = None
+    while moov is None and buf.hasmore():
+        box = Box.getnextbox(buf, None, buf.seekable)
+        if box.boxtype == 'moov':
+            moov = box
+        elif box.boxtype == 'ftyp':
+            info['major_brand'] = box.major_brand
+            info['minor_version'] = box.minor_version
+            info['brands'] = box.brands
+        elif box.boxtype == 'pssh':
+            add_system_id(info, box)
+    if moov is None:
+        raise Exception("No moov box")
+    mvhd = moov.find_child('mvhd')
+    if mvhd is not None:
+        info['timescale'] = mvhd.timescale
+        info['duration'] = mvhd.duration
+    for child in moov.children:
+        if child.boxtype == 'trak':
+            info['tracks'].append(probe_track(child))
+        elif child.boxtype == 'pssh':
+            add_system_id(info, child)
+    return info
+
+def add_system_id(info, pssh):
+    if pssh.system_id not in info['drm']:
+        info['drm'].append(pssh.system_id)
+
+# Sample entries of protected tracks, which name the codec in sinf/frma
+PROTECTED_ENTRIES = ('encv', 'enca', 'encs', 'enct')
+
+def probe_track(trak):
+    track = {'track_id': None, 'handler': None, 'codec': None, 'language': None,
+        'timescale': None, 'duration': None}
+    tkhd = trak.find_child('tkhd')
+    if tkhd is not None:
+        track['track_id'] = tkhd.track_id
+    mdhd = find_box(trak, 'mdia/mdhd')
+    if mdhd is not None:
+        track['timescale'] = mdhd.timescale
+        track['duration'] = mdhd.duration
+        track['language'] = parse_iso639_2_15bit(mdhd.language)
+    hdlr = find_box(trak, 'mdia/hdlr')
+    if hdlr is not None:
+        track['handler'] = hdlr.handler
+    stsd = find_box(trak, 'mdia/minf/stbl/stsd')
+    entry = stsd.entries[0] if stsd is not None and stsd.entries else None
+    if entry is not None:
+        track['codec'] = entry.boxtype
+        if entry.boxtype in PROTECTED_ENTRIES:
+            frma = find_box(entry, 'sinf/frma')
+            if frma is not None:
+                track['codec'] = frma.data_format
+            schm = find_box(entry, 'sinf/schm')
+            track['scheme'] = schm.scheme_type if schm is not None else None
+    if track['handler'] == 'vide':
+        # Dimensions of the sample entry, else the 16.16 ones of the header
+        if entry is not None and hasattr(entry, 'width'):
+            track['width'], track['height'] = entry.width, entry.height
+        elif tkhd is not None:
+            track['width'], track['height'] = tkhd.width >> 16, tkhd.height >> 16
+    elif track['handler'] == 'soun' and entry is not None and hasattr(entry, 'sample_rate'):
+        track['sample_rate'] = entry.sample_rate >> 16
+        track['channel_count'] = entry.channel_count
+    return track
+
+# One line per item, for the console
+def format_probe(info):
+    lines = []
+    lines.append("brands: %s %s (%s)" %(info['major_brand'], info['minor_version'],
+        ','.join(info['brands'])))
+    lines.append("timescale: %s" %(info['timescale']))
+    lines.append("duration: %s" %(format_duration(info['duration'], info['timescale'])))
+    for track in info['tracks']:
+        line = "track %s: %s %s" %(track['track_id'], track['handler'], track['codec'])
+        if 'width' in track:
+            line += " %dx%d" %(track['width'], track['height'])
+        if 'sample_rate' in track:
+            line += " %dHz %dch" %(track['sample_rate'], track['channel_count'])
+        if 'scheme' in track:
+            line += " encrypted %s" %(track['scheme'])
+        line += " %s %s" %(track['language'],
+            format_duration(track['duration'], track['timescale']))
+        lines.append(line)
+    for system_id in info['drm']:
+        lines.append("drm: %s" %(system_id))
+    return '\n'.join(lines)
+
+def format_duration(duration, timescale):
+    if duration is None or not timescale:
+        return str(duration)
+    return "%.3fs (%d)" %(float(duration) / timescale, duration)
@@ -0,0 +1,196 @@
+
+import operator
+from array import array
+from itertools import imap, islice
+from bisect import bisect_left, bisect_right
+
+# 64 bit columns for offsets and decode times where the platform has them
+WIDE_TYPECODE = 'L' if array('L').itemsize == 8 else 'd'
+
+def find_box(box, path):
+    for boxtype in path.split('/'):
+        if box is None:
+            return None
+        box = box.find_child(boxtype)
+    return box
+
+
+# Flattened sample table of one track. The run length encoded stsc and stts
+# tables are expanded against stco/co64 and stsz/stz2 into one column per
+# property, indexed by sample number - 1. Sample numbers start at 1 as they
+# do in the file format.
+class SampleIndex(object):
+    def __init__(self, trak):
+        tkhd = trak.find_child('tkhd')
+        mdhd = find_box(trak, 'mdia/mdhd')
+        stbl = find_box(trak, 'mdia/minf/stbl')
+        if mdhd is None or stbl is None:
+            raise Exception("Track has no media header or sample table")
+        self.track_id = tkhd.track_id if tkhd else None
+        self.timescale = mdhd.timescale
+
+        stsz = stbl.find_child('stsz') or stbl.find_child('stz2')
+        stco = stbl.find_child('stco') or stbl.find_child('co64')
+        stts = stbl.find_child('stts')
+        stsc = stbl.find_child('stsc')
+        stss = stbl.find_child('stss')
+
+        if stsz.boxtype == 'stsz' and stsz.sample_size:
+            self.sizes = array('I', [stsz.sample_size]) * stsz.sample_count
+        else:
+            self.sizes = array('I', stsz.entries)
+        self.sample_count = len(self.sizes)
+        self.decode_times = self.expand_times(stts)
+        self.offsets = self.expand_offsets(stsc, stco.entries, self.sizes)
+        # stss lists the sync samples; without it every sample is a sync sample
+        self.sync_samples = stss.entries if stss else None
+        if stss:
+            self.sync = array('B', [0]) * self.sample_count
+            for number in stss.entries:
+                self.sync[number - 1] = 1
+        else:
+            self.sync = array('B', [1]) * self.sample_count
+
+        # Chunks are normally laid out in order, in which case the offsets
+        # column can be bisected directly; otherwise keep a sorted permutation.
+        self.offset_order = None
+        offsets = self.offsets
+        if not all(imap(operator.le, offsets, islice(offsets, 1, None))):
+            self.offset_order = array('L', sorted(xrange(len(offsets)), key=offsets.__getitem__))
+
+    @staticmethod
+    def expand_times(stts):
+        times = array(WIDE_TYPECODE)
+        time = 0
+        for count, delta in zip(stts.sample_counts, stts.sample_deltas):
+            if delta:
+                times.extend(xrange(time, time + count * delta, delta))
+            else:
+                times.extend(array(WIDE_TYPECODE, [time]) * count)
+            time += count * delta
+        return times
+
+    # Offsets of the samples of every chunk, without a loop per sample: in a
+    # run of many small chunks the k-th samples of all chunks are found at
+    # once, each being the previous one plus its size; in a run of few large
+    # chunks each chunk is a running sum of its sizes.
+    @staticmethod
+    def expand_offsets(stsc, chunk_offsets, sizes):
+        offsets = array(WIDE_TYPECODE, [0]) * len(sizes)
+        sample = 0
+        runs = len(stsc.first_chunks)
+        for run in xrange(runs):
+            first = stsc.first_chunks[run]
+            last = stsc.first_chunks[run + 1] if run + 1 < runs else len(chunk_offsets) + 1
+            per_chunk = stsc.samples_per_chunk[run]
+            end = min(sample + (last - first) * per_chunk, len(sizes))
+            if end <= sample:
+                continue
+            if per_chunk <= last - first:
+                column = array(WIDE_TYPECODE, chunk_offsets[first - 1:last - 1])
+                for k in xrange(min(per_chunk, end - sample)):
+                    start = sample + k
+                    count = len(xrange(start, end, per_chunk))
+                    if count < len(column):
+                        column = column[:count]
+                    offsets[start:end:per_chunk] = column
+                    column = array(WIDE_TYPECODE, imap(operator.add, column,
+                        sizes[start:end:per_chunk]))
+            else:
+                for chunk in xrange(first, last):
+                    start = sample + (chunk - first) * per_chunk
+                    if start >= end:
+                        break
+                    stop = min(start + per_chunk, end)
+                    # The array iterator sees the values appended while it
+                    # is consumed, so extend() adds up the sizes in one call
+                    values = array(WIDE_TYPECODE, [chunk_offsets[chunk - 1]])
+                    values.extend(imap(operator.add, values, sizes[start:stop - 1]))
+                    offsets[start:stop] = values
+            sample = end
+        return offsets[:sample] if sample < len(offsets) else offsets
+
+    def sample(self, number):
+        i = number - 1
+        return (self.offsets[i], self.sizes[i], self.decode_times[i], bool(self.sync[i]))
+
+    # Sample whose decode interval contains the given time in media timescale
+    # units, or None if the time is before the first sample.
+    def sample_at_time(self, time):
+        i = bisect_right(self.decode_times, time)
+        return i if i else None
+
+    # Sample whose data contains the given file offset, if any
+    def sample_at_offset(self, offset):
+        if self.offset_order is None:
+            i = bisect_right(self.offsets, offset) - 1
+        else:
+            keys = SortedView(self.offsets, self.offset_order)
+            i = bisect_right(keys, offset) - 1
+            i = self.offset_order[i] if i >= 0 else -1
+        if i < 0 or offset >= self.offsets[i] + self.sizes[i]:
+            return None
+        return i + 1
+
+    # Nearest sync sample at or before the given sample number
+    def sync_sample_before(self, number):
+        if self.sync_samples is None:
+            return number
+        i = bisect_right(self.sync_samples, number)
+        return self.sync_samples[i - 1] if i else None
+
+    # Nearest sync sample at or after the given sample number
+    def sync_sample_after(self, number):
+        if self.sync_samples is None:
+            return number
+        i = bisect_left(self.sync_samples, number)
+        return self.sync_samples[i] if i < len(self.sync_samples) else None
+
+    # Rounded, as seconds given in decimal are rarely exact in binary:
+    # 1.001 * 30000 is 30029.999...
+    def seconds_to_time(self, seconds):
+        return int(round(seconds * self.timescale))
+
+    # Nearest sync sample at or before the given time in seconds, as a tuple
+    # (sample number, decode time, offset, size)
+    def find_sync_sample(self, seconds):
+        sample = self.sample_at_time(self.seconds_to_time(seconds))
+        if sample is None:
+            return None
+        sample = self.sync_sample_before(sample)
+        if sample is None:
+            return None
+        offset, size, time, sync = self.sample(sample)
+        return sample, time, offset, size
+
+
+# Read-only sequence of values in the order given by a permutation, so that
+# bisect can search the offsets of out of order chunks without copying them.
+class SortedView(object):
+    def __init__(self, values, order):
+        self.values = values
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.values[self.order[i]]
+
+
+# Sample indices of all tracks in a moov box, keyed by track id
+def get_sample_indices(moov):
+    indices = {}
+    for trak in moov.children:
+        if trak.boxtype == 'trak':
+            index = SampleIndex(trak)
+            indices[index.track_id] = index
+    return indices
+
+
+def get_track(moov, track_id):
+    for trak in moov.children:
+        if trak.boxtype == 'trak':
+            tkhd = trak.find_child('tkhd')
+            if tkhd is not None and tkhd.track_id == track_id:
+                return trak
@@ -0,0 +1,156 @@
+import sys
+import json
+import binascii
+from array import array
+
+# Machine readable output written while the file is parsed. The writers are
+# fed begin(name), then start_box(box), add_field() and end_box() for every
+# box in depth first order, and finish() at the end. Only the boxes that are
+# still open are remembered, so memory use does not grow with the file.
+#
+# Field values are written as JSON values: numbers as numbers, sample tables
+# and other arrays as compact JSON arrays, text as strings. Byte strings
+# that are not valid UTF-8 are written as {"hex": "0a1b..."} objects, so that
+# a consumer can tell them from text. Formatted values such as languages or
+# dates go in a separate "display" object.
+
+def json_value(value):
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return json.dumps(value)
+    if isinstance(value, array):
+        if value.typecode in 'fd':
+            return '[%s]' %(','.join([repr(i) for i in value]))
+        if value.typecode in 'cu':
+            return json_value(value.tostring())
+        return '[%s]' %(','.join(map(str, value)))
+    if isinstance(value, (list, tuple)):
+        return '[%s]' %(','.join([json_value(i) for i in value]))
+    if isinstance(value, str):
+        try:
+            return json.dumps(value.decode('utf-8'))
+        except UnicodeDecodeError:
+            return '{"hex":%s}' %(json.dumps(binascii.hexlify(value)))
+    if isinstance(value, unicode):
+        return json.dumps(value)
+    return json_value(str(value))
+
+class OpenBox(object):
+    def __init__(self, box, path):
+        self.box = box
+        self.path = path
+        self.fields = []
+        self.display = []
+        self.written = False
+        self.child_count = 0
+
+    # "type", "offset", ... "fields" and "display" members, without braces.
+    # Boxes decoded from pssh data have no position in the file.
+    def members(self):
+        box = self.box
+        text = '"type":%s,"offset":%s,"size":%s,"header_size":%s,"fields":{%s}' %(
+            json_value(box.boxtype),
+            json_value(getattr(box, 'offset', None)),
+            json_value(getattr(box, 'size', None)),
+            json_value(getattr(box, 'header_size', None)),
+            ','.join(['%s:%s' %(json.dumps(name), value) for name, value in self.fields]))
+        if self.display:
+            text += ',"display":{%s}' %(','.join(['%s:%s' %(json.dumps(name), value)
+                for name, value in self.display]))
+        return text
+
+# A single JSON document: {"file": name, "boxes": [...]} where every box
+# lists its children in "children"
+class JsonWriter(object):
+    WRITE_SIZE = 64 * 1024
+
+    def __init__(self, out=None):
+        self.out = sys.stdout if out is None else out
+        self.parts = []
+        self.size = 0
+        self.stack = []
+        self.top_count = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= JsonWriter.WRITE_SIZE:
+            self.flush()
+
+    def flush(self):
+        self.out.write(''.join(self.parts))
+        self.out.flush()
+        self.parts = []
+        self.size = 0
+
+    def begin(self, name):
+        self.write('{"file":%s,"boxes":[' %(json_value(name)))
+
+    def start_box(self, box):
+        if self.stack:
+            parent = self.stack[-1]
+            self.write_box(parent)
+            parent.child_count += 1
+            self.start_child(parent)
+            path = parent.path + '/' + box.boxtype
+        else:
+            self.top_count += 1
+            self.start_child(None)
+            path = box.boxtype
+        self.stack.append(OpenBox(box, path))
+
+    def add_field(self, name, value, display=None):
+        current = self.stack[-1]
+        current.fields.append((name, json_value(value)))
+        if display is not None:
+            current.display.append((name, json_value(display)))
+
+    def end_box(self):
+        current = self.stack.pop()
+        self.write_box(current)
+        self.close_box(current)
+        if not self.stack:
+            self.flush()
+
+    def finish(self):
+        while self.stack:
+            self.end_box()
+        self.write(']}\n')
+        self.flush()
+
+    # Separator before a box, or the opening of its parent's children
+    def start_child(self, parent):
+        count = parent.child_count if parent else self.top_count
+        if count > 1:
+            self.write(',')
+        elif parent:
+            self.write(',"children":[')
+
+    def write_box(self, current):
+        if not current.written:
+            self.write('{' + current.members())
+            current.written = True
+
+    def close_box(self, current):
+        self.write(']}' if current.child_count else '}')
+
+# One JSON object per line for every box, in file order, with its path:
+# {"path": "moov/trak/tkhd", "type": "tkhd", "offset": ..., ...}
+class NdjsonWriter(JsonWriter):
+    def begin(self, name):
+        pass
+
+    def finish(self):
+        while self.stack:
+            self.end_box()
+        self.flush()
+
+    def start_child(self, parent):
+        pass
+
+    def write_box(self, current):
+        if not current.written:
+            self.write('{"path":%s,%s}\n' %(json_value(current.path), current.members()))
+            current.written = True
+
+    def close_box(self, current):
+        pass
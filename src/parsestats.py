@@ -0,0 +1,127 @@
+import time
+
+from isobmff.box import Box
+
+# Where parsing time and I/O go, per box type. Install a ParseStats on a
+# buffer and every box created from then on is counted with its size and the
+# wall time spent in its parse() and parse_children(), split into its own time
+# and the time including its children. Datasource activity (readmore calls,
+# bytes read and skipped, seeks of the source) is charged to the innermost
+# box whose bytes are being read, so skipping an mdat counts against mdat and
+# not its parent; anything outside every box, such as reading the header of
+# the next top level box, is charged to FILE. With a memory mapped buffer
+# there are no reads of the source, and every access of the mapping is
+# counted as a read instead.
+#
+# Nothing is recorded when no ParseStats is installed: the hooks in Box and
+# DataBuffer are a single check of a class attribute that is None, and the
+# read methods of a mapped buffer are only wrapped while it is installed.
+
+class TypeStats(object):
+    def __init__(self, boxtype):
+        self.boxtype = boxtype
+        self.count = 0
+        self.bytes = 0
+        # seconds spent in the box itself and including its children
+        self.parse_time = 0.0
+        self.total_time = 0.0
+        self.reads = 0
+        self.bytes_read = 0
+        self.bytes_skipped = 0
+        self.seeks = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+
+class ParseStats(object):
+    FILE = '(file)'
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.types = {}
+        # Boxes being parsed as [boxtype, offset, start time, time spent in
+        # children], and the last one finished as (boxtype, offset, end)
+        self.open = []
+        self.last = None
+
+    def install(self, buf):
+        Box.stats = self
+        buf.setstats(self)
+
+    def uninstall(self, buf):
+        Box.stats = None
+        buf.setstats(None)
+
+    def get(self, boxtype):
+        stats = self.types.get(boxtype)
+        if stats is None:
+            stats = self.types[boxtype] = TypeStats(boxtype)
+        return stats
+
+    def enter(self, boxtype, offset):
+        self.open.append([boxtype, offset, self.clock(), 0.0])
+
+    # counted is False when the payload of a lazy box is parsed after the
+    # box itself has been counted. A box whose parse failed is counted under
+    # the type it was entered with, and may not know its size.
+    def leave(self, box, counted=True):
+        boxtype, offset, start, child_time = self.open.pop()
+        elapsed = self.clock() - start
+        if self.open:
+            self.open[-1][3] += elapsed
+        size = getattr(box, 'size', 0)
+        stats = self.get(boxtype)
+        if counted:
+            stats.count += 1
+            stats.bytes += size
+        stats.parse_time += elapsed - child_time
+        stats.total_time += elapsed
+        self.last = (boxtype, offset, offset + size)
+
+    def owner(self, position):
+        # A box that was just created is usually skipped by its caller
+        # right after, which is charged to it rather than its parent
+        if self.last is not None and self.last[1] <= position < self.last[2]:
+            return self.get(self.last[0])
+        if self.open:
+            return self.get(self.open[-1][0])
+        return self.get(ParseStats.FILE)
+
+    def count_read(self, position, size):
+        stats = self.owner(position)
+        stats.reads += 1
+        stats.bytes_read += size
+
+    def count_skip(self, position, size):
+        self.owner(position).bytes_skipped += size
+
+    def count_seek(self, position):
+        self.owner(position).seeks += 1
+
+    # TypeStats of every box type, most expensive first
+    def rows(self):
+        return sorted(self.types.values(),
+            key=lambda stats: (stats.parse_time, stats.bytes_read), reverse=True)
+
+    def as_dict(self):
+        return dict([(stats.boxtype, stats.as_dict()) for stats in self.rows()])
+
+    def report(self):
+        lines = ["%-8s %8s %12s %10s %10s %8s %12s %14s %6s" %('box', 'count', 'bytes',
+            'self ms', 'total ms', 'reads', 'bytes read', 'bytes skipped', 'seeks')]
+        totals = TypeStats('total')
+        for stats in self.rows():
+            lines.append("%-8s %8d %12d %10.2f %10.2f %8d %12d %14d %6d" %(stats.boxtype,
+                stats.count, stats.bytes, stats.parse_time * 1000, stats.total_time * 1000,
+                stats.reads, stats.bytes_read, stats.bytes_skipped, stats.seeks))
+            totals.count += stats.count
+            totals.parse_time += stats.parse_time
+            totals.reads += stats.reads
+            totals.bytes_read += stats.bytes_read
+            totals.bytes_skipped += stats.bytes_skipped
+            totals.seeks += stats.seeks
+        lines.append("%-8s %8d %12s %10.2f %10s %8d %12d %14d %6d" %(totals.boxtype,
+            totals.count, '', totals.parse_time * 1000, '', totals.reads,
+            totals.bytes_read, totals.bytes_skipped, totals.seeks))
+        return '\n'.join(lines)
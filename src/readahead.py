@@ -0,0 +1,271 @@
+
+import os
+import time
+import struct
+import threading
+from bisect import bisect_left
+from collections import deque
+
+# File object that prefetches the data ahead of the reader on a worker
+# thread, so that decoding one region overlaps with reading the next. At
+# most `depth` regions of `region_size` bytes are held (a double buffer by
+# default).
+#
+# The worker follows the top level box headers as it reads, and does not
+# prefetch the payload of mdat boxes: a region ends after an mdat header and
+# the next one starts after the mdat, which is where the parser seeks to
+# when it skips the box. A seek anywhere else, or a read into the payload,
+# restarts the prefetching. A non-seekable source has to be read through
+# anyway, so there the payload is prefetched like any other data.
+#
+# io_time is the time spent in reads of the source and wait_time the time
+# the reader was blocked waiting for data; the difference is the I/O wait
+# that was hidden.
+class ReadAheadFile(object):
+    REGION_SIZE = 1024 * 1024
+    HEADER = struct.Struct('>I4s')
+
+    def __init__(self, source, region_size=REGION_SIZE, depth=2):
+        self.source = source
+        self.name = getattr(source, 'name', '<source>')
+        self.region_size = region_size
+        self.depth = depth
+        try:
+            start = source.tell()
+            self.seekable = True
+        except (IOError, AttributeError):
+            start = 0
+            self.seekable = False
+        self.position = start
+        # Region being consumed: (offset, data, offset of the next region)
+        self.current = (start, '', None)
+        self.regions = deque()
+        self.condition = threading.Condition()
+        self.generation = 0
+        self.restart_offset = None
+        self.stopped = False
+        # Set while the worker reads from the source
+        self.busy = False
+        # Offset where the source ended, once the reader got there
+        self.eof_offset = None
+        # Known top level box offsets, used to resume box tracking on restart
+        self.boxes = [start]
+
+        self.io_time = 0.0
+        self.wait_time = 0.0
+        self.bytes_read = 0
+        self.bytes_skipped = 0
+        self.restarts = 0
+
+        self.worker = threading.Thread(target=self.prefetch, args=(start,))
+        self.worker.daemon = True
+        self.worker.start()
+
+    # Worker thread
+
+    def prefetch(self, offset):
+        source_position = offset
+        next_box = offset
+        generation = self.generation
+        while True:
+            with self.condition:
+                while (not self.stopped and self.restart_offset is None and
+                        len(self.regions) >= self.depth):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                if self.restart_offset is not None:
+                    offset = self.restart_offset
+                    self.restart_offset = None
+                    generation = self.generation
+                    next_box = self.known_box_after(offset)
+                self.busy = True
+            jump = None
+            consumed = 0
+            try:
+                if offset != source_position:
+                    source_position = self.move_to(source_position, offset)
+                data, consumed, jump, next_box = self.read_region(offset, next_box)
+                source_position = offset + consumed
+            except Exception as e:
+                data = e
+            with self.condition:
+                self.busy = False
+                if self.stopped:
+                    # close() left the source to be closed once the read ended
+                    self.source.close()
+                    return
+                if generation == self.generation:
+                    self.regions.append((offset, data, jump or offset + consumed))
+                    if next_box is not None and next_box > self.boxes[-1]:
+                        self.boxes.append(next_box)
+                    self.condition.notify_all()
+            if isinstance(data, Exception) or not data:
+                # Wait for a restart after an error or the end of the data
+                with self.condition:
+                    while not self.stopped and self.restart_offset is None:
+                        self.condition.wait()
+                continue
+            if jump is not None:
+                self.bytes_skipped += jump - source_position
+                offset = jump
+            else:
+                offset = source_position
+
+    def move_to(self, source_position, offset):
+        if self.seekable:
+            self.source.seek(offset, os.SEEK_SET)
+            return offset
+        if offset < source_position:
+            raise IOError("Cannot seek back to %d in non-seekable %s" %(offset, self.name))
+        while source_position < offset:
+            data = self.timed_read(min(self.region_size, offset - source_position))
+            if not data:
+                break
+            source_position += len(data)
+        return source_position
+
+    def timed_read(self, size):
+        start = time.time()
+        data = self.source.read(size)
+        self.io_time += time.time() - start
+        self.bytes_read += len(data)
+        return data
+
+    def known_box_after(self, offset):
+        i = bisect_left(self.boxes, offset)
+        return self.boxes[i] if i < len(self.boxes) else None
+
+    # Read a region at offset, stopping after the header of an mdat box of a
+    # seekable source.
+    # Returns the data, the number of bytes read from the source, the offset
+    # after the mdat if one was found, and the offset of the next top level
+    # box header (None once it is unknown).
+    def read_region(self, offset, next_box):
+        region = ''
+        while len(region) < self.region_size:
+            position = offset + len(region)
+            want = self.region_size - len(region)
+            if next_box is not None and next_box >= position:
+                # Stop shortly after the next header to look at it first
+                want = min(want, next_box + 16 - position)
+            data = self.timed_read(want)
+            if not data:
+                break
+            region += data
+            end = offset + len(region)
+            while next_box is not None and offset <= next_box and next_box + 8 <= end:
+                i = next_box - offset
+                size, boxtype = ReadAheadFile.HEADER.unpack_from(region, i)
+                header_size = 8
+                if size == 1:
+                    if next_box + 16 > end:
+                        break
+                    size = struct.unpack_from('>Q', region, i + 8)[0]
+                    header_size = 16
+                if size < header_size:
+                    # Extends to the end of the file, or is invalid
+                    next_box = None
+                    break
+                if boxtype == 'mdat' and self.seekable:
+                    return region[:i + header_size], len(region), next_box + size, next_box + size
+                next_box += size
+        return region, len(region), None, next_box
+
+    # Reader side
+
+    def next_region(self):
+        with self.condition:
+            if not self.regions:
+                start = time.time()
+                while not self.regions:
+                    self.condition.wait()
+                self.wait_time += time.time() - start
+            region = self.regions.popleft()
+            self.condition.notify_all()
+        if isinstance(region[1], Exception):
+            raise region[1]
+        return region
+
+    def restart(self, offset):
+        with self.condition:
+            self.generation += 1
+            self.restart_offset = offset
+            self.regions.clear()
+            self.restarts += 1
+            self.condition.notify_all()
+        self.current = (offset, '', None)
+        self.eof_offset = None
+
+    # Make the current region the one holding the read position
+    def advance(self):
+        while True:
+            region = self.next_region()
+            region_offset, data, next_offset = region
+            end = region_offset + len(data)
+            if not data and self.position >= region_offset:
+                self.current = region
+                self.eof_offset = region_offset
+                return
+            if region_offset <= self.position < end:
+                self.current = region
+                return
+            # Discard regions the reader skipped over, unless it is too far
+            # ahead for following regions to cover it
+            if region_offset > self.position or self.position - end > self.region_size:
+                self.restart(self.position)
+
+    def read(self, size=-1):
+        result = []
+        while size != 0:
+            offset, data = self.current[:2]
+            index = self.position - offset
+            if 0 <= index < len(data):
+                chunk = data[index:] if size < 0 else data[index:index + size]
+                result.append(chunk)
+                self.position += len(chunk)
+                if size > 0:
+                    size -= len(chunk)
+            elif self.eof_offset is not None and self.position >= self.eof_offset:
+                break
+            else:
+                self.advance()
+        return ''.join(result)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            raise IOError("Seeking from the end is not supported")
+        if offset < 0:
+            raise IOError("Negative seek position %d" %(offset))
+        self.position = offset
+        if offset < self.current[0]:
+            self.restart(offset)
+
+    def tell(self):
+        return self.position
+
+    # A worker blocked in a read of the source (a pipe or a stalled
+    # connection) is not waited for; it closes the source when the read
+    # returns.
+    def close(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+            busy = self.busy
+        if not busy:
+            self.worker.join()
+            self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def report(self):
+        return ("read ahead: %d bytes read, %d bytes of mdat not prefetched, %d restarts, "
+            "%.3fs reading, %.3fs waited, %.3fs of I/O wait hidden") %(
+            self.bytes_read, self.bytes_skipped, self.restarts, self.io_time,
+            self.wait_time, max(0.0, self.io_time - self.wait_time))
@@ -2,27 +2,51 @@
 
 import os
 import sys
+import time
+import errno
+import json
+import struct
 import argparse
+from array import array
 
-from datasource import DataBuffer
-from console import ConsoleRenderer
-from tree import Tree, Attr
+from datasource import DataBuffer, MappedDataBuffer
+from httpsource import HttpRangeFile, is_url
+from blockcache import CachedFile, get_shared_cache
+from readahead import ReadAheadFile
+from console import ConsoleRenderer, StreamingConsoleRenderer
+from jsonoutput import JsonWriter, NdjsonWriter
+from parsestats import ParseStats
+from tree import Tree, Attr, ArrayView
 
-def getboxlist(buf, parent=None):
+def iterboxes(buf, parent=None, lazy=False):
     from isobmff.box import Box
-    boxes = []
+    while buf.hasmore():
+        yield Box.getnextbox(buf, parent, lazy)
+
+# The boxes of an iterator until its end or the first parse error, which is
+# printed, and whether the end was reached
+def collect_boxes(boxes):
+    result = []
     try:
-        while buf.hasmore():
-            box = Box.getnextbox(buf, parent)
-            boxes.append(box)
+        for box in boxes:
+            result.append(box)
     except:
         import traceback
         print traceback.format_exc()
-    return boxes
+        return result, False
+    return result, True
+
+def getboxlist(buf, parent=None, lazy=False):
+    return collect_boxes(iterboxes(buf, parent, lazy))
 
 def get_box_node(box, args):
     from isobmff.box import Box
     node = Tree(box.boxtype, Box.getboxdesc(box.boxtype))
+    if args.structure_only:
+        node.add_attr("offset", box.offset)
+        node.add_attr("size", box.size)
+        node.add_attr("header size", box.header_size)
+        return node
     for field in box.generate_fields():
         if isinstance(field, Box):
             add_box(node, field, args)
@@ -30,15 +54,35 @@ def get_box_node(box, args):
             raise Exception("Expected a tuple, got a %s" %type(field));
         else:
             #generate fields yields a tuple of order (name, value, [formatted_value])
-            value = field[1]
-            if args.truncate and type(value) is list and len(value) > 10:
-                value = "[%s ... %s]" %(
-                    ','.join([str(i) for i in value[:3]]),
-                    ','.join([str(i) for i in value[-3:]])
-                )
+            value = format_value(field[1], args.truncate, get_range(args, box.boxtype))
             node.add_attr(field[0], value, field[2] if len(field) == 3 else None)
     return node
 
+# Long arrays become views that are summarized or written piece by piece;
+# with value_range, only the entries start to end of them are shown.
+def format_value(value, truncate, value_range=None):
+    if type(value) in (list, array) and value_range is not None:
+        value = ArrayView(value, value_range[0], value_range[1], False)
+    elif type(value) in (list, array) and len(value) > 10:
+        value = ArrayView(value, truncate=truncate)
+    elif type(value) is array:
+        value = "[%s]" %(', '.join([str(i) for i in value]))
+    return value
+
+# --range BOX:START-END as (boxtype, start, end); end is None if left out
+def parse_range(text):
+    try:
+        boxtype, entries = text.split(':')
+        start, end = entries.split('-')
+        return (boxtype, int(start), int(end) if end else None)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected BOX:START-END, got %s" %(text))
+
+def get_range(args, boxtype):
+    for value_range in getattr(args, 'ranges', None) or ():
+        if value_range[0] == boxtype:
+            return value_range[1:]
+
 def add_box(parent, box, args):
     box_node = parent.add_child(get_box_node(box, args))
     for child in box.children:
@@ -46,28 +90,406 @@ def add_box(parent, box, args):
     return box_node
 
 
-def get_tree_from_file(path, args):
-    with open(path, 'rb') as fd:
-        boxes = getboxlist(DataBuffer(fd))
+# A path of - reads from stdin, which may be a pipe. With block_cache (in
+# megabytes) set, reads go through the process wide block cache. With
+# read_ahead, a worker thread prefetches ahead of the parser.
+def open_source(path, block_cache=None, read_ahead=False):
+    if path == '-':
+        source = sys.stdin
+    elif is_url(path):
+        source = HttpRangeFile(path)
+    else:
+        source = open(path, 'rb')
+    if block_cache:
+        cache = get_shared_cache()
+        cache.max_size = block_cache * 1024 * 1024
+        source = CachedFile(source, cache)
+    if read_ahead:
+        source = ReadAheadFile(source)
+    return source
+
+# Regular files are memory mapped; anything else (or an empty file, which
+# cannot be mapped) goes through the chunked reader.
+def get_buffer(fd):
+    if isinstance(fd, file) and os.path.isfile(fd.name) and os.path.getsize(fd.name) > 0:
+        return MappedDataBuffer(fd)
+    return DataBuffer(fd)
+
+
+def get_index_cache(args):
+    from indexcache import IndexCache
+    return IndexCache(args.cache, args.cache_size * 1024 * 1024,
+        args.cache_fingerprint, args.cache_tables)
+
+# In structure only mode the payloads are never accessed, so the lazy parser
+# lists the whole tree without decoding any of them. The index cache also
+# works on lazy boxes; only a parse that reached the end of the file is
+# stored in it. With --select only the matching boxes are listed and the
+# cache is not used. Parse errors are printed and the boxes read so far are
+# returned, unless strict is set. With stats, a ParseStats records the parse
+# of the file through the same buffer as without.
+def get_tree_from_file(path, args, strict=False, stats=None):
     root = Tree(os.path.basename(path), "File")
-    for box in boxes:
-        add_box(root, box, args)
+    cache = None
+    select = getattr(args, 'select', None)
+    if getattr(args, 'cache', None) and not select and not is_url(path) and path != '-':
+        cache = get_index_cache(args)
+    lazy = args.structure_only or cache is not None
+    with open_source(path, getattr(args, 'block_cache', None),
+            getattr(args, 'read_ahead', False)) as fd:
+        buf = get_buffer(fd)
+        try:
+            if stats is not None:
+                stats.install(buf)
+            boxes = cache.load(path, buf) if cache else None
+            cached = boxes is not None
+            complete = True
+            if select:
+                from isobmff.boxpath import BoxSelector, select_boxes
+                boxes = select_boxes(buf, BoxSelector(select))
+            elif boxes is None:
+                boxes = iterboxes(buf, lazy=lazy)
+            if not cached and strict:
+                boxes = list(boxes)
+            elif not cached:
+                boxes, complete = collect_boxes(boxes)
+            for box in boxes:
+                add_box(root, box, args)
+            if cache and not cached and complete:
+                cache.store(path, boxes)
+            if isinstance(fd, ReadAheadFile):
+                sys.stderr.write(fd.report() + '\n')
+            if stats is not None:
+                sys.stderr.write(stats.report() + '\n')
+                for line in source_report(fd):
+                    sys.stderr.write(line + '\n')
+        finally:
+            if stats is not None:
+                stats.uninstall(buf)
+            buf.close()
     return root
 
+# Counters of the layers between the buffer and the file
+def source_report(fd):
+    lines = []
+    while fd is not None:
+        if isinstance(fd, CachedFile):
+            lines.append(str(fd.cache))
+        elif isinstance(fd, HttpRangeFile):
+            lines.append("http: %d requests, %d bytes fetched" %(fd.requests, fd.bytes_fetched))
+        fd = getattr(fd, 'source', None)
+    return lines
 
-def main():
+
+# --seek TRACK:SECONDS as (track id, seconds)
+def parse_seek(text):
+    try:
+        track_id, seconds = text.split(':')
+        return (int(track_id), float(seconds))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected TRACK:SECONDS, got %s" %(text))
+
+# Only the top level boxes before moov are walked, and with lazy parsing only
+# the sample tables of the requested track are decoded. Lazy boxes seek back
+# to their payload, so a pipe is parsed eagerly. Returns the exit status; a
+# file without moov or the track is reported on stderr.
+def seek_in_file(path, seek):
+    from isobmff.box import Box
+    from isobmff.samples import SampleIndex, get_track
+    track_id, seconds = seek
+    with open_source(path) as fd:
+        buf = get_buffer(fd)
+        try:
+            moov = None
+            while moov is None and buf.hasmore():
+                box = Box.getnextbox(buf, None, buf.seekable)
+                if box.boxtype == 'moov':
+                    moov = box
+            if moov is None:
+                sys.stderr.write("%s: no moov box\n" %(path))
+                return 1
+            trak = get_track(moov, track_id)
+            if trak is None:
+                sys.stderr.write("%s: no track with id %d\n" %(path, track_id))
+                return 1
+            index = SampleIndex(trak)
+            result = index.find_sync_sample(seconds)
+        finally:
+            buf.close()
+    if result is None:
+        print "track %d: no sync sample at or before %.3fs" %(track_id, seconds)
+        return 0
+    sample, time, offset, size = result
+    print "track %d: sync sample %d, decode time %d (%.3fs), bytes %d-%d (%d bytes)" %(
+        track_id, sample, time, float(time) / index.timescale, offset, offset + size - 1, size)
+    return 0
+
+
+# Only the headers are parsed; json and ndjson output print the summary as one
+# JSON object
+def probe_file(path, output_format):
+    from isobmff.probe import probe, format_probe
+    with open_source(path) as fd:
+        buf = get_buffer(fd)
+        try:
+            info = probe(buf)
+        finally:
+            buf.close()
+    if output_format in ('json', 'ndjson'):
+        print json.dumps(info, sort_keys=True)
+    else:
+        print format_probe(info)
+
+
+def get_file_size(path, fd):
+    if isinstance(fd, HttpRangeFile):
+        return fd.size
+    if path != '-' and not is_url(path) and os.path.isfile(path):
+        return os.path.getsize(path)
+
+# Whether a box is the last child of its parent, judged by where the boxes
+# end since the following siblings have not been read yet. Top level boxes of
+# a stream of unknown size are never the last one.
+def is_last_child(box, parent, file_size):
+    from isobmff.box import Box
+    if not isinstance(box, Box):
+        return True
+    if parent is None:
+        return file_size is not None and box.offset + box.size >= file_size
+    return box.offset + box.size >= parent.offset + parent.size
+
+# Render the boxes as they are parsed, without building a Tree
+def stream_file(path, args, renderer):
+    from isobmff import events
+    with open_source(path, getattr(args, 'block_cache', None),
+            getattr(args, 'read_ahead', False)) as fd:
+        file_size = get_file_size(path, fd)
+        renderer.begin(os.path.basename(path))
+        parents = []
+        buf = get_buffer(fd)
+        try:
+            for event in events.iterparse(buf):
+                if event[0] == events.START:
+                    box = event[1]
+                    parent = parents[-1] if parents else None
+                    renderer.start_node(box.boxtype, is_last_child(box, parent, file_size))
+                    parents.append(box)
+                    if args.structure_only:
+                        renderer.add_attr("offset", box.offset)
+                        renderer.add_attr("size", box.size)
+                        renderer.add_attr("header size", box.header_size)
+                elif event[0] == events.FIELD:
+                    if args.structure_only:
+                        continue
+                    renderer.add_attr(event[2], format_value(event[3], args.truncate,
+                        get_range(args, event[1].boxtype)))
+                else:
+                    parents.pop()
+                    renderer.end_node()
+        finally:
+            buf.close()
+        renderer.finish()
+
+# Write the boxes as JSON or NDJSON as they are parsed. In structure only
+# mode the boxes have no fields.
+def write_json(path, args, writer):
+    from isobmff import events
+    with open_source(path, getattr(args, 'block_cache', None),
+            getattr(args, 'read_ahead', False)) as fd:
+        writer.begin(os.path.basename(path))
+        buf = get_buffer(fd)
+        try:
+            for event in events.iterparse(buf):
+                if event[0] == events.START:
+                    writer.start_box(event[1])
+                elif event[0] == events.FIELD:
+                    if args.structure_only:
+                        continue
+                    writer.add_field(event[2], event[3], event[4])
+                else:
+                    writer.end_box()
+        finally:
+            buf.close()
+        writer.finish()
+
+# Run one of the streaming outputs, stopping quietly when the reader goes
+# away, e.g. | head
+def run_streaming(output, path, args, renderer):
+    try:
+        output(path, args, renderer)
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+
+# Offset and size of the complete top level boxes from offset on. A box is
+# complete once the file is at least as long as its size; a box of size zero
+# extends to the end of the file and is never complete while following.
+def get_complete_boxes(fd, offset):
+    file_size = os.fstat(fd.fileno()).st_size
+    while offset + 8 <= file_size:
+        fd.seek(offset)
+        header = fd.read(16)
+        size = struct.unpack('>I', header[:4])[0]
+        if size == 1:
+            if len(header) < 16:
+                break
+            size = struct.unpack('>Q', header[8:16])[0]
+        if size < 8 or offset + size > file_size:
+            break
+        yield offset, size
+        offset += size
+
+# Print the boxes of a file that is still being written, then wait for more
+# complete top level boxes to be appended and print them as they arrive.
+# Each poll resumes at the end of the last complete box, so the cost per new
+# fragment does not grow with the file.
+def follow_file(path, args, renderer):
+    from isobmff.box import Box
+    renderer.show_node(Tree(os.path.basename(path), "File"), renderer.offset)
+    offset = 0
+    with open(path, 'rb') as fd:
+        while True:
+            boxes = list(get_complete_boxes(fd, offset))
+            if boxes:
+                buf = MappedDataBuffer(fd)
+                for box_offset, size in boxes:
+                    buf.seek(box_offset)
+                    box = Box.getnextbox(buf)
+                    node = Tree(path, "File")
+                    add_box(node, box, args)
+                    renderer.render_child(node.children[0])
+                    offset = box_offset + size
+                buf.close()
+                sys.stdout.flush()
+            time.sleep(args.follow_interval)
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache', metavar='DIR',
+        help='keep an index of the box tree of inspected files in this directory')
+    parser.add_argument('--cache-size', type=int, default=64, metavar='MB', dest='cache_size',
+        help='size limit of the cache directory in megabytes; 64 by default')
+    parser.add_argument('--cache-fingerprint', action='store_true', dest='cache_fingerprint',
+        help='identify files by their size and first and last blocks instead of path and mtime')
+    parser.add_argument('--cache-tables', action='store_true', dest='cache_tables',
+        help='store the decoded sample tables in the cache as well')
+
+
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(
         description='Process iso-bmff file and list the boxes and their contents')
-    parser.add_argument('-o', choices=['stdout','gui'], default='stdout',
-        help='output format', dest='output_format')
+    parser.add_argument('-o', choices=['stdout','gui','json','ndjson'], default='stdout',
+        help='output format; json and ndjson are written as the file is parsed',
+        dest='output_format')
+    parser.add_argument('--expand-depth', type=int, default=0, metavar='N',
+        help='in the gui, open the first N levels of boxes expanded; the rest are filled in'
+        ' when expanded. 0 by default')
     parser.add_argument('-e', '--expand-arrays', action='store_false',
         help='do not truncate long arrays', dest='truncate')
+    parser.add_argument('--range', action='append', type=parse_range, dest='ranges',
+        metavar='BOX:START-END',
+        help='show entries START to END (from 0, END not included) of the arrays of BOX'
+        ' boxes, e.g. stsz:1000-2000; may be repeated')
+    parser.add_argument('-s', '--structure-only', action='store_true', dest='structure_only',
+        help='list only box offsets and sizes without parsing their contents')
     parser.add_argument('-c', '--color', choices=['on', 'off'], default='on', dest='color',
         help='turn on/off colors in console based output; on by default')
-    parser.add_argument('input_file', metavar='iso-base-media-file', help='Path to iso media file')
-    args = parser.parse_args()
+    parser.add_argument('--select', action='append', metavar='PATH',
+        help='show only boxes matching a path such as moov/trak/mdia/mdhd or **/pssh;'
+        ' may be repeated')
+    add_cache_arguments(parser)
+    parser.add_argument('--block-cache', type=int, metavar='MB', dest='block_cache',
+        help='read through an in memory LRU block cache of this size instead of'
+        ' memory mapping the file')
+    parser.add_argument('--read-ahead', action='store_true', dest='read_ahead',
+        help='prefetch data on a background thread while parsing instead of memory mapping'
+        ' the file, and report the I/O wait hidden')
+    parser.add_argument('--stats', action='store_true',
+        help='print the parse time and reads, skips and seeks per box type to stderr')
+    parser.add_argument('--stream', action='store_true',
+        help='print boxes to stdout as they are parsed instead of building the whole tree first')
+    parser.add_argument('-f', '--follow', action='store_true',
+        help='keep printing top level boxes as they are appended to the file, e.g. by a live'
+        ' recorder')
+    parser.add_argument('--follow-interval', type=float, default=1.0, metavar='SECONDS',
+        dest='follow_interval', help='how often to check for new boxes in follow mode')
+    parser.add_argument('--seek', metavar='TRACK:SECONDS', type=parse_seek,
+        help='print the nearest sync sample at or before the given time in a track')
+    parser.add_argument('--probe', action='store_true',
+        help='print only the brands, duration, tracks and DRM system ids, reading just the'
+        ' headers')
+    parser.add_argument('input_file', metavar='iso-base-media-file', help='Path or http(s) url of iso media file, - for stdin')
+    args = parser.parse_args(argv)
+    check_arguments(parser, args)
+    return args
+
+# The option of the mode main runs instead of building the box tree, if any
+def get_mode(args):
+    if args.seek:
+        return '--seek'
+    if args.probe:
+        return '--probe'
+    if args.stream:
+        return '--stream'
+    if args.output_format in ('json', 'ndjson'):
+        return '-o %s' %(args.output_format)
+    if args.follow:
+        return '--follow'
+    return None
+
+# Options that the selected mode would silently ignore are refused. --select,
+# --stats and --cache only apply when the box tree is built.
+def check_arguments(parser, args):
+    mode = get_mode(args)
+    if mode is not None:
+        for option, value in (('--select', args.select), ('--stats', args.stats),
+                ('--cache', args.cache)):
+            if value:
+                parser.error("%s cannot be used with %s" %(option, mode))
+    # Follow mode prints complete top level boxes to the console as they arrive
+    if args.follow and args.stream:
+        parser.error("--follow cannot be used with --stream")
+    if args.follow and args.output_format != 'stdout':
+        parser.error("--follow cannot be used with -o %s" %(args.output_format))
+
+
+def main():
+    args = parse_arguments()
+
+    if args.seek:
+        sys.exit(seek_in_file(args.input_file, args.seek))
+
+    if args.probe:
+        probe_file(args.input_file, args.output_format)
+        return
+
+    if args.stream:
+        renderer = StreamingConsoleRenderer('  ')
+        if args.color == 'off':
+            renderer.disable_colors()
+        run_streaming(stream_file, args.input_file, args, renderer)
+        return
+
+    if args.output_format in ('json', 'ndjson'):
+        writer = JsonWriter() if args.output_format == 'json' else NdjsonWriter()
+        run_streaming(write_json, args.input_file, args, writer)
+        return
+
+    if args.follow:
+        renderer = ConsoleRenderer('  ')
+        if args.color == 'off':
+            renderer.disable_colors()
+        try:
+            follow_file(args.input_file, args, renderer)
+        except KeyboardInterrupt:
+            pass
+        return
 
-    root = get_tree_from_file(args.input_file, args)
+    stats = ParseStats() if args.stats else None
+    root = get_tree_from_file(args.input_file, args, stats=stats)
 
     renderer = None
     if args.output_format == 'stdout':
@@ -76,7 +498,7 @@ def main():
             renderer.disable_colors()
     if args.output_format == 'gui':
         from gui import GtkRenderer
-        renderer = GtkRenderer()
+        renderer = GtkRenderer(args.expand_depth)
 
     renderer.render(root)
 
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import argparse
+import tempfile
+from StringIO import StringIO
+
+import batch
+from benchmarks import mp4gen
+
+# Failing output that raises part way through, like a closed pipe
+class BrokenOutput(object):
+    def write(self, data):
+        raise IOError("Broken output")
+
+    def flush(self):
+        pass
+
+
+class BatchTest(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.movie = os.path.join(directory, 'a', 'movie.mp4')
+        self.fragmented = os.path.join(directory, 'a', 'fragmented.mp4')
+        self.broken = os.path.join(directory, 'broken.mp4')
+        os.mkdir(os.path.join(directory, 'a'))
+        mp4gen.write_movie(self.movie, tracks=2, samples=100)
+        mp4gen.write_fragmented(self.fragmented, fragments=5, samples=10)
+        with open(self.broken, 'wb') as f:
+            # A box header claiming more bytes than there are
+            f.write('\x00\x00\x01\x00moov\x00\x00\x00\x10mvhd')
+        self.file_list = os.path.join(directory, 'list.txt')
+        with open(self.file_list, 'w') as f:
+            f.write('%s\n\n%s\n' %(self.broken, os.path.join(directory, 'a')))
+
+    def get_args(self, mode):
+        return argparse.Namespace(mode=mode, jobs=2, file_list=self.file_list, ordered=True,
+            chunk_size=1, truncate=True, structure_only=False, paths=[], cache=None)
+
+    def run(self):
+        out = StringIO()
+        failures = batch.run(self.get_args('summary'), out)
+        assert failures == 1, "Expected 1 failure, got %d" %(failures)
+        lines = out.getvalue().splitlines()
+        assert lines[0] == "%s: ERROR" %(self.broken), "Got %r" %(lines[0])
+        summaries = [line for line in lines if line.startswith(self.directory + '/a/')]
+        assert len(summaries) == 2, "Expected 2 summaries, got %s" %(summaries)
+        for line, prefix in zip(summaries, (self.fragmented, self.movie)):
+            assert line.startswith(prefix + ': '), "Got %r" %(line)
+        assert 'moof x5 mdat x5' in summaries[0], "Got %r" %(summaries[0])
+
+        out = StringIO()
+        args = self.get_args('tree')
+        args.file_list = None
+        args.paths = [self.movie]
+        failures = batch.run(args, out)
+        assert failures == 0, "Expected no failures, got %d" %(failures)
+        assert 'avcC' in out.getvalue(), "Expected the tree of %s" %(self.movie)
+
+    # An error in the parent shuts the pool down and is raised as it is
+    def runerror(self):
+        try:
+            batch.run(self.get_args('summary'), BrokenOutput())
+        except IOError as e:
+            assert str(e) == "Broken output", "Unexpected error %s" %(e)
+        else:
+            assert False, "Expected the output error to be raised"
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        test = BatchTest(directory)
+        test.run()
+        test.runerror()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
@@ -0,0 +1,89 @@
+#!/usr/bin/python
+
+from StringIO import StringIO
+
+from blockcache import BlockCache, CachedFile
+from datasource import DataBuffer
+from tests.datasource_test import Pipe
+from tests.utils import check
+
+def counters(cache):
+    return (cache.hits, cache.misses, cache.evictions)
+
+
+class BlockCacheTest(object):
+    def run(self):
+        cache = BlockCache(block_size=4, max_size=12)
+        check("empty", cache.get('a', 0), None)
+        check("counters after a miss", counters(cache), (0, 1, 0))
+        cache.put('a', 0, 'abcd')
+        cache.put('a', 1, 'efgh')
+        cache.put('b', 0, 'ijkl')
+        check("hit", cache.get('a', 0), 'abcd')
+        check("counters after a hit", counters(cache), (1, 1, 0))
+        check("size", cache.size, 12)
+
+        # a/0 was used last, so a/1 is the least recently used
+        cache.put('b', 1, 'mnop')
+        check("counters after an eviction", counters(cache), (1, 1, 1))
+        check("evicted", cache.get('a', 1), None)
+        check("kept", [cache.get(*key) for key in (('a', 0), ('b', 0), ('b', 1))],
+            ['abcd', 'ijkl', 'mnop'])
+        check("size", cache.size, 12)
+
+        # Replacing a block does not count it twice
+        cache.put('b', 1, 'qr')
+        check("size after a replace", cache.size, 10)
+        check("counters after a replace", counters(cache), (4, 2, 1))
+
+
+class CachedFileTest(object):
+    def __init__(self):
+        self.content = ''.join([chr(i % 251) for i in range(1000)])
+
+    def run(self):
+        cache = BlockCache(block_size=64, max_size=64 * 4)
+        source = CachedFile(StringIO(self.content), cache)
+        # Across a block boundary, and from the middle of one block to the
+        # middle of the next
+        for offset, size in ((0, 10), (60, 10), (120, 64), (200, 200), (990, 50)):
+            source.seek(offset)
+            actual = source.read(size)
+            check("read %d at %d" %(size, offset), actual, self.content[offset:offset + size])
+            check("position", source.tell(), offset + len(actual))
+        hits, misses, evictions = counters(cache)
+        check("blocks read", misses, 8)
+        check("evictions", evictions, 4)
+
+        # The last four blocks read are still cached
+        source.seek(256)
+        check("cached read", source.read(144), self.content[256:400])
+        check("hits", cache.hits - hits, 3)
+        check("misses", cache.misses, misses)
+        source.seek(128)
+        source.read(1)
+        check("evicted block", cache.misses, misses + 1)
+
+        # Small reads as done by DataBuffer
+        source.seek(0)
+        buf = DataBuffer(source)
+        buf.skipbytes(62)
+        check("int across blocks", buf.readint32(),
+            int(self.content[62:66].encode('hex'), 16))
+
+    # A pipe returns short reads, and blocks are still filled completely
+    def runpipe(self):
+        cache = BlockCache(block_size=64, max_size=64 * 4)
+        source = CachedFile(Pipe(StringIO(self.content)), cache)
+        check("pipe read", source.read(100), self.content[:100])
+        source.seek(300)
+        check("pipe read after skip", source.read(100), self.content[300:400])
+        check("pipe read to end", source.read(), self.content[400:])
+
+
+if __name__ == '__main__':
+    BlockCacheTest().run()
+    test = CachedFileTest()
+    test.run()
+    test.runpipe()
+    print "Success"
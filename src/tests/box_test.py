@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import argparse
+import tempfile
+
+import showboxes
+from isobmff.box import Box
+from tree import Tree
+from benchmarks import mp4gen
+
+# Nested (name, [attributes], [children]) of a Tree, for comparing trees
+def dump(node):
+    return (node.name, [(attr.name, str(attr.value), attr.display_value) for attr in node.attrs],
+        [dump(child) for child in node.children])
+
+def find_node(node, name):
+    if node.name == name:
+        return node
+    for child in node.children:
+        found = find_node(child, name)
+        if found is not None:
+            return found
+
+
+class LazyParseTest(object):
+    def __init__(self, path):
+        self.path = path
+        self.args = argparse.Namespace(structure_only=False, truncate=True)
+
+    def get_tree(self, lazy):
+        root = Tree('file', 'File')
+        with open(self.path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            for box in showboxes.iterboxes(buf, lazy=lazy):
+                showboxes.add_box(root, box, self.args)
+            buf.close()
+        return root
+
+    def run(self):
+        eager = self.get_tree(False)
+        lazy = self.get_tree(True)
+        assert dump(eager) == dump(lazy), "Lazy and eager parsing give different trees"
+
+        # Codec configuration stays under its sample entry
+        avc1 = find_node(eager, 'avc1')
+        actual = [child.name for child in avc1.children]
+        assert actual == ['avcC'], "Expected avcC under avc1, got %s" %(actual)
+        mp4a = find_node(eager, 'mp4a')
+        actual = [child.name for child in mp4a.children]
+        assert actual == ['esds'], "Expected esds under mp4a, got %s" %(actual)
+
+    def runclosed(self):
+        with open(self.path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            boxes = list(showboxes.iterboxes(buf, lazy=True))
+            buf.close()
+        moov = [box for box in boxes if box.boxtype == 'moov'][0]
+        mvhd = moov.find_child('mvhd')
+        try:
+            mvhd.timescale
+        except Exception as e:
+            assert 'source is closed' in str(e), "Unexpected error %s" %(e)
+        else:
+            assert False, "Expected an error reading a lazy box after close"
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        path = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(path, tracks=2, samples=100)
+        test = LazyParseTest(path)
+        test.run()
+        test.runclosed()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
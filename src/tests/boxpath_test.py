@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from StringIO import StringIO
+
+import showboxes
+from isobmff.boxpath import BoxSelector, select_boxes
+from isobmff.movie import VisualSampleEntry
+from benchmarks import mp4gen
+
+class BoxSelectorTest(object):
+    # (pattern, path, matches, may match below)
+    CASES = [
+        ('moov/trak/mdia/mdhd', 'moov/trak/mdia/mdhd', True, False),
+        ('moov/trak/mdia/mdhd', 'moov/trak/mdia', False, True),
+        ('moov/trak/mdia/mdhd', 'moov/trak/mdia/hdlr', False, False),
+        ('moov/trak/mdia/mdhd', 'moov/trak/mdia/mdhd/x', False, False),
+        ('moov/trak/mdia/mdhd', 'moof', False, False),
+        ('/moov/mvhd/', 'moov/mvhd', True, False),
+        ('moov/*/tkhd', 'moov/trak/tkhd', True, False),
+        ('moov/*/tkhd', 'moov/tkhd', False, True),
+        ('moov/*/tkhd', 'moov/trak', False, True),
+        ('**/pssh', 'pssh', True, True),
+        ('**/pssh', 'moov/pssh', True, True),
+        ('**/pssh', 'moof/traf/pssh', True, True),
+        ('**/pssh', 'moov/trak', False, True),
+        ('moof/**/trun', 'moof/trun', True, True),
+        ('moof/**/trun', 'moof/traf/trun', True, True),
+        ('moof/**/trun', 'moov/traf/trun', False, False),
+        ('**', 'moov/trak', True, True),
+        ('*', 'moov', True, False),
+        ('*', 'moov/trak', False, False),
+    ]
+
+    def run(self):
+        for pattern, path, matches, below in BoxSelectorTest.CASES:
+            selector = BoxSelector(pattern)
+            path = path.split('/')
+            actual = selector.matches(path)
+            assert actual == matches, "%s matches %s: expected %s" %(pattern, path, matches)
+            actual = selector.may_match_below(path)
+            assert actual == below, "%s below %s: expected %s" %(pattern, path, below)
+        # Any of several patterns
+        selector = BoxSelector(['moov/mvhd', '**/trun'])
+        assert selector.matches(['moof', 'traf', 'trun']), "Expected a match of the second pattern"
+        assert not selector.matches(['moov', 'trak']), "Expected no match"
+
+
+class SelectBoxesTest(object):
+    def __init__(self, movie, fragmented):
+        self.movie = movie
+        self.fragmented = fragmented
+
+    def select(self, path, patterns):
+        with open(path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            boxes = list(select_boxes(buf, BoxSelector(patterns)))
+            buf.close()
+        return boxes
+
+    def run(self):
+        boxes = self.select(self.movie, 'moov/trak/mdia/mdhd')
+        actual = [(box.boxtype, box.timescale) for box in boxes]
+        assert actual == [('mdhd', 25000)] * 2, "Got %s" %(actual)
+
+        boxes = self.select(self.movie, ['**/pssh', 'moov/*/tkhd'])
+        actual = [box.boxtype for box in boxes]
+        assert actual == ['tkhd', 'tkhd', 'pssh'], "Got %s" %(actual)
+
+        # A selected stsd finds the handler of its track, which was skipped
+        boxes = self.select(self.movie, 'moov/trak/mdia/minf/stbl/stsd')
+        entry = boxes[0].entries[0]
+        assert isinstance(entry, VisualSampleEntry), "Got a %s" %(type(entry).__name__)
+        # and its siblings are not parsed
+        stsz = boxes[0].parent.find_child('stsz')
+        assert stsz is None or stsz.pending_buf is not None, "Expected a lazy stsz"
+
+        boxes = self.select(self.fragmented, 'moof/traf/trun')
+        actual = [box.sample_count for box in boxes]
+        assert actual == [5] * 3, "Got %s" %(actual)
+
+    # Without strict, a parse error ends the selection like any other parse
+    def runerror(self, broken):
+        args = argparse.Namespace(structure_only=False, truncate=True, select=['**/mdat'])
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            root = showboxes.get_tree_from_file(broken, args)
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert 'Traceback' in printed, "Expected the parse error to be printed"
+        actual = [node.name for node in root.children]
+        assert actual == ['mdat'], "Expected the boxes before the error, got %s" %(actual)
+
+
+if __name__ == '__main__':
+    BoxSelectorTest().run()
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        movie = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(movie, tracks=2, samples=20)
+        fragmented = os.path.join(directory, 'fragmented.mp4')
+        mp4gen.write_fragmented(fragmented, fragments=3, samples=5)
+        test = SelectBoxesTest(movie, fragmented)
+        test.run()
+        broken = os.path.join(directory, 'broken.mp4')
+        shutil.copy(movie, broken)
+        with open(broken, 'ab') as f:
+            f.write('\x00\x00\x01')
+        test.runerror(broken)
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
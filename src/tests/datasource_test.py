@@ -1,14 +1,30 @@
 #!/usr/bin/python
 
-from datasource import DataBuffer
+from datasource import DataBuffer, MappedDataBuffer
+
+# File wrapper that cannot seek and returns short reads, like a pipe
+class Pipe(object):
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, size):
+        return self.f.read(min(size, 8))
+
+    def seek(self, offset, whence=0):
+        raise IOError("Illegal seek")
+
+    def tell(self):
+        raise IOError("Illegal seek")
+
 
 class DataBufferTest(object):
-    def __init__(self, path):
+    def __init__(self, path, buffer_class=DataBuffer):
         self.path = path
+        self.buffer_class = buffer_class
 
     def run(self):
         with open(self.path, 'rb') as f:
-            self.data_buffer = DataBuffer(f)
+            self.data_buffer = self.buffer_class(f)
 
             actual = self.data_buffer.readint32()
             value = 0xA5A5A5A5
@@ -17,6 +33,8 @@ class DataBufferTest(object):
             actual = self.data_buffer.readint64()
             value = 0xA5A5A5A5A5A5A5A5
             assert actual == value, "Expected %x, got %x" %(value, actual)
+            actual = self.data_buffer.tell()
+            assert actual == 12, "Expected offset 12, got %d" %(actual)
 
             self.checkreadbits(32, 0xA5A5A5A5)
             self.checkreadbits(16, 0xA5A5)
@@ -36,6 +54,31 @@ class DataBufferTest(object):
             self.checkreadbits(5, 0x14)
             self.checkreadbits(30, 0x2D2D2D2D)
 
+        with open(self.path, 'rb') as f:
+            self.data_buffer = self.buffer_class(f)
+
+            actual = list(self.data_buffer.readarray(2, 3))
+            value = [0xA5A5] * 3
+            assert actual == value, "Expected %s, got %s" %(value, actual)
+
+            actual = list(self.data_buffer.readarray(8, 2))
+            value = [0xA5A5A5A5A5A5A5A5] * 2
+            assert actual == value, "Expected %s, got %s" %(value, actual)
+
+            self.data_buffer.close()
+            assert self.data_buffer.isclosed(), "Expected a closed buffer"
+
+    def runpipe(self):
+        with open(self.path, 'rb') as f:
+            self.data_buffer = DataBuffer(Pipe(f))
+            self.data_buffer.skipbytes(4)
+            self.data_buffer.skipbytes(20)
+            actual = self.data_buffer.tell()
+            assert actual == 24, "Expected offset 24, got %d" %(actual)
+            actual = self.data_buffer.readint32()
+            value = 0xA5A5A5A5
+            assert actual == value, "Expected %x, got %x" %(value, actual)
+
     def checkreadbits(self, count, value):
         actual = self.data_buffer.readbits(count)
         assert actual == value, "Expected 0x%X, got 0x%X" %(value, actual)
@@ -45,4 +88,7 @@ if __name__ == '__main__':
     # The file is a sequence of 0xA5 bytes
     dbt = DataBufferTest('tests/1.dat')
     dbt.run()
+    dbt.runpipe()
+    dbt = DataBufferTest('tests/1.dat', MappedDataBuffer)
+    dbt.run()
     print "Success"
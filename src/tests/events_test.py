@@ -0,0 +1,75 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import tempfile
+
+import showboxes
+from isobmff import events
+from isobmff.box import Box
+from benchmarks import mp4gen
+
+# START and END events expected for a box of a fully parsed tree: the box,
+# the boxes found in its payload, then its children
+def expected_events(box):
+    order = [(events.START, box.boxtype)]
+    for field in box.generate_fields():
+        if isinstance(field, Box):
+            order += expected_events(field)
+    for child in box.children:
+        order += expected_events(child)
+    return order + [(events.END, box.boxtype)]
+
+
+class EventsTest(object):
+    def __init__(self, path):
+        self.path = path
+
+    def run(self):
+        with open(self.path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            expected = []
+            for box in showboxes.iterboxes(buf):
+                expected += expected_events(box)
+            buf.close()
+
+        with open(self.path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            actual = []
+            stack = []
+            ended = []
+            for event in events.iterparse(buf):
+                if event[0] == events.START:
+                    stack.append(event[1])
+                elif event[0] == events.FIELD:
+                    assert event[1] is stack[-1], "Field %s of %s while %s is open" %(
+                        event[2], event[1].boxtype, stack[-1].boxtype)
+                else:
+                    assert event[1] is stack.pop(), "End of %s out of order" %(
+                        event[1].boxtype)
+                    ended.append(event[1])
+                if event[0] != events.FIELD:
+                    actual.append((event[0], event[1].boxtype))
+            buf.close()
+        assert actual == expected, "Expected %s, got %s" %(expected, actual)
+        assert not stack, "Boxes left open: %s" %([box.boxtype for box in stack])
+
+        # Finished boxes do not hold on to their children
+        containers = [box for box in ended if box.boxtype in Box.container_boxes]
+        assert containers, "Expected container boxes"
+        for box in containers:
+            assert not box.children, "%s still has %d children" %(
+                box.boxtype, len(box.children))
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        for name, write in (('movie.mp4', lambda path: mp4gen.write_movie(path, 2, 20)),
+                ('fragmented.mp4', lambda path: mp4gen.write_fragmented(path, 3, 5))):
+            path = os.path.join(directory, name)
+            write(path)
+            EventsTest(path).run()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
@@ -0,0 +1,118 @@
+#!/usr/bin/python
+
+import struct
+from StringIO import StringIO
+
+from datasource import DataBuffer
+from isobmff.box import Box
+from isobmff.fragment import TrackFragmentHeader, TrackRunBox
+from benchmarks.mp4gen import fullbox
+from tests.utils import check
+
+def parse(data):
+    buf = DataBuffer(StringIO(data))
+    box = Box.getnextbox(buf)
+    assert buf.tell() == len(data), "Box %s left %d bytes" %(box.boxtype, len(data) - buf.tell())
+    return box
+
+
+class FragmentTest(object):
+    # Optional tfhd fields in file order: (flag, attribute, struct format, value)
+    TFHD_FIELDS = [
+        (TrackFragmentHeader.BASE_DATA_OFFSET, 'base_data_offset', 'Q', 0x123456789),
+        (TrackFragmentHeader.SAMPLE_DESCRIPTION_INDEX, 'sample_description_index', 'I', 2),
+        (TrackFragmentHeader.DEFAULT_SAMPLE_DURATION, 'default_sample_duration', 'I', 1001),
+        (TrackFragmentHeader.DEFAULT_SAMPLE_SIZE, 'default_sample_size', 'I', 4096),
+        (TrackFragmentHeader.DEFAULT_SAMPLE_FLAGS, 'default_sample_flags', 'I', 0x01010000),
+    ]
+
+    # Per sample trun columns in file order
+    TRUN_COLUMNS = [
+        (TrackRunBox.SAMPLE_DURATION, 'sample_durations', [1000, 1001, 1002]),
+        (TrackRunBox.SAMPLE_SIZE, 'sample_sizes', [100, 200, 300]),
+        (TrackRunBox.SAMPLE_FLAGS, 'sample_flags', [0x02000000, 0x01010000, 0x01010000]),
+        (TrackRunBox.SAMPLE_COMPOSITION_TIME_OFFSET, 'sample_composition_time_offsets',
+            [0, 2000, 1000]),
+    ]
+
+    def runmfhd(self):
+        box = parse(fullbox('mfhd', 0, 0, struct.pack('>I', 7)))
+        check("sequence number", box.sequence_number, 7)
+
+    def runtfhd(self):
+        # Every combination of the optional fields
+        for mask in range(1 << len(FragmentTest.TFHD_FIELDS)):
+            flags = 0
+            payload = struct.pack('>I', 3)
+            expected = {}
+            for i, (flag, name, fmt, value) in enumerate(FragmentTest.TFHD_FIELDS):
+                if mask & (1 << i):
+                    flags |= flag
+                    payload += struct.pack('>' + fmt, value)
+                    expected[name] = value
+                else:
+                    expected[name] = None
+            box = parse(fullbox('tfhd', 0, flags, payload))
+            check("track id", box.track_id, 3)
+            for name, value in expected.items():
+                check("tfhd flags 0x%x %s" %(flags, name), getattr(box, name), value)
+
+        flags = TrackFragmentHeader.DURATION_IS_EMPTY | TrackFragmentHeader.DEFAULT_BASE_IS_MOOF
+        box = parse(fullbox('tfhd', 0, flags, struct.pack('>I', 1)))
+        fields = dict([field[:2] for field in box.generate_fields()])
+        check("duration is empty", fields.get("duration is empty"), True)
+        check("default base is moof", fields.get("default base is moof"), True)
+
+    def runtfdt(self):
+        box = parse(fullbox('tfdt', 0, 0, struct.pack('>I', 90000)))
+        check("version 0 decode time", box.base_media_decode_time, 90000)
+        box = parse(fullbox('tfdt', 1, 0, struct.pack('>Q', 0x1234567890)))
+        check("version 1 decode time", box.base_media_decode_time, 0x1234567890)
+
+    def runtrun(self):
+        count = 3
+        for mask in range(1 << (2 + len(FragmentTest.TRUN_COLUMNS))):
+            flags = 0
+            payload = ''
+            if mask & 1:
+                flags |= TrackRunBox.DATA_OFFSET
+                payload += struct.pack('>i', -8)
+            if mask & 2:
+                flags |= TrackRunBox.FIRST_SAMPLE_FLAGS
+                payload += struct.pack('>I', 0x02000000)
+            columns = [column for i, column in enumerate(FragmentTest.TRUN_COLUMNS)
+                if mask & (4 << i)]
+            for flag, name, values in columns:
+                flags |= flag
+            for sample in range(count):
+                for flag, name, values in columns:
+                    payload += struct.pack('>I', values[sample])
+            box = parse(fullbox('trun', 0, flags, struct.pack('>I', count) + payload))
+            check("sample count", box.sample_count, count)
+            check("data offset", box.data_offset, -8 if mask & 1 else None)
+            check("first sample flags", box.first_sample_flags, 0x02000000 if mask & 2 else None)
+            for i, (flag, name, values) in enumerate(FragmentTest.TRUN_COLUMNS):
+                actual = getattr(box, name)
+                if mask & (4 << i):
+                    check("trun flags 0x%x %s" %(flags, name), list(actual), values)
+                else:
+                    check("trun flags 0x%x %s" %(flags, name), actual, None)
+
+        # Composition offsets are signed in version 1 and unsigned in version 0
+        offsets = [-2000, 0, 0x7FFFFFFF, -0x80000000]
+        flags = TrackRunBox.SAMPLE_COMPOSITION_TIME_OFFSET
+        payload = struct.pack('>I', len(offsets)) + struct.pack('>4i', *offsets)
+        box = parse(fullbox('trun', 1, flags, payload))
+        check("version 1 offsets", list(box.sample_composition_time_offsets), offsets)
+        box = parse(fullbox('trun', 0, flags, payload))
+        check("version 0 offsets", list(box.sample_composition_time_offsets),
+            [v & 0xFFFFFFFF for v in offsets])
+
+
+if __name__ == '__main__':
+    test = FragmentTest()
+    test.runmfhd()
+    test.runtfhd()
+    test.runtfdt()
+    test.runtrun()
+    print "Success"
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+
+import os
+import re
+import threading
+import BaseHTTPServer
+
+from datasource import DataBuffer
+from httpsource import HttpRangeFile
+
+# Serves one string with support for single byte ranges over keep-alive
+# connections, counting connections and requests.
+class RangeHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    RANGE = re.compile(r'bytes=(\d+)-(\d*)')
+
+    def setup(self):
+        BaseHTTPServer.BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_GET(self):
+        self.server.requests += 1
+        content = self.server.content
+        match = RangeHandler.RANGE.match(self.headers.get('Range', ''))
+        if match is None:
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+            return
+        start = int(match.group(1))
+        end = int(match.group(2)) + 1 if match.group(2) else len(content)
+        end = min(end, len(content))
+        if start >= len(content):
+            self.send_response(416)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206)
+        total = '*' if self.server.hide_size else str(len(content))
+        self.send_header('Content-Range', 'bytes %d-%d/%s' %(start, end - 1, total))
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        self.wfile.write(content[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpRangeFileTest(object):
+    def __init__(self, content):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), RangeHandler)
+        self.server.content = content
+        self.server.connections = 0
+        self.server.requests = 0
+        self.server.hide_size = False
+        self.url = 'http://127.0.0.1:%d/test.mp4' %(self.server.server_port)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def run(self):
+        content = self.server.content
+        source = HttpRangeFile(self.url, block_size=1024)
+        assert source.size == len(content), "Expected size %d, got %s" %(len(content), source.size)
+
+        # Sequential small reads are served from one block
+        buf = DataBuffer(source)
+        actual = buf.readint32()
+        assert actual == 0x00010203, "Expected %x, got %x" %(0x00010203, actual)
+        for i in range(100):
+            buf.readint32()
+        assert source.requests == 1, "Expected 1 request, got %d" %(source.requests)
+
+        # Skipping fetches nothing until the next read at the tail
+        buf.skipbytes(len(content) - 16 - buf.tell())
+        assert source.requests == 1, "Expected 1 request, got %d" %(source.requests)
+        actual = buf.readstr(16)
+        assert actual == content[-16:], "Expected %r, got %r" %(content[-16:], actual)
+        assert source.requests == 2, "Expected 2 requests, got %d" %(source.requests)
+        assert source.bytes_fetched < 4096, "Fetched %d bytes" %(source.bytes_fetched)
+        assert not buf.hasmore(), "Expected end of data"
+
+        # Seeking back re-fetches over the same connection
+        buf.seek(1000)
+        actual = buf.readbyte()
+        assert actual == ord(content[1000]), "Expected %d, got %d" %(ord(content[1000]), actual)
+        assert self.server.connections == 1, "Expected 1 connection, got %d" %(
+            self.server.connections)
+        source.close()
+
+    # Without a total in Content-Range the size is unknown and seeking from
+    # the end is an I/O error
+    def runnosize(self):
+        self.server.hide_size = True
+        source = HttpRangeFile(self.url, block_size=1024)
+        assert source.size is None, "Expected an unknown size, got %s" %(source.size)
+        try:
+            source.seek(0, os.SEEK_END)
+        except IOError as e:
+            assert 'did not give its size' in str(e), "Unexpected error %s" %(e)
+        else:
+            assert False, "Expected seeking from the end to fail"
+        source.seek(10)
+        actual = source.read(4)
+        content = self.server.content
+        assert actual == content[10:14], "Expected %r, got %r" %(content[10:14], actual)
+        source.close()
+        self.server.hide_size = False
+
+    def shutdown(self):
+        self.server.shutdown()
+
+
+if __name__ == '__main__':
+    content = ''.join(chr(i % 256) for i in range(1024 * 1024))
+    test = HttpRangeFileTest(content)
+    test.run()
+    test.runnosize()
+    test.shutdown()
+    print "Success"
@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+from StringIO import StringIO
+
+import showboxes
+from indexcache import IndexCache
+from isobmff.samples import find_box
+from benchmarks import mp4gen
+from tests.box_test import dump
+
+class IndexCacheTest(object):
+    def __init__(self, directory):
+        self.directory = directory
+        self.cache_dir = os.path.join(directory, 'cache')
+        self.path = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(self.path, tracks=2, samples=100)
+
+    def get_args(self, **options):
+        args = argparse.Namespace(structure_only=False, truncate=True, cache=self.cache_dir,
+            cache_size=64, cache_fingerprint=False, cache_tables=False)
+        for name, value in options.items():
+            setattr(args, name, value)
+        return args
+
+    def get_cache(self, args):
+        return showboxes.get_index_cache(args)
+
+    def entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return sorted(os.listdir(self.cache_dir))
+
+    def load(self, args, path=None):
+        path = path or self.path
+        with open(path, 'rb') as fd:
+            buf = showboxes.get_buffer(fd)
+            return self.get_cache(args).load(path, buf)
+
+    def clear(self):
+        if os.path.isdir(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def run(self):
+        expected = dump(showboxes.get_tree_from_file(self.path,
+            argparse.Namespace(structure_only=False, truncate=True), True))
+        for tables in (False, True):
+            self.clear()
+            args = self.get_args(cache_tables=tables)
+            assert self.load(args) is None, "Expected a miss on an empty cache"
+            actual = dump(showboxes.get_tree_from_file(self.path, args))
+            assert actual == expected, "First run differs from an uncached parse"
+            assert len(self.entries()) == 1, "Expected one entry, got %s" %(self.entries())
+            boxes = self.load(args)
+            assert boxes is not None, "Expected a hit"
+            stsz = find_box(boxes[1], 'trak/mdia/minf/stbl/stsz')
+            # Stored tables are set on the box, the rest stays lazy
+            assert (stsz.pending_buf is None) == tables, "Tables stored: %s" %(tables)
+            actual = dump(showboxes.get_tree_from_file(self.path, args))
+            assert actual == expected, "Cached run differs from an uncached parse"
+
+    # Damaged or mismatched entries are misses and are replaced
+    def runinvalid(self):
+        self.clear()
+        args = self.get_args(cache_tables=True)
+        showboxes.get_tree_from_file(self.path, args)
+        entry = os.path.join(self.cache_dir, self.entries()[0])
+        with open(entry, 'rb') as f:
+            data = f.read()
+        header = IndexCache.HEADER.size
+        damaged = [
+            data[:header - 4],
+            data[:len(data) - 10],
+            data[:header] + chr(ord(data[header]) ^ 1) + data[header + 1:],
+            data[:4] + '\x00\x01' + data[6:],
+            'garbage',
+        ]
+        for data in damaged:
+            with open(entry, 'wb') as f:
+                f.write(data)
+            assert self.load(args) is None, "Expected a miss on a damaged entry"
+        showboxes.get_tree_from_file(self.path, args)
+        assert self.load(args) is not None, "Expected the entry to be replaced"
+
+        # An entry of another file under the key of this one
+        other = os.path.join(self.directory, 'other.mp4')
+        mp4gen.write_movie(other, tracks=1, samples=50)
+        args = self.get_args(cache_fingerprint=True)
+        showboxes.get_tree_from_file(self.path, args)
+        cache = self.get_cache(args)
+        shutil.copy(cache.entry_path(self.path), cache.entry_path(other))
+        assert self.load(args, other) is None, "Expected a miss for a different file"
+
+        # Without fingerprints the modification time has to match as well
+        args = self.get_args()
+        showboxes.get_tree_from_file(self.path, args)
+        cache = self.get_cache(args)
+        entry = cache.entry_path(self.path)
+        st = os.stat(self.path)
+        os.utime(self.path, (st.st_atime, st.st_mtime + 10))
+        shutil.copy(entry, cache.entry_path(self.path))
+        assert self.load(args) is None, "Expected a miss after the file changed"
+
+    # A parse that stopped on an error is not stored, and --select does not
+    # use the cache
+    def runincomplete(self):
+        self.clear()
+        broken = os.path.join(self.directory, 'broken.mp4')
+        shutil.copy(self.path, broken)
+        with open(broken, 'ab') as f:
+            f.write('\x00\x00\x01')
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            showboxes.get_tree_from_file(broken, self.get_args())
+            printed = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        assert 'Traceback' in printed, "Expected the parse error to be printed"
+        assert self.entries() == [], "Expected no entry, got %s" %(self.entries())
+
+        showboxes.get_tree_from_file(self.path, self.get_args(select=['moov/mvhd']))
+        assert self.entries() == [], "Expected no entry, got %s" %(self.entries())
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        test = IndexCacheTest(directory)
+        test.run()
+        test.runinvalid()
+        test.runincomplete()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+
+import os
+import json
+import struct
+import shutil
+import argparse
+import tempfile
+from array import array
+from StringIO import StringIO
+
+import showboxes
+from jsonoutput import json_value, JsonWriter, NdjsonWriter
+from benchmarks import mp4gen
+from tests.showboxes_test import capture
+from tests.utils import check
+
+# Nested (type, [children]) of the boxes of a JSON document or a Tree
+def json_types(box):
+    return (box['type'], [json_types(child) for child in box.get('children', [])])
+
+# (path, box) of every box of a JSON document, depth first
+def flatten(boxes, parent=''):
+    result = []
+    for box in boxes:
+        path = parent + box['type']
+        result.append((path, box))
+        result += flatten(box.get('children', []), path + '/')
+    return result
+
+def tree_types(node):
+    return (node.name, [tree_types(child) for child in node.children])
+
+class FakeBox(object):
+    def __init__(self, boxtype):
+        self.boxtype = boxtype
+
+
+# A PlayReady pssh with one object record of UTF-16 text
+def playready_pssh():
+    record = u'<WRMHEADER/>'.encode('utf-16-le')
+    data = struct.pack('<HH', 1, len(record)) + record
+    data = struct.pack('<IH', 6 + len(data), 1) + data
+    return mp4gen.box('pssh', struct.pack('>I', 0) + PLAYREADY_SYSTEM_ID.decode('hex') +
+        struct.pack('>I', len(data)) + data), record
+
+PLAYREADY_SYSTEM_ID = '9a04f07998404286ab92e65be0885f95'
+
+
+class JsonValueTest(object):
+    VALUES = [
+        (None, 'null'),
+        (True, 'true'),
+        (7, '7'),
+        (1 << 40, str(1 << 40)),
+        (1.5, '1.5'),
+        (array('I', [1, 2, 3]), '[1,2,3]'),
+        (array('d', [0.5]), '[0.5]'),
+        (array('c', 'avc1'), '"avc1"'),
+        ([1, 'a', [2]], '[1,"a",[2]]'),
+        ('text', '"text"'),
+        (u'\u00e9t\u00e9', '"\\u00e9t\\u00e9"'),
+        ('\xc3\xa9', '"\\u00e9"'),
+        ('\xff\x00\x10', '{"hex":"ff0010"}'),
+    ]
+
+    def run(self):
+        for value, expected in JsonValueTest.VALUES:
+            check("value %r" %(value,), json_value(value), expected)
+
+        # Through the writer, next to a text field
+        out = StringIO()
+        writer = JsonWriter(out)
+        writer.begin('test.mp4')
+        writer.start_box(FakeBox('uuid'))
+        writer.add_field('name', 'abc')
+        writer.add_field('data', '\x80\x81', 'data')
+        writer.end_box()
+        writer.finish()
+        box = json.loads(out.getvalue())['boxes'][0]
+        check("text field", box['fields']['name'], 'abc')
+        check("binary field", box['fields']['data'], {'hex': '8081'})
+        check("display", box['display'], {'data': 'data'})
+
+
+class JsonOutputTest(object):
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, writer_class, **options):
+        args = argparse.Namespace(structure_only=False, truncate=True)
+        for name, value in options.items():
+            setattr(args, name, value)
+        out = StringIO()
+        showboxes.write_json(self.path, args, writer_class(out))
+        return out.getvalue()
+
+    def run(self):
+        tree = showboxes.get_tree_from_file(self.path,
+            argparse.Namespace(structure_only=False, truncate=True), True)
+        expected = [tree_types(child) for child in tree.children]
+
+        document = json.loads(self.write(JsonWriter))
+        check("file", document['file'], os.path.basename(self.path))
+        check("box tree", [json_types(box) for box in document['boxes']], expected)
+        moov = [box for box in document['boxes'] if box['type'] == 'moov'][0]
+        mvhd = moov['children'][0]
+        check("mvhd timescale", mvhd['fields']['timescale'], 1000)
+
+        # One line per box, in the same depth first order
+        lines = self.write(NdjsonWriter).splitlines()
+        boxes = [json.loads(line) for line in lines]
+        paths = [path for path, box in flatten(document['boxes'])]
+        check("ndjson paths", [box['path'] for box in boxes], paths)
+        check("ndjson fields", [box['fields'] for box in boxes if box['type'] == 'mvhd'],
+            [mvhd['fields']])
+
+        # Structure only: the same boxes with their positions and no fields
+        for writer_class in (JsonWriter, NdjsonWriter):
+            text = self.write(writer_class, structure_only=True)
+            if writer_class is JsonWriter:
+                structure = json.loads(text)
+                check("structure only tree", [json_types(box) for box in structure['boxes']],
+                    expected)
+                boxes = [box for path, box in flatten(structure['boxes'])]
+            else:
+                boxes = [json.loads(line) for line in text.splitlines()]
+            check("structure only box count", len(boxes), len(paths))
+            for box in boxes:
+                check("%s fields" %(box['type']), box['fields'], {})
+                check("%s display" %(box['type']), 'display' in box, False)
+                check("%s offset" %(box['type']), box['offset'] is not None, True)
+
+
+# Nothing but the document is written to stdout, whatever the DRM data
+class PsshOutputTest(object):
+    def __init__(self, path):
+        self.path = path
+        mp4gen.write_movie(path, tracks=1, samples=10)
+        # Before moov, where probe still looks for pssh boxes
+        pssh, self.record = playready_pssh()
+        with open(path, 'rb') as f:
+            data = f.read()
+        ftyp_size = struct.unpack('>I', data[:4])[0]
+        with open(path, 'wb') as f:
+            f.write(data[:ftyp_size] + pssh + data[ftyp_size:])
+
+    def run(self):
+        args = argparse.Namespace(structure_only=False, truncate=True)
+        for writer_class in (JsonWriter, NdjsonWriter):
+            # The writer is made inside capture to write to its stdout
+            result, out, err = capture(lambda: showboxes.write_json(self.path, args,
+                writer_class()))
+            if writer_class is JsonWriter:
+                boxes = [box for path, box in flatten(json.loads(out)['boxes'])]
+            else:
+                boxes = [json.loads(line) for line in out.splitlines()]
+            data = [box for box in boxes if box['type'] == 'PlayReady data']
+            check("%s PlayReady boxes" %(writer_class.__name__), len(data), 1)
+            check("%s PlayReady record" %(writer_class.__name__),
+                data[0]['fields']['Record 1'], self.record)
+
+        result, out, err = capture(showboxes.probe_file, self.path, 'json')
+        check("probe drm", json.loads(out)['drm'], [PLAYREADY_SYSTEM_ID,
+            '1077efecc0b24d02ace33c1e52e2fb4b'])
+
+
+if __name__ == '__main__':
+    JsonValueTest().run()
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        PsshOutputTest(os.path.join(directory, 'playready.mp4')).run()
+        for name, write in (('movie.mp4', lambda path: mp4gen.write_movie(path, 2, 50)),
+                ('fragmented.mp4', lambda path: mp4gen.write_fragmented(path, 3, 20))):
+            path = os.path.join(directory, name)
+            write(path)
+            JsonOutputTest(path).run()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
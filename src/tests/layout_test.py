@@ -0,0 +1,156 @@
+#!/usr/bin/python
+
+import random
+import struct
+from StringIO import StringIO
+
+from datasource import DataBuffer
+from isobmff.movie import (MovieHeader, TrackHeader, MediaHeader, HandlerBox, SampleEntry,
+    VisualSampleEntry, AudioSampleEntry)
+
+# The boxes whose fields are declared with a Layout are checked against
+# field by field parsers like the ones they replaced, on random payloads.
+# Each reference parser reads what follows the box header (and the version
+# and flags of full boxes) and returns the fields it found.
+
+def read_times(buf, version):
+    if version == 1:
+        return buf.readint64(), buf.readint64()
+    return buf.readint32(), buf.readint32()
+
+def read_duration(buf, version):
+    return buf.readint64() if version == 1 else buf.readint32()
+
+def read_matrix(buf):
+    return [[buf.readint32() for j in range(3)] for i in range(3)]
+
+def reference_mvhd(buf, version):
+    fields = {}
+    fields['creation_time'], fields['modification_time'] = read_times(buf, version)
+    fields['timescale'] = buf.readint32()
+    fields['duration'] = read_duration(buf, version)
+    fields['rate'] = buf.readint32()
+    fields['volume'] = buf.readint16()
+    buf.skipbytes(2 + 8)
+    fields['matrix'] = read_matrix(buf)
+    buf.skipbytes(24)
+    fields['next_track_id'] = buf.readint32()
+    return fields
+
+def reference_tkhd(buf, version):
+    fields = {}
+    fields['creation_time'], fields['modification_time'] = read_times(buf, version)
+    fields['track_id'] = buf.readint32()
+    buf.skipbytes(4)
+    fields['duration'] = read_duration(buf, version)
+    buf.skipbytes(8)
+    fields['layer'] = buf.readint16()
+    fields['altgroup'] = buf.readint16()
+    fields['volume'] = buf.readint16()
+    buf.skipbytes(2)
+    fields['matrix'] = read_matrix(buf)
+    fields['width'] = buf.readint32()
+    fields['height'] = buf.readint32()
+    return fields
+
+def reference_mdhd(buf, version):
+    fields = {}
+    fields['creation_time'], fields['modification_time'] = read_times(buf, version)
+    fields['timescale'] = buf.readint32()
+    fields['duration'] = read_duration(buf, version)
+    fields['language'] = buf.readint16() & 0x7FFF
+    buf.skipbytes(2)
+    return fields
+
+def reference_hdlr(buf, version):
+    buf.skipbytes(4)
+    fields = {'handler': buf.readstr(4)}
+    buf.skipbytes(12)
+    return fields
+
+def reference_entry(buf):
+    buf.skipbytes(6)
+    return {'data_ref_index': buf.readint16()}
+
+def reference_visual(buf, version):
+    fields = reference_entry(buf)
+    buf.skipbytes(2 + 2 + 3 * 4)
+    fields['width'] = buf.readint16()
+    fields['height'] = buf.readint16()
+    fields['hori_resolution'] = buf.readint32()
+    fields['vert_resolution'] = buf.readint32()
+    buf.skipbytes(4)
+    fields['frame_count'] = buf.readint16()
+    length = buf.readbyte()
+    fields['compressor_name'] = buf.readstr(length) if length else ''
+    buf.skipbytes(32 - length - 1)
+    fields['depth'] = buf.readint16()
+    buf.skipbytes(2)
+    return fields
+
+def reference_audio(buf, version):
+    fields = reference_entry(buf)
+    buf.skipbytes(8)
+    fields['channel_count'] = buf.readint16()
+    fields['sample_size'] = buf.readint16()
+    buf.skipbytes(4)
+    fields['sample_rate'] = buf.readint32()
+    return fields
+
+def random_bytes(rng, count):
+    return ''.join([chr(rng.randrange(256)) for i in range(count)])
+
+def visual_payload(rng, size):
+    # The compressor name is a length byte and up to 31 bytes
+    payload = random_bytes(rng, size)
+    return payload[:42] + chr(rng.randrange(32)) + payload[43:]
+
+
+class LayoutTest(object):
+    # (box class, type, full box, versions, payload size by version,
+    # reference parser, payload function)
+    BOXES = [
+        (MovieHeader, 'mvhd', True, (0, 1), {0: 96, 1: 108}, reference_mvhd, random_bytes),
+        (TrackHeader, 'tkhd', True, (0, 1), {0: 80, 1: 92}, reference_tkhd, random_bytes),
+        (MediaHeader, 'mdhd', True, (0, 1), {0: 20, 1: 32}, reference_mdhd, random_bytes),
+        (HandlerBox, 'hdlr', True, (0,), {0: 20}, reference_hdlr, random_bytes),
+        (SampleEntry, 'mp4v', False, (0,), {0: 8}, lambda buf, version: reference_entry(buf),
+            random_bytes),
+        (VisualSampleEntry, 'avc1', False, (0,), {0: 78}, reference_visual, visual_payload),
+        (AudioSampleEntry, 'mp4a', False, (0,), {0: 28}, reference_audio, random_bytes),
+    ]
+
+    def __init__(self, seed=23):
+        self.rng = random.Random(seed)
+
+    def check(self, box_class, boxtype, full, version, payload, reference):
+        header = struct.pack('>I4s', 8 + (4 if full else 0) + len(payload) + 1, boxtype)
+        if full:
+            header += struct.pack('>I', version << 24 | self.rng.randrange(1 << 24))
+        # A trailing byte, the empty name of a handler
+        data = header + payload + '\0'
+
+        buf = DataBuffer(StringIO(data))
+        box = box_class(buf, None)
+        expected_buf = DataBuffer(StringIO(data))
+        expected_buf.skipbytes(len(header))
+        expected = reference(expected_buf, version)
+        for name, value in expected.items():
+            actual = getattr(box, name)
+            assert actual == value, "%s version %d %s: expected %r, got %r" %(
+                boxtype, version, name, value, actual)
+        position = len(data) if box_class is HandlerBox else expected_buf.tell()
+        assert buf.tell() == position, "%s version %d: read up to %d, expected %d" %(
+            boxtype, version, buf.tell(), position)
+
+    def run(self):
+        for box_class, boxtype, full, versions, sizes, reference, payload in LayoutTest.BOXES:
+            for version in versions:
+                for i in range(50):
+                    self.check(box_class, boxtype, full, version,
+                        payload(self.rng, sizes[version]), reference)
+
+
+if __name__ == '__main__':
+    LayoutTest().run()
+    print "Success"
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+
+import random
+import struct
+from StringIO import StringIO
+
+from datasource import DataBuffer
+from isobmff.box import Box
+from benchmarks.mp4gen import fullbox
+
+# Values packed most significant bit first, the last byte padded with zeros
+def pack_bits(values, field_size):
+    bits = ''.join([bin(value)[2:].zfill(field_size) for value in values])
+    bits += '0' * (-len(bits) % 8)
+    return ''.join([chr(int(bits[i:i + 8], 2)) for i in range(0, len(bits), 8)])
+
+
+class CompactSampleSizeTest(object):
+    def __init__(self, seed=24):
+        self.rng = random.Random(seed)
+
+    def check(self, field_size, values):
+        payload = '\0\0\0' + chr(field_size) + struct.pack('>I', len(values))
+        data = fullbox('stz2', 0, 0, payload + pack_bits(values, field_size))
+        buf = DataBuffer(StringIO(data))
+        box = Box.getnextbox(buf)
+        name = "%d bit stz2 of %d samples" %(field_size, len(values))
+        assert buf.tell() == len(data), "%s: left %d bytes" %(name, len(data) - buf.tell())
+        assert box.field_size == field_size, "%s: field size %d" %(name, box.field_size)
+        assert box.sample_count == len(values), "%s: count %d" %(name, box.sample_count)
+        assert list(box.entries) == values, "%s: expected %s, got %s" %(
+            name, values[:20], list(box.entries)[:20])
+        fields = dict([field[:2] for field in box.generate_fields()])
+        assert fields['sample count'] == len(values), "%s: fields %s" %(name, fields)
+
+    def run(self):
+        # Odd counts leave half of the last byte of a 4 bit table as padding
+        for count in (0, 1, 2, 3, 15, 16, 1001):
+            self.check(4, [self.rng.randrange(16) for i in range(count)])
+        self.check(4, [15] * 7)
+        for field_size in (8, 16):
+            for count in (0, 1, 3, 1000):
+                self.check(field_size, [self.rng.randrange(1 << field_size)
+                    for i in range(count)])
+            self.check(field_size, [0, (1 << field_size) - 1, 1 << (field_size - 1)])
+        # Not allowed by the spec, but read bit by bit
+        self.check(12, [self.rng.randrange(1 << 12) for i in range(5)])
+
+
+if __name__ == '__main__':
+    CompactSampleSizeTest().run()
+    print "Success"
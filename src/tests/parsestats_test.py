@@ -0,0 +1,139 @@
+#!/usr/bin/python
+
+import os
+import shutil
+import argparse
+import tempfile
+
+import showboxes
+from datasource import DataBuffer, MappedDataBuffer
+from isobmff.box import Box
+from parsestats import ParseStats
+from benchmarks import mp4gen
+from tests.showboxes_test import capture
+from tests.utils import check
+
+# Clock that moves one second per call, so that times are exact
+class Clock(object):
+    def __init__(self):
+        self.time = 0
+
+    def __call__(self):
+        self.time += 1
+        return self.time
+
+def box_sizes(boxes, boxtype):
+    sizes = []
+    for box in boxes:
+        if box.boxtype == boxtype:
+            sizes.append(box.size)
+        sizes += box_sizes(box.children, boxtype)
+    return sizes
+
+
+class ParseStatsTest(object):
+    def __init__(self, path, broken_path):
+        self.path = path
+        self.broken_path = broken_path
+
+    def parse(self, buffer_class, path, lazy=False):
+        stats = ParseStats(Clock())
+        with open(path, 'rb') as fd:
+            buf = buffer_class(fd)
+            stats.install(buf)
+            try:
+                boxes = list(showboxes.iterboxes(buf, lazy=lazy))
+            finally:
+                stats.uninstall(buf)
+                buf.close()
+        return stats, boxes
+
+    # Both buffers count the same boxes and the reads of their payloads
+    def run(self):
+        for buffer_class in (MappedDataBuffer, DataBuffer):
+            name = buffer_class.__name__
+            stats, boxes = self.parse(buffer_class, self.path)
+            check("%s open boxes" %(name), stats.open, [])
+            check("%s trak count" %(name), stats.get('trak').count, 2)
+            stsz = box_sizes(boxes, 'stsz')
+            check("%s stsz bytes" %(name), stats.get('stsz').bytes, sum(stsz))
+            # The chunked reader may have read the start of a table with the
+            # boxes before it
+            check("%s stsz bytes read" %(name), stats.get('stsz').bytes_read > sum(stsz) / 2, True)
+            check("%s mdat skipped" %(name), stats.get('mdat').bytes_skipped > 0, True)
+
+            # Every tick is in the self time of exactly one box or outside
+            # of all of them
+            self_time = sum([row.parse_time for row in stats.rows()])
+            top_time = sum([stats.get(box.boxtype).total_time for box in boxes])
+            check("%s self time of all boxes" %(name), self_time, top_time)
+            for row in stats.rows():
+                check("%s %s total time" %(name, row.boxtype),
+                    row.total_time >= row.parse_time, True)
+
+        # --stats profiles the memory mapped buffer used without it
+        expected, boxes = self.parse(MappedDataBuffer, self.path)
+        stats = ParseStats(Clock())
+        args = argparse.Namespace(structure_only=False, truncate=True)
+        root, out, err = capture(showboxes.get_tree_from_file, self.path, args, True, stats)
+        check("stsz reads", stats.get('stsz').reads, expected.get('stsz').reads)
+        check("report", err.startswith('box '), True)
+        check("uninstalled", Box.stats, None)
+
+    # A box whose parse fails is left, so later boxes are charged correctly
+    def runerrors(self):
+        for buffer_class in (MappedDataBuffer, DataBuffer):
+            name = buffer_class.__name__
+            try:
+                self.parse(buffer_class, self.broken_path)
+            except Exception:
+                pass
+            else:
+                assert False, "%s: expected the broken mvhd to fail" %(name)
+            check("%s uninstalled" %(name), Box.stats, None)
+
+            stats = ParseStats(Clock())
+            with open(self.broken_path, 'rb') as fd:
+                buf = buffer_class(fd)
+                stats.install(buf)
+                try:
+                    try:
+                        list(showboxes.iterboxes(buf))
+                    except Exception:
+                        pass
+                    check("%s open boxes after a failed parse" %(name), stats.open, [])
+                    check("%s failed box counted" %(name), stats.get('mvhd').count, 1)
+                    check("%s parent counted" %(name), stats.get('moov').count, 1)
+
+                    # The same box parsed lazily fails when it is loaded
+                    buf.seek(0)
+                    boxes = list(showboxes.iterboxes(buf, lazy=True))
+                    mvhd = boxes[-1].find_child('mvhd')
+                    try:
+                        mvhd.timescale
+                    except Exception:
+                        pass
+                    else:
+                        assert False, "%s: expected the lazy mvhd to fail" %(name)
+                    check("%s open boxes after a failed load" %(name), stats.open, [])
+                finally:
+                    stats.uninstall(buf)
+                    buf.close()
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        path = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(path, tracks=2, samples=100)
+        # A movie header shorter than its fields, at the end of the file
+        broken_path = os.path.join(directory, 'broken.mp4')
+        with open(broken_path, 'wb') as f:
+            f.write(mp4gen.box('ftyp', 'isom' + '\0' * 4) +
+                mp4gen.box('moov', mp4gen.fullbox('mvhd', 0, 0, '\0' * 8)))
+        test = ParseStatsTest(path, broken_path)
+        test.run()
+        test.runerrors()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
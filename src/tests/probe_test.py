@@ -0,0 +1,58 @@
+#!/usr/bin/python
+
+import os
+import json
+import shutil
+import tempfile
+
+import showboxes
+from benchmarks import mp4gen
+from tests.showboxes_test import capture, with_piped_stdin
+from tests.utils import check
+
+class ProbeTest(object):
+    def __init__(self, path, encrypted_path):
+        self.path = path
+        self.encrypted_path = encrypted_path
+
+    def probe(self, path):
+        result, out, err = capture(showboxes.probe_file, path, 'json')
+        return json.loads(out)
+
+    def run(self):
+        info = self.probe(self.path)
+        check("brands", info['brands'], ['isom', 'iso2', 'avc1', 'mp41'])
+        check("codecs", [track['codec'] for track in info['tracks']], ['avc1', 'mp4a'])
+
+        # stdin cannot seek back to lazy boxes
+        piped = with_piped_stdin(self.path, self.probe, '-')
+        check("probe of a pipe", piped, info)
+        check("scheme of clear tracks", ['scheme' in track for track in info['tracks']],
+            [False, False])
+
+        # encv/enca entries report the codec of sinf/frma and the schm scheme
+        info = self.probe(self.encrypted_path)
+        check("encrypted codecs", [track['codec'] for track in info['tracks']],
+            ['avc1', 'mp4a'])
+        check("schemes", [track['scheme'] for track in info['tracks']], ['cbcs', 'cbcs'])
+        check("encrypted dimensions", (info['tracks'][0]['width'],
+            info['tracks'][0]['height']), (640, 480))
+        result, out, err = capture(showboxes.probe_file, self.encrypted_path, 'stdout')
+        lines = out.splitlines()
+        check("video line", lines[3],
+            "track 1: vide avc1 640x480 encrypted cbcs eng 4.000s (100000)")
+        check("audio line", lines[4],
+            "track 2: soun mp4a 48000Hz 2ch encrypted cbcs eng 4.000s (100000)")
+
+
+if __name__ == '__main__':
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        path = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(path, tracks=2, samples=100)
+        encrypted_path = os.path.join(directory, 'encrypted.mp4')
+        mp4gen.write_movie(encrypted_path, tracks=2, samples=100, scheme='cbcs')
+        ProbeTest(path, encrypted_path).run()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
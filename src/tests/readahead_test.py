@@ -0,0 +1,165 @@
+#!/usr/bin/python
+
+import time
+import struct
+import threading
+from StringIO import StringIO
+
+from readahead import ReadAheadFile
+from benchmarks.mp4gen import box
+from tests.utils import check
+
+def pattern(size, seed):
+    return ''.join([chr((seed + i * 7) % 256) for i in range(size)])
+
+# Top level boxes around two mdats, one with a 64 bit size, and their offsets
+def build_file():
+    boxes = [
+        box('ftyp', 'isom' + '\0' * 12),
+        box('free', pattern(200, 1)),
+        box('mdat', pattern(1000, 2)),
+        box('moov', pattern(300, 3)),
+        struct.pack('>I4sQ', 1, 'mdat', 16 + 500) + pattern(500, 4),
+        box('free', pattern(100, 5)),
+    ]
+    offsets = []
+    offset = 0
+    for data in boxes:
+        offsets.append(offset)
+        offset += len(data)
+    return ''.join(boxes), offsets
+
+def wait_for(condition, name):
+    for i in range(500):
+        if condition():
+            return
+        time.sleep(0.01)
+    assert False, "Timed out waiting for %s" %(name)
+
+
+class Source(StringIO):
+    def __init__(self, data, delay=0):
+        StringIO.__init__(self, data)
+        self.delay = delay
+
+    def read(self, size=-1):
+        if self.delay:
+            time.sleep(self.delay)
+        return StringIO.read(self, size)
+
+class Pipe(Source):
+    def read(self, size=-1):
+        return Source.read(self, min(size, 8))
+
+    def seek(self, offset, whence=0):
+        raise IOError("Illegal seek")
+
+    def tell(self):
+        raise IOError("Illegal seek")
+
+# Source whose reads block until released, once entered is set
+class BlockingSource(Source):
+    def __init__(self, data):
+        Source.__init__(self, data)
+        self.entered = threading.Event()
+        self.release = threading.Event()
+
+    def read(self, size=-1):
+        self.entered.set()
+        self.release.wait()
+        return Source.read(self, size)
+
+
+class ReadAheadTest(object):
+    def __init__(self):
+        self.data, self.offsets = build_file()
+
+    # Every read returns the size asked for up to the end, including reads
+    # that cross regions and the end of an mdat header
+    def runreads(self):
+        for source_class in (Source, Pipe):
+            for size in (1, 7, 16, 50, 64, 100, 1000):
+                f = ReadAheadFile(source_class(self.data), region_size=64)
+                parts = []
+                while True:
+                    data = f.read(size)
+                    expected = min(size, len(self.data) - f.tell() + len(data))
+                    check("%s read of %d" %(source_class.__name__, size), len(data), expected)
+                    if not data:
+                        break
+                    parts.append(data)
+                f.close()
+                check("%s content in reads of %d" %(source_class.__name__, size),
+                    ''.join(parts) == self.data, True)
+
+        for offset in self.offsets:
+            f = ReadAheadFile(Source(self.data), region_size=64)
+            f.seek(offset)
+            check("read at %d" %(offset), f.read(40), self.data[offset:offset + 40])
+            f.close()
+
+    # Walking the boxes by their headers does not read the mdat payloads
+    # and, with boxes shorter than a region, does not restart
+    def runskip(self):
+        f = ReadAheadFile(Source(self.data), region_size=256)
+        for offset in self.offsets:
+            f.seek(offset)
+            size, boxtype = struct.unpack('>I4s', f.read(8))
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+            check("box at %d" %(offset), offset + size in self.offsets + [len(self.data)], True)
+        check("restarts", f.restarts, 0)
+        # 16 bytes are read at each header, so 8 of the first payload
+        check("bytes skipped", f.bytes_skipped, 1000 - 8 + 500)
+        f.close()
+
+    # Seeks while the worker is prefetching restart it at the new position
+    def runseek(self):
+        f = ReadAheadFile(Source(self.data, delay=0.002), region_size=32)
+        check("first read", f.read(10), self.data[:10])
+        for offset in (1500, 5, 900, 200, 1600, 0):
+            f.seek(offset)
+            check("read after seek to %d" %(offset), f.read(50), self.data[offset:offset + 50])
+        check("restarts", f.restarts >= 3, True)
+        f.seek(len(self.data) - 10)
+        check("read to end", f.read(), self.data[-10:])
+        check("read at end", f.read(10), '')
+        f.close()
+
+    def runclose(self):
+        # Waiting for the reader to take a region
+        source = Source(self.data)
+        f = ReadAheadFile(source, region_size=64, depth=2)
+        f.read(1)
+        wait_for(lambda: len(f.regions) == 2, "the prefetched regions")
+        f.close()
+        check("worker stopped", f.worker.is_alive(), False)
+        check("source closed", source.closed, True)
+
+        # Waiting at the end of the data
+        source = Source(self.data[:100])
+        f = ReadAheadFile(source, region_size=64)
+        check("short file", f.read(), self.data[:100])
+        f.close()
+        check("worker stopped at the end", f.worker.is_alive(), False)
+
+        # Blocked in a read of the source: close returns, and the worker
+        # closes the source once the read ends
+        source = BlockingSource(self.data)
+        f = ReadAheadFile(source, region_size=64)
+        source.entered.wait(5)
+        f.close()
+        check("source left open", source.closed, False)
+        source.release.set()
+        f.worker.join(5)
+        check("worker stopped after the read", f.worker.is_alive(), False)
+        check("source closed after the read", source.closed, True)
+
+
+if __name__ == '__main__':
+    test = ReadAheadTest()
+    test.runreads()
+    test.runskip()
+    test.runseek()
+    test.runclose()
+    print "Success"
@@ -0,0 +1,175 @@
+#!/usr/bin/python
+
+import struct
+from StringIO import StringIO
+
+from datasource import DataBuffer
+from isobmff.box import Box
+from isobmff.samples import SampleIndex
+from benchmarks.mp4gen import box, fullbox, matrix
+
+# A track with several stts and stsc runs, chunks laid out out of order and
+# a gap between them
+TIMESCALE = 1000
+STTS = [(10, 1000), (20, 500), (3, 0), (20, 40)]
+STSC = [(1, 4), (3, 1), (6, 7)]
+CHUNK_ORDER = [2, 0, 1, 5, 3, 4, 10, 6, 7, 8, 9]
+SYNC = [1, 9, 30, 53]
+
+def sample_sizes(count):
+    return [100 + (i * 37) % 250 for i in range(count)]
+
+# Sample count of each chunk from the stsc runs
+def chunk_samples(chunk_count):
+    counts = []
+    for run, (first, per_chunk) in enumerate(STSC):
+        last = STSC[run + 1][0] if run + 1 < len(STSC) else chunk_count + 1
+        counts += [per_chunk] * (last - first)
+    return counts
+
+def build_track():
+    count = sum([n for n, delta in STTS])
+    sizes = sample_sizes(count)
+    per_chunk = chunk_samples(len(CHUNK_ORDER))
+    # Chunks are written in CHUNK_ORDER with 16 bytes between them
+    chunk_sizes = []
+    sample = 0
+    for n in per_chunk:
+        chunk_sizes.append(sum(sizes[sample:sample + n]))
+        sample += n
+    assert sample == count
+    offsets = [0] * len(CHUNK_ORDER)
+    offset = 1000
+    for chunk in CHUNK_ORDER:
+        offsets[chunk] = offset
+        offset += chunk_sizes[chunk] + 16
+
+    tkhd = fullbox('tkhd', 0, 7, struct.pack('>IIIII', 0, 0, 5, 0, 0) + '\0' * 16 +
+        matrix() + struct.pack('>II', 0, 0))
+    mdhd = fullbox('mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, TIMESCALE, 0, 0x15c7, 0))
+    stts = fullbox('stts', 0, 0, struct.pack('>I', len(STTS)) +
+        ''.join([struct.pack('>II', n, delta) for n, delta in STTS]))
+    stsc = fullbox('stsc', 0, 0, struct.pack('>I', len(STSC)) +
+        ''.join([struct.pack('>III', first, n, 1) for first, n in STSC]))
+    stsz = fullbox('stsz', 0, 0, struct.pack('>II', 0, count) +
+        struct.pack('>%dI' %(count), *sizes))
+    stco = fullbox('stco', 0, 0, struct.pack('>I', len(offsets)) +
+        struct.pack('>%dI' %(len(offsets)), *offsets))
+    stss = fullbox('stss', 0, 0, struct.pack('>I', len(SYNC)) +
+        struct.pack('>%dI' %(len(SYNC)), *SYNC))
+    stbl = box('stbl', stts + stsc + stsz + stco + stss)
+    data = box('trak', tkhd + box('mdia', mdhd + box('minf', stbl)))
+    trak = Box.getnextbox(DataBuffer(StringIO(data)))
+    return trak, sizes, offsets, per_chunk
+
+# A track of count samples of duration delta in one chunk, with the given
+# sync samples
+def build_simple_track(timescale, delta, count, sync):
+    tkhd = fullbox('tkhd', 0, 7, struct.pack('>IIIII', 0, 0, 1, 0, 0) + '\0' * 16 +
+        matrix() + struct.pack('>II', 0, 0))
+    mdhd = fullbox('mdhd', 0, 0, struct.pack('>IIIIHH', 0, 0, timescale, 0, 0x15c7, 0))
+    stts = fullbox('stts', 0, 0, struct.pack('>III', 1, count, delta))
+    stsc = fullbox('stsc', 0, 0, struct.pack('>IIII', 1, 1, count, 1))
+    stsz = fullbox('stsz', 0, 0, struct.pack('>II', 100, count))
+    stco = fullbox('stco', 0, 0, struct.pack('>II', 1, 1000))
+    stss = fullbox('stss', 0, 0, struct.pack('>I', len(sync)) +
+        struct.pack('>%dI' %(len(sync)), *sync))
+    stbl = box('stbl', stts + stsc + stsz + stco + stss)
+    data = box('trak', tkhd + box('mdia', mdhd + box('minf', stbl)))
+    return Box.getnextbox(DataBuffer(StringIO(data)))
+
+# (offset, size, decode time, sync) of every sample, one at a time
+def brute_force(sizes, chunk_offsets, per_chunk):
+    samples = []
+    for chunk, n in enumerate(per_chunk):
+        offset = chunk_offsets[chunk]
+        for i in range(n):
+            samples.append([offset, sizes[len(samples)]])
+            offset += sizes[len(samples) - 1]
+    time = 0
+    number = 0
+    for n, delta in STTS:
+        for i in range(n):
+            samples[number] += [time, number + 1 in SYNC]
+            time += delta
+            number += 1
+    return [tuple(sample) for sample in samples]
+
+
+class SampleIndexTest(object):
+    def __init__(self):
+        self.trak, sizes, offsets, per_chunk = build_track()
+        self.expected = brute_force(sizes, offsets, per_chunk)
+        self.index = SampleIndex(self.trak)
+
+    def run(self):
+        index = self.index
+        expected = self.expected
+        assert index.track_id == 5, "Expected track 5, got %s" %(index.track_id)
+        assert index.sample_count == len(expected), "Expected %d samples, got %d" %(
+            len(expected), index.sample_count)
+        for number in range(1, len(expected) + 1):
+            actual = index.sample(number)
+            assert actual == expected[number - 1], "Sample %d: expected %s, got %s" %(
+                number, expected[number - 1], actual)
+
+        # The last sample whose decode time is at or before the time
+        end = expected[-1][2] + 100
+        for time in range(-1, end):
+            value = None
+            for number, sample in enumerate(expected):
+                if sample[2] <= time:
+                    value = number + 1
+            actual = index.sample_at_time(time)
+            assert actual == value, "Time %d: expected %s, got %s" %(time, value, actual)
+
+        # Every byte of every sample, and the gaps between chunks
+        for number, (offset, size, time, sync) in enumerate(expected):
+            for position in (offset, offset + size - 1):
+                actual = index.sample_at_offset(position)
+                assert actual == number + 1, "Offset %d: expected %d, got %s" %(
+                    position, number + 1, actual)
+        for position in (0, 999):
+            actual = index.sample_at_offset(position)
+            assert actual is None, "Offset %d: expected None, got %s" %(position, actual)
+        last = max([offset + size for offset, size, time, sync in expected])
+        actual = index.sample_at_offset(last + 8)
+        assert actual is None, "Offset %d: expected None, got %s" %(last + 8, actual)
+
+        for number in range(1, len(expected) + 1):
+            before = max([n for n in SYNC if n <= number])
+            actual = index.sync_sample_before(number)
+            assert actual == before, "Sync before %d: expected %d, got %s" %(
+                number, before, actual)
+            after = min([n for n in SYNC if n >= number])
+            actual = index.sync_sample_after(number)
+            assert actual == after, "Sync after %d: expected %d, got %s" %(number, after, actual)
+
+        # Whole seconds up to past the end, in the timescale of 1000
+        for seconds in range(-1, expected[-1][2] // TIMESCALE + 2):
+            value = None
+            for number, sample in enumerate(expected):
+                if sample[3] and sample[2] <= seconds * TIMESCALE:
+                    value = (number + 1, sample[2], sample[0], sample[1])
+            actual = index.find_sync_sample(seconds)
+            assert actual == value, "Seek to %ds: expected %s, got %s" %(seconds, value, actual)
+
+    # Times in seconds that are not exact in binary still find the sync
+    # sample that starts at them
+    def runrounding(self):
+        # 29.97 fps, a sync sample every 30 frames: sample 31 is at 1.001s
+        index = SampleIndex(build_simple_track(30000, 1001, 100, [1, 31, 61, 91]))
+        for seconds, sample in ((1.001, 31), (1.0, 1), (2.002, 61), (3.003, 91)):
+            actual = index.find_sync_sample(seconds)[0]
+            assert actual == sample, "Seek to %ss: expected %d, got %s" %(seconds, sample, actual)
+        # 0.57 * 100 is 56.99...
+        index = SampleIndex(build_simple_track(100, 1, 100, [1, 58]))
+        actual = index.find_sync_sample(0.57)[0]
+        assert actual == 58, "Seek to 0.57s: expected 58, got %s" %(actual)
+
+
+if __name__ == '__main__':
+    test = SampleIndexTest()
+    test.run()
+    test.runrounding()
+    print "Success"
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+
+import os
+import sys
+import shutil
+import struct
+import threading
+import argparse
+import tempfile
+from StringIO import StringIO
+
+import showboxes
+from benchmarks import mp4gen
+
+# Runs function with stdout and stderr captured; returns its result and the
+# two outputs
+def capture(function, *args):
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = StringIO(), StringIO()
+    try:
+        result = function(*args)
+        return result, sys.stdout.getvalue(), sys.stderr.getvalue()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+# Runs function with stdin reading the file at path through a pipe
+def with_piped_stdin(path, function, *args):
+    with open(path, 'rb') as f:
+        data = f.read()
+    read_fd, write_fd = os.pipe()
+    def write():
+        # The reader may stop and close the pipe before the end
+        try:
+            with os.fdopen(write_fd, 'wb') as out:
+                out.write(data)
+        except IOError:
+            pass
+    writer = threading.Thread(target=write)
+    writer.start()
+    stdin = sys.stdin
+    sys.stdin = os.fdopen(read_fd, 'rb')
+    try:
+        return function(*args)
+    finally:
+        sys.stdin.close()
+        sys.stdin = stdin
+        writer.join()
+
+
+class SeekTest(object):
+    def __init__(self, path):
+        self.path = path
+
+    def run(self):
+        actual = showboxes.parse_seek('2:1.5')
+        assert actual == (2, 1.5), "Expected (2, 1.5), got %s" %(actual,)
+        for text in ('foo', '1', '1:x', 'a:1'):
+            try:
+                showboxes.parse_seek(text)
+            except argparse.ArgumentTypeError:
+                pass
+            else:
+                assert False, "Expected %s to be rejected" %(text)
+
+        status, out, err = capture(showboxes.seek_in_file, self.path, (1, 2.0))
+        assert status == 0, "Expected status 0, got %s" %(status)
+        assert out.startswith("track 1: sync sample 51, decode time 50000"), "Got %r" %(out)
+
+        status, out, err = capture(showboxes.seek_in_file, self.path, (3, 2.0))
+        assert status == 1, "Expected status 1, got %s" %(status)
+        assert "no track with id 3" in err, "Got %r" %(err)
+
+        # stdin cannot seek back to lazy boxes
+        status, out, err = with_piped_stdin(self.path, capture, showboxes.seek_in_file, '-',
+            (1, 2.0))
+        assert status == 0, "Expected status 0 from a pipe, got %s: %r" %(status, err)
+        assert out.startswith("track 1: sync sample 51, decode time 50000"), "Got %r" %(out)
+
+
+# A file written box by box, as a live recorder would
+class FollowTest(object):
+    def __init__(self, path):
+        self.path = path
+
+    def complete_boxes(self, offset=0):
+        with open(self.path, 'rb') as fd:
+            return list(showboxes.get_complete_boxes(fd, offset))
+
+    def append(self, data):
+        with open(self.path, 'ab') as f:
+            f.write(data)
+
+    def run(self):
+        ftyp = mp4gen.box('ftyp', 'isom' + '\0' * 4)
+        moov = mp4gen.box('moov', mp4gen.box('free', '\0' * 40))
+        mdat = struct.pack('>I4sQ', 1, 'mdat', 16 + 100) + '\1' * 100
+        open(self.path, 'wb').close()
+        assert self.complete_boxes() == [], "Expected no boxes in an empty file"
+
+        self.append(ftyp + moov[:20])
+        actual = self.complete_boxes()
+        assert actual == [(0, len(ftyp))], "Expected only ftyp, got %s" %(actual)
+
+        self.append(moov[20:] + mdat[:12])
+        expected = [(len(ftyp), len(moov))]
+        actual = self.complete_boxes(len(ftyp))
+        assert actual == expected, "Expected %s, got %s" %(expected, actual)
+
+        # The 64 bit size is not all there, then the payload is not
+        offset = len(ftyp) + len(moov)
+        self.append(mdat[12:40])
+        actual = self.complete_boxes(offset)
+        assert actual == [], "Expected a partial mdat to be left, got %s" %(actual)
+        self.append(mdat[40:])
+        actual = self.complete_boxes(offset)
+        assert actual == [(offset, len(mdat))], "Expected the mdat, got %s" %(actual)
+
+        # A box of size zero runs to the end of the file and is never complete
+        offset += len(mdat)
+        self.append(struct.pack('>I4s', 0, 'mdat') + '\1' * 100)
+        actual = self.complete_boxes(offset)
+        assert actual == [], "Expected a size zero box to be left, got %s" %(actual)
+
+
+# Combinations of options that a mode would ignore are usage errors
+class ArgumentsTest(object):
+    REJECTED = [
+        ['--select', 'moov', '--stream'],
+        ['--select', 'moov', '-o', 'json'],
+        ['--select', 'moov', '-o', 'ndjson'],
+        ['--follow', '-o', 'gui'],
+        ['--follow', '-o', 'json'],
+        ['--follow', '-o', 'ndjson'],
+        ['--follow', '--select', 'moov'],
+        ['--follow', '--stream'],
+        ['--select', 'moov', '--probe'],
+        ['--select', 'moov', '--seek', '1:1'],
+        ['--stats', '--stream'],
+        ['--stats', '-o', 'json'],
+        ['--stats', '-o', 'ndjson'],
+        ['--stats', '--probe'],
+        ['--stats', '--seek', '1:1'],
+        ['--stats', '--follow'],
+        ['--cache', 'dir', '--stream'],
+        ['--cache', 'dir', '-o', 'json'],
+        ['--cache', 'dir', '--probe'],
+        ['--cache', 'dir', '--follow'],
+    ]
+    ACCEPTED = [
+        ['--select', 'moov'],
+        ['--select', 'moov', '-o', 'gui'],
+        ['--stream', '-s'],
+        ['--follow', '-s', '-c', 'off'],
+        ['--stats', '--cache', 'dir', '--select', 'moov'],
+        ['--stats', '-o', 'gui'],
+        ['--probe', '-o', 'json'],
+    ]
+
+    def run(self):
+        for options in ArgumentsTest.REJECTED:
+            try:
+                capture(showboxes.parse_arguments, options + ['file.mp4'])
+            except SystemExit as e:
+                assert e.code == 2, "Expected status 2 for %s, got %s" %(options, e.code)
+            else:
+                assert False, "Expected %s to be rejected" %(options)
+        for options in ArgumentsTest.ACCEPTED:
+            args, out, err = capture(showboxes.parse_arguments, options + ['file.mp4'])
+            assert args.input_file == 'file.mp4', "Expected %s to be accepted" %(options)
+
+
+if __name__ == '__main__':
+    ArgumentsTest().run()
+    directory = tempfile.mkdtemp(prefix='mp4test')
+    try:
+        path = os.path.join(directory, 'movie.mp4')
+        mp4gen.write_movie(path, tracks=2, samples=100)
+        SeekTest(path).run()
+        FollowTest(os.path.join(directory, 'live.mp4')).run()
+    finally:
+        shutil.rmtree(directory)
+    print "Success"
@@ -0,0 +1,4 @@
+# Helpers shared by the tests
+
+def check(name, actual, value):
+    assert actual == value, "%s: expected %r, got %r" %(name, value, actual)
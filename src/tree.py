@@ -1,5 +1,7 @@
 
 class Attr(object):
+    __slots__ = ('name', 'value', 'display_value')
+
     def __init__(self, name, value, display_value=None):
         if type(name) is not str:
             raise Exception("name should be string")
@@ -7,28 +9,94 @@ class Attr(object):
         self.value = value
         self.display_value = display_value
 
+# Attribute value for a long array (sample tables, chunk offsets), kept as a
+# view of entries start to end of the parsed array instead of a string. It is
+# shown as a short summary, or written in pieces by pieces() when the whole
+# range is wanted, so a table with millions of entries is never turned into
+# one string. chunks() splits it into sub-views for paging.
+class ArrayView(object):
+    __slots__ = ('values', 'start', 'end', 'truncate')
+    SUMMARY_ITEMS = 3
+    PIECE_SIZE = 1000
+
+    def __init__(self, values, start=0, end=None, truncate=True):
+        self.values = values
+        self.start = max(0, min(start, len(values)))
+        self.end = len(values) if end is None else max(self.start, min(end, len(values)))
+        self.truncate = truncate
+
+    def __len__(self):
+        return self.end - self.start
+
+    def is_range(self):
+        return self.start > 0 or self.end < len(self.values)
+
+    def summary(self):
+        count = ArrayView.SUMMARY_ITEMS
+        if len(self) <= 2 * count:
+            return self.text(self.start, self.end, ',')
+        return "[%s ... %s]" %(
+            ','.join([str(i) for i in self.values[self.start:self.start + count]]),
+            ','.join([str(i) for i in self.values[self.end - count:self.end]]))
+
+    def text(self, start, end, separator=', '):
+        return "[%s]" %(separator.join([str(i) for i in self.values[start:end]]))
+
+    def pieces(self):
+        if self.is_range():
+            yield "(entries %d-%d of %d) " %(self.start, self.end - 1, len(self.values))
+        elif self.truncate:
+            yield self.summary()
+            return
+        yield '['
+        for start in xrange(self.start, self.end, ArrayView.PIECE_SIZE):
+            end = min(start + ArrayView.PIECE_SIZE, self.end)
+            yield (', ' if start > self.start else '') + ', '.join(
+                [str(i) for i in self.values[start:end]])
+        yield ']'
+
+    def __str__(self):
+        return ''.join(self.pieces())
+
+    # Sub-views of at most size entries each
+    def chunks(self, size):
+        for start in xrange(self.start, self.end, size):
+            yield ArrayView(self.values, start, min(start + size, self.end), self.truncate)
+
+
+# Nodes without attributes or children share an empty tuple until the first
+# one is added
 class Tree(object):
+    __slots__ = ('name', 'desc', 'attrs', 'children')
+
     def __init__(self, name, desc):
         self.name = name
         self.desc = desc
-        self.attrs = []
-        self.children = []
+        self.attrs = ()
+        self.children = ()
 
     # First arg can be Attr or the name. If it is name, give value and optional converted value
     def add_attr(self, *args):
         if len(args) == 0:
             raise Exception("Add what?")
         if len(args) == 1 and type(args[0]) is Attr:
-            self.attrs.append(args[0])
+            attr = args[0]
         elif len(args) == 1:
             raise Exception("Sole argument should be an Attr, received %s" %type(args[0]))
         else:
-            self.attrs.append(Attr(args[0], args[1], args[2] if len(args) > 2 else None))
+            attr = Attr(args[0], args[1], args[2] if len(args) > 2 else None)
+        if self.attrs:
+            self.attrs.append(attr)
+        else:
+            self.attrs = [attr]
 
     def add_child(self, child):
         if type(child) is not Tree:
             child = Tree(child)
-        self.children.append(child)
+        if self.children:
+            self.children.append(child)
+        else:
+            self.children = [child]
         return child
 
     def __str__(self):